@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+"""Measures the time and memory the DAG builder takes to build every DAG.
+
+This writes synthetic rendered configs, then builds a DAG from each with
+``generate_dag()`` (as the DAG factory's ``run()`` does), keeping every DAG
+alive as the DagBag would. tracemalloc reports how much memory the DAGs hold
+on to, and the peak while building them.
+
+Pass ``--compare REF`` to measure the DAG builder as of a git ref as well, so
+you can see the difference a change makes. Each builder is measured in a
+fresh interpreter, so neither benefits from the other's imports or caches.
+
+Airflow and anything else missing is stubbed (see ``stubs.py``), so this runs
+offline. Point ``--pythonpath`` at wherever the real dependencies are
+installed to measure against those instead.
+
+Usage:
+    python benchmarks/bench_builder_memory.py [--dags 1000] [--compare HEAD~1]
+        [--pythonpath DIR] [--json out.json]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+import stubs
+from synthetic import write_rendered_configs
+
+ROOT = Path(__file__).parent.parent
+FACTORY = ROOT / "factory"
+BUILDER = Path("factory") / "dag_builder.py"
+
+
+def _build_all(builder_path: Path, config_dir: Path) -> Dict:
+    """Builds every DAG with the given builder, measuring it as we go."""
+    stubs.install(FACTORY)
+    # the builder imports its siblings from factory.utils, so it has to be
+    # loaded under that name too:
+    spec = importlib.util.spec_from_file_location(
+        "factory.utils.dag_builder", builder_path
+    )
+    dag_builder = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = dag_builder
+    spec.loader.exec_module(dag_builder)
+
+    files = sorted(config_dir.glob("**/*.yaml"))
+    dags = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for file in files:
+        dags.append(dag_builder.generate_dag(file, None))
+    seconds = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "dags": len(dags),
+        "seconds": seconds,
+        "retained_bytes": retained,
+        "peak_bytes": peak,
+        "retained_bytes_per_dag": retained / len(dags),
+    }
+
+
+def _measure(builder_path: Path, config_dir: Path, pythonpath: List[Path]) -> Dict:
+    """Runs ``_build_all()`` in a fresh interpreter."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(path) for path in pythonpath] + [env.get("PYTHONPATH", "")]
+    )
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", str(builder_path), str(config_dir)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(
+            f"building DAGs with {builder_path} failed:\n{result.stderr}"
+        )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dags", type=int, default=1000)
+    parser.add_argument("--compare", metavar="REF", help="also measure this git ref")
+    parser.add_argument(
+        "--pythonpath",
+        type=Path,
+        action="append",
+        default=[],
+        help="also import from here (e.g. where Airflow is installed)",
+    )
+    parser.add_argument("--json", type=Path, help="write results to this file")
+    parser.add_argument("--child", nargs=2, type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_build_all(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = Path(tmp) / "rendered_configs"
+        write_rendered_configs(config_dir, args.dags)
+
+        builders = {"working tree": ROOT / BUILDER}
+        if args.compare:
+            builders[args.compare] = Path(tmp) / "dag_builder.py"
+            builders[args.compare].write_bytes(
+                subprocess.run(
+                    ["git", "show", f"{args.compare}:{BUILDER.as_posix()}"],
+                    cwd=ROOT,
+                    capture_output=True,
+                    check=True,
+                ).stdout
+            )
+
+        results = {}
+        print(
+            f"{'builder':>14}  {'seconds':>8}  {'retained (MiB)':>14}"
+            f"  {'peak (MiB)':>10}  {'per DAG (KiB)':>13}"
+        )
+        for name, builder_path in builders.items():
+            result = results[name] = _measure(builder_path, config_dir, args.pythonpath)
+            print(
+                f"{name:>14}  {result['seconds']:>8.2f}"
+                f"  {result['retained_bytes'] / 2**20:>14.1f}"
+                f"  {result['peak_bytes'] / 2**20:>10.1f}"
+                f"  {result['retained_bytes_per_dag'] / 2**10:>13.1f}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
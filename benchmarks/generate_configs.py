@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+"""Generates a synthetic ``dag_configs/`` tree for benchmarking.
+
+The generated configs use the real task templates, in whatever mix you ask
+for, and can include multi-DAG files (``_for_each`` fan-out) and workflows
+(``value_set`` x ``task_set``), so the renderer and DAG builder can be
+exercised at realistic (or unrealistic) sizes.
+
+Usage:
+    python benchmarks/generate_configs.py TARGET [--dags 100] [--tasks 20]
+        [--multi-dags 5 --for-each 10] [--value-set 5 --task-set 4]
+        [--mix trigger_dbt=5,gcs_to_bq=3,GKEStartPod=2] [--seed 0]
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+DEFAULT_MIX = {"trigger_dbt": 5, "gcs_to_bq": 3, "GKEStartPod": 2}
+"""Relative weights of each task template in generated DAGs."""
+
+
+class ConfigSpec(NamedTuple):
+    """What to generate."""
+
+    dags: int = 100
+    """Single-DAG config files."""
+    tasks: int = 20
+    """Tasks per DAG, not counting any generated by workflows."""
+    multi_dags: int = 0
+    """Multi-DAG config files, each fanning out to ``for_each`` DAGs."""
+    for_each: int = 0
+    value_set: int = 0
+    """If set, each single DAG also gets a workflow of this many values..."""
+    task_set: int = 0
+    """...by this many tasks."""
+    mix: Dict[str, int] = DEFAULT_MIX
+    seed: int = 0
+
+
+def _task(task_type: str, task_id: str, n: int) -> Dict:
+    task = {"id": task_id, "type": task_type}
+    if task_type == "trigger_dbt":
+        task["settings"] = {
+            "command": "run",
+            "project_dir": f"project_{n % 5}",
+            "select": f"tag:model_{n}",
+        }
+    elif task_type == "GKEStartPod":
+        task["image"] = "europe-west2-docker.pkg.dev/benchmarks/jobs/task:latest"
+        task["cmds"] = ["python", "main.py"]
+        task["arguments"] = ["--task", task_id]
+        task["env_vars"] = {"TASK_NUMBER": str(n)}
+    else:
+        # the settings-driven GKE templates, e.g. gcs_to_bq:
+        task["settings"] = {
+            "SOURCE": f"gs://benchmarks/{task_id}/*.csv",
+            "DESTINATION": f"benchmarks.table_{n}",
+        }
+    return task
+
+
+def _tasks(spec: ConfigSpec, rng: random.Random, prefix: str = "") -> List[Dict]:
+    types, weights = zip(*spec.mix.items())
+    tasks = []
+    for n in range(spec.tasks):
+        task = _task(rng.choices(types, weights)[0], f"{prefix}task_{n}", n)
+        if n:
+            # mostly chains, with some fan-in from further back:
+            upstream = {n - 1, rng.randrange(n)}
+            task["dependencies"] = [
+                {"id": f"{prefix}task_{i}"} for i in sorted(upstream)
+            ]
+        tasks.append(task)
+    return tasks
+
+
+def _workflow(spec: ConfigSpec, rng: random.Random) -> Dict:
+    types, weights = zip(*spec.mix.items())
+    return {
+        "workflow_description": "synthetic workflow",
+        "value_set": [
+            {"name": f"source_{n}", "table": f"table_{n}", "batch": n}
+            for n in range(spec.value_set)
+        ],
+        "task_set": [
+            {
+                **_task(
+                    rng.choices(types, weights)[0], f"${{value_set.name}}_step_{n}", n
+                ),
+                **(
+                    {"dependencies": [{"id": f"${{value_set.name}}_step_{n - 1}"}]}
+                    if n
+                    else {}
+                ),
+            }
+            for n in range(spec.task_set)
+        ],
+    }
+
+
+def generate(target: Path, spec: ConfigSpec) -> Dict[str, int]:
+    """Writes a synthetic dag_configs tree into ``target``.
+
+    Returns:
+        Counts of the config files, DAGs and tasks generated.
+    """
+    rng = random.Random(spec.seed)
+    stats = {"files": 0, "dags": 0, "tasks": 0}
+
+    for n in range(spec.dags):
+        config = {
+            "dag_id": f"synthetic_{n}",
+            "description": f"Synthetic DAG {n}",
+            "schedule": "0 6 * * *",
+            "tags": ["benchmarks"],
+            "tasks": _tasks(spec, rng),
+        }
+        if spec.value_set and spec.task_set:
+            config["tasks"].append(_workflow(spec, rng))
+        path = target / f"domain_{n % 10}" / f"synthetic_{n}.yaml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # JSON is valid YAML, and much quicker to write:
+        path.write_text(json.dumps(config, indent=2))
+        stats["files"] += 1
+        stats["dags"] += 1
+        stats["tasks"] += spec.tasks + spec.value_set * spec.task_set
+
+    for n in range(spec.multi_dags if spec.for_each else 0):
+        template = {
+            "dag_id": f"fanout_{n}_${{each.id}}",
+            "description": "Fan out for ${each.name}",
+            "schedule": "${each.schedule}",
+            "tags": ["benchmarks"],
+            "tasks": _tasks(spec, rng, prefix="${each.id}_"),
+        }
+        iterables = {
+            "_for_each": [
+                {"id": f"i{i}", "name": f"Instance {i}", "schedule": "0 7 * * *"}
+                for i in range(spec.for_each)
+            ]
+        }
+        path = target / "fanout" / f"fanout_{n}.yaml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(template, indent=2)
+            + "\n#!multi\n"
+            + json.dumps(iterables, indent=2)
+        )
+        stats["files"] += 1
+        stats["dags"] += spec.for_each
+        stats["tasks"] += spec.for_each * spec.tasks
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", type=Path)
+    for field, default in ConfigSpec._field_defaults.items():
+        if field == "mix":
+            parser.add_argument(
+                "--mix",
+                default=",".join(f"{k}={v}" for k, v in default.items()),
+                help="task template weights, e.g. trigger_dbt=5,gcs_to_bq=3",
+            )
+        else:
+            parser.add_argument(
+                f"--{field.replace('_', '-')}", type=int, default=default
+            )
+    args = vars(parser.parse_args())
+    target = args.pop("target")
+    args["mix"] = {
+        name: int(weight)
+        for name, weight in (item.split("=") for item in args["mix"].split(","))
+    }
+    print(json.dumps(generate(target, ConfigSpec(**args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+#! /usr/bin/env python
+"""Times and measures the memory of each stage of rendering and building DAGs.
+
+This generates a synthetic ``dag_configs/`` tree (see ``generate_configs.py``)
+in a temporary workspace laid out like a deployment, then for each stage:
+
+- ``render``: a full ``render_configs.main()``, with a cold template cache
+- ``render_single_dag``: rendering and writing every single-DAG config
+- ``render_multi_dag``: rendering and writing every multi-DAG config
+- ``replace_values``: substituting placeholders into every multi-DAG template,
+  once per instance
+- ``generate_dag``: building a DAG from every rendered config
+- ``run``: a full parse of the DAG factory, building every DAG
+- ``run_worker``: a parse of the DAG factory on a worker, building one DAG
+- ``run_shard``: a parse of one of ``--shards`` DAG factory shards (see
+  ``dag_shards.py``), which Airflow can parse in parallel
+- ``lookup_glob`` and ``lookup_index``: finding and loading one DAG's config
+  on a worker, by walking the rendered configs and from the DAG index
+- ``date_macros``: ``DATE_MACRO_CALLS`` calls of the date macros DAGs use in
+  their templates, with each input they take (and some they reject)
+- ``import_dag_builder``: importing the DAG builder and its sibling modules,
+  once Airflow (or its stubs) has been imported
+
+it reports the median time of ``--repeats`` runs, and the peak and retained
+memory of a separate run under tracemalloc (which would skew the timings).
+
+Airflow, our environment config and anything else missing is stubbed (see
+``stubs.py``), so this runs offline. Write results out with ``--json``, and
+pass an earlier run's results to ``--compare`` to see how they've changed.
+
+A full parse (``run``) is also held to a memory budget: if it retains more
+per DAG than ``RETAINED_BUDGET_PER_DAG`` plus ``RETAINED_BUDGET_PER_TASK``
+for each of its tasks (on average), or than ``--max-retained-per-dag`` if
+that's given, this exits with 1, e.g. to catch configs being kept around
+once their DAGs are built. ``--max-retained-per-dag 0`` turns this off.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--dags 100] [--tasks 20]
+        [--multi-dags 5 --for-each 10] [--value-set 5 --task-set 4]
+        [--mix trigger_dbt=5,gcs_to_bq=3] [--shards 4] [--repeats 5]
+        [--json out.json] [--compare baseline.json]
+        [--max-retained-per-dag BYTES]
+"""
+
+import argparse
+import contextlib
+import copy
+import gc
+import importlib.util
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple
+
+import stubs
+from generate_configs import ConfigSpec, generate
+
+ROOT = Path(__file__).parent.parent
+FACTORY = ROOT / "factory"
+
+ROOT_TEMPLATES = {"base.j2", "macros.j2", "shared.j2"}
+OPERATOR_TEMPLATES = {"_base.j2", "Bash.j2", "GKEStartPod.j2"}
+"""Templates are deployed with operator templates under ``airflow-operators/``,
+task templates under ``tasks/`` and everything else at the top level."""
+
+DATE_MACRO_CALLS = 1000
+"""How many times the ``date_macros`` stage calls each date macro case."""
+
+FORMAT_INPUT_DATE_CASES = [
+    "2024-03-01T06:30:00.123456+00:00",
+    "2024-03-01T06:30:00+00:00",
+    "2024-03-01T06:30:00.123456",
+    "2024-03-01T06:30:00",
+    "2024-03-01T06:30:00+05:30",
+    20240301,
+    datetime(2024, 3, 1, 6, 30, tzinfo=timezone.utc),
+    "",
+    # these match its patterns but can't be parsed, so it raises for them:
+    "2024-03-01T06:30:00Z",
+    "2024-03-01 06:30:00",
+    "yesterday",
+]
+DS_TIMEDELTA_FORMATTED_CASES = [
+    ("2024-03-01",),
+    ("2024-03-01", -7),
+    ("2024-03-01", 1, "%Y%m%d", "America/New_York"),
+]
+
+RETAINED_BUDGET_PER_DAG = 8 * 1024
+RETAINED_BUDGET_PER_TASK = 1536
+"""The default memory budget of a full parse: about 30% more than it retained
+(with the stubs) when these were set, for DAGs of 1 to 40 tasks."""
+
+
+class Stage(NamedTuple):
+    """Something to measure.
+
+    ``setup`` prepares fresh inputs for each run (untimed), and ``run`` takes
+    them and does the work. Whatever ``run`` returns is kept alive until it's
+    been measured, as it would be in real use.
+    """
+
+    setup: Callable[[], Any]
+    run: Callable[[Any], Any]
+
+
+def _stage_templates(target: Path):
+    for template in (ROOT / "templates").glob("*.j2"):
+        if template.name in ROOT_TEMPLATES:
+            folders = [target]
+        elif template.name in OPERATOR_TEMPLATES:
+            folders = [target / "airflow-operators", target / "tasks"]
+        else:
+            folders = [target / "tasks"]
+        for folder in folders:
+            folder.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(template, folder / template.name)
+
+
+def _load_module(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _stages(workspace: Path, shards: int) -> Dict[str, Stage]:
+    import yaml
+
+    import render_configs
+    from config_tree import ConfigTree
+    from dag_index import find_dag
+    from dag_shards import Shard, shard_module
+    from multi_dag import replace_values
+    from renderer import RenderContext, render_multi_dag, render_single_dag
+    from factory.utils import dag_builder, dag_builder_utils
+
+    # the renderer reads templates relative to the working directory, and
+    # everything else relative to its ROOT:
+    render_configs.ROOT = workspace
+    render_configs.RENDERED_CONFIGS = workspace / "factory" / "rendered_configs"
+    render_configs.MANIFEST_PATH = render_configs.RENDERED_CONFIGS / ".manifest.json"
+    os.chdir(workspace / "work")
+    context = RenderContext(
+        ConfigTree(workspace / "dag_configs", render_configs.RENDERED_CONFIGS)
+    )
+
+    sources = sorted((workspace / "dag_configs").glob("**/*.yaml"))
+    texts = {path: path.read_text() for path in sources}
+    single = {
+        path: yaml.full_load(text)
+        for path, text in texts.items()
+        if "#!multi" not in text
+    }
+    multi = {path: text for path, text in texts.items() if "#!multi" in text}
+
+    def _render_single(configs):
+        outputs = []
+        for path, values in configs.items():
+            render_single_dag(values, path, context, False, outputs)
+        return outputs
+
+    def _render_multi(_):
+        outputs = []
+        for path, text in multi.items():
+            render_multi_dag(path, context, False, outputs, text)
+        return outputs
+
+    def _replace_values(_):
+        return [
+            replace_values(source, values, "each")
+            for source, instances in templates
+            for values in instances
+        ]
+
+    templates = [
+        (
+            text.split("#!multi")[0],
+            yaml.full_load(text.split("#!multi")[1])["_for_each"],
+        )
+        for text in multi.values()
+    ]
+
+    # render everything once, so there's something to build:
+    render_configs.main(["--no-bytecode-cache"])
+    rendered = sorted(render_configs.RENDERED_CONFIGS.glob("**/*.yaml"))
+    if not rendered:
+        raise RuntimeError("nothing rendered; check the output above")
+    rendered_configs = {path: yaml.safe_load(path.read_text()) for path in rendered}
+
+    def _generate_dags(configs):
+        return [
+            dag_builder.generate_dag(path, None, config)
+            for path, config in configs.items()
+        ]
+
+    # the DAG factory finds rendered configs next to itself:
+    dag_factory = workspace / "factory" / "dag_factory.py"
+    shutil.copyfile(FACTORY / "dag_factory.py", dag_factory)
+    worker_dag_id = rendered[len(rendered) // 2].stem
+
+    def _parse(dag_id, dag_file=dag_factory):
+        if dag_id:
+            os.environ["_AIRFLOW_PARSING_CONTEXT_DAG_ID"] = dag_id
+        try:
+            # like the DagBag, execute the DAG file from scratch each time:
+            return _load_module("benchmark_dag_factory", dag_file)
+        finally:
+            os.environ.pop("_AIRFLOW_PARSING_CONTEXT_DAG_ID", None)
+
+    # shards go in a directory of their own, as the DAG factory leaves
+    # building DAGs to any shards alongside it:
+    sharded = workspace / "sharded"
+    sharded.mkdir()
+    (sharded / "rendered_configs").symlink_to(render_configs.RENDERED_CONFIGS)
+    shard_file, source = shard_module(sharded, Shard(0, shards))
+    shard_file.write_text(source)
+
+    def _lookup_by_glob(dag_id):
+        for path in render_configs.RENDERED_CONFIGS.glob("**/*.yaml"):
+            if path.stem == dag_id:
+                return yaml.safe_load(path.read_bytes())
+
+    def _lookup_by_index(dag_id):
+        return find_dag(render_configs.RENDERED_CONFIGS, dag_id)[1]
+
+    if _lookup_by_glob(worker_dag_id) != _lookup_by_index(worker_dag_id):
+        raise RuntimeError(f"the DAG index has the wrong config for {worker_dag_id}")
+
+    date_macro_cases = [
+        (dag_builder_utils.format_input_date, (value,))
+        for value in FORMAT_INPUT_DATE_CASES
+    ] + [
+        (dag_builder_utils.ds_timedelta_formatted, args)
+        for args in DS_TIMEDELTA_FORMATTED_CASES
+    ]
+
+    def _call_date_macros(_):
+        for _ in range(DATE_MACRO_CALLS):
+            for fn, args in date_macro_cases:
+                try:
+                    fn(*args)
+                except Exception:
+                    pass
+
+    def _forget_dag_builder():
+        # the DAG builder is imported from factory.utils, so forget that (and
+        # not the renderer's modules, or the Airflow stubs):
+        for name in [name for name in sys.modules if name.startswith("factory.utils.")]:
+            del sys.modules[name]
+
+    return {
+        "render": Stage(lambda: ["--no-bytecode-cache"], render_configs.main),
+        "render_single_dag": Stage(lambda: copy.deepcopy(single), _render_single),
+        "render_multi_dag": Stage(lambda: None, _render_multi),
+        "replace_values": Stage(lambda: None, _replace_values),
+        "generate_dag": Stage(lambda: copy.deepcopy(rendered_configs), _generate_dags),
+        "run": Stage(lambda: None, _parse),
+        "run_worker": Stage(lambda: worker_dag_id, _parse),
+        "run_shard": Stage(lambda: None, lambda _: _parse(None, shard_file)),
+        "lookup_glob": Stage(lambda: worker_dag_id, _lookup_by_glob),
+        "lookup_index": Stage(lambda: worker_dag_id, _lookup_by_index),
+        "date_macros": Stage(lambda: None, _call_date_macros),
+        "import_dag_builder": Stage(
+            _forget_dag_builder,
+            lambda _: importlib.import_module("factory.utils.dag_builder"),
+        ),
+    }
+
+
+def _measure(stage: Stage, repeats: int) -> Dict[str, float]:
+    seconds = []
+    for _ in range(repeats):
+        inputs = stage.setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = stage.run(inputs)
+        seconds.append(time.perf_counter() - start)
+        del result
+
+    inputs = stage.setup()
+    gc.collect()
+    tracemalloc.start()
+    result = stage.run(inputs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+    }
+
+
+def _compare(results: Dict, baseline: Dict) -> List[str]:
+    lines = [f"{'stage':<20}  {'time':>8}  {'peak':>8}  {'retained':>8}"]
+    for name, result in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        ratios = [
+            (
+                result[metric] / baseline["stages"][name][metric]
+                if baseline["stages"][name][metric]
+                else float("nan")
+            )
+            for metric in ("median_seconds", "peak_bytes", "retained_bytes")
+        ]
+        lines.append(f"{name:<20}" + "".join(f"  {ratio:>7.2f}x" for ratio in ratios))
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    defaults = ConfigSpec._field_defaults
+    for field, default in defaults.items():
+        if field != "mix":
+            parser.add_argument(
+                f"--{field.replace('_', '-')}", type=int, default=default
+            )
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{k}={v}" for k, v in defaults["mix"].items()),
+        help="task template weights, e.g. trigger_dbt=5,gcs_to_bq=3",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=4, help="how many shards run_shard is one of"
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--stage", action="append", help="only measure this stage (repeatable)"
+    )
+    parser.add_argument("--json", type=Path, help="write results to this file")
+    parser.add_argument(
+        "--compare", type=Path, metavar="JSON", help="compare with earlier results"
+    )
+    parser.add_argument(
+        "--max-retained-per-dag",
+        type=int,
+        metavar="BYTES",
+        help="fail if a full parse retains more than this per DAG "
+        "(default: a budget for the DAGs' size; 0 to not check)",
+    )
+    args = parser.parse_args()
+
+    spec = ConfigSpec(
+        mix={
+            name: int(weight)
+            for name, weight in (item.split("=") for item in args.mix.split(","))
+        },
+        **{
+            field: getattr(args, field)
+            for field in ConfigSpec._fields
+            if field != "mix"
+        },
+    )
+
+    stubs.install(FACTORY)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp)
+        stats = generate(workspace / "dag_configs", spec)
+        _stage_templates(workspace / "work" / "templates")
+        (workspace / "factory" / "rendered_configs").mkdir(parents=True)
+
+        results = {
+            "spec": spec._asdict(),
+            "generated": stats,
+            "shards": args.shards,
+            "stubbed": stubs.STUBBED,
+            "python": sys.version.split()[0],
+            "stages": {},
+        }
+        print(f"Generated {stats['dags']} DAGs with {stats['tasks']} tasks")
+        print(
+            f"{'stage':<20}  {'median (s)':>10}  {'peak (MiB)':>10}  {'retained (MiB)':>14}"
+        )
+        try:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                stages = _stages(workspace, args.shards)
+            for name, stage in stages.items():
+                if args.stage and name not in args.stage:
+                    continue
+                with contextlib.redirect_stdout(output):
+                    result = results["stages"][name] = _measure(stage, args.repeats)
+                print(
+                    f"{name:<20}  {result['median_seconds']:>10.4f}"
+                    f"  {result['peak_bytes'] / 2**20:>10.1f}"
+                    f"  {result['retained_bytes'] / 2**20:>14.1f}"
+                )
+        finally:
+            os.chdir(cwd)
+
+    if args.compare:
+        print(f"\nRelative to {args.compare}:")
+        print("\n".join(_compare(results, json.loads(args.compare.read_text()))))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    budget = args.max_retained_per_dag
+    if budget is None:
+        budget = round(
+            RETAINED_BUDGET_PER_DAG
+            + RETAINED_BUDGET_PER_TASK * stats["tasks"] / stats["dags"]
+        )
+    if budget and "run" in results["stages"]:
+        per_dag = results["stages"]["run"]["retained_bytes"] / stats["dags"]
+        print(
+            f"\nA full parse retains {per_dag:,.0f} bytes per DAG "
+            f"(budget: {budget:,})"
+        )
+        if per_dag > budget:
+            print("That's over budget", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""Lightweight stand-ins for the DAG factory's runtime dependencies.
+
+The DAG factory needs Airflow, the Kubernetes client and our environment
+config, and the renderer needs the GitHub Actions toolkit and our custom YAML
+constructors. None of those are needed to benchmark our own code, so this
+installs minimal versions of whichever can't be imported, letting the
+benchmarks run offline. The real thing is always used if it's installed.
+
+The stubs do roughly the bookkeeping Airflow does when building a DAG (i.e.
+registering tasks and edges), but nothing more, so timings of the DAG builder
+against them are a lower bound.
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+import types
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+STUBBED: List[str] = []
+"""The top-level modules that have been stubbed."""
+
+
+class _Dependency:
+    """Shared ``>>`` and ``set_downstream()`` handling for tasks and groups."""
+
+    def set_downstream(self, other):
+        for node in other if isinstance(other, (list, tuple)) else [other]:
+            self.downstream.append(node)
+            node.upstream.append(self)
+
+    def __rshift__(self, other):
+        if isinstance(other, Label):
+            other.upstream_nodes.append(self)
+        else:
+            self.set_downstream(other)
+        return other
+
+
+class DAG:
+    current: Optional["DAG"] = None
+
+    def __init__(
+        self,
+        dag_id: str,
+        description: Optional[str] = None,
+        schedule=None,
+        start_date=None,
+        end_date=None,
+        template_searchpath=None,
+        user_defined_macros=None,
+        user_defined_filters=None,
+        default_args=None,
+        concurrency=None,
+        max_active_tasks=None,
+        max_active_runs=None,
+        dagrun_timeout=None,
+        default_view=None,
+        orientation=None,
+        catchup=None,
+        on_success_callback=None,
+        on_failure_callback=None,
+        doc_md=None,
+        params=None,
+        tags=None,
+        render_template_as_native_obj=False,
+    ):
+        self.dag_id = dag_id
+        self.description = description
+        self.schedule = schedule
+        self.start_date = start_date
+        self.default_args = default_args or {}
+        self.user_defined_macros = user_defined_macros
+        self.user_defined_filters = user_defined_filters
+        self.params = dict(params or {})
+        self.tags = tags
+        self.doc_md = doc_md
+        self.tasks: Dict[str, "BaseOperator"] = {}
+
+    def __enter__(self):
+        DAG.current = self
+        return self
+
+    def __exit__(self, *args):
+        DAG.current = None
+
+
+class BaseOperator(_Dependency):
+    def __init__(self, task_id, dag=None, task_group=None, params=None, **kwargs):
+        self.dag = dag or DAG.current
+        self.task_id = f"{task_group.group_id}.{task_id}" if task_group else task_id
+        self.params = params
+        self.kwargs = kwargs
+        self.upstream: List = []
+        self.downstream: List = []
+        if task_group:
+            task_group.children.append(self)
+        self.dag.tasks[self.task_id] = self
+
+
+class TaskGroup(_Dependency):
+    def __init__(self, group_id: str):
+        self.group_id = group_id
+        self.children: List[BaseOperator] = []
+        self.upstream: List = []
+        self.downstream: List = []
+
+
+class Label:
+    def __init__(self, label: str):
+        self.label = label
+        self.upstream_nodes: List = []
+
+    def __rshift__(self, other):
+        for node in self.upstream_nodes:
+            node.set_downstream(other)
+        return other
+
+
+class Param:
+    def __init__(self, default=None, type=None, description=None):
+        self.value = default
+        self.schema = {"type": type, "description": description}
+
+
+class Dataset(NamedTuple):
+    uri: str
+
+
+class TriggerRule:
+    ALL_SUCCESS = "all_success"
+    ALL_FAILED = "all_failed"
+    ALL_DONE = "all_done"
+    ONE_SUCCESS = "one_success"
+    ONE_FAILED = "one_failed"
+    NONE_FAILED = "none_failed"
+    NONE_SKIPPED = "none_skipped"
+    ALWAYS = "always"
+
+
+class _ParsingContext(NamedTuple):
+    dag_id: Optional[str]
+    task_id: Optional[str]
+
+
+def get_parsing_context() -> _ParsingContext:
+    # like Airflow, this comes from the environment:
+    return _ParsingContext(
+        os.environ.get("_AIRFLOW_PARSING_CONTEXT_DAG_ID"),
+        os.environ.get("_AIRFLOW_PARSING_CONTEXT_TASK_ID"),
+    )
+
+
+class BashOperator(BaseOperator):
+    pass
+
+
+class GKEStartPodOperator(BaseOperator):
+    pass
+
+
+class KubernetesPodOperator(BaseOperator):
+    pass
+
+
+class V1ResourceRequirements:
+    def __init__(self, limits=None, requests=None):
+        self.limits = limits
+        self.requests = requests
+
+
+class _EnvConfig:
+    environment = "dev"
+    project_id = "benchmarks-dev"
+    region = "europe-west2"
+    cluster_name = "benchmarks"
+    cluster_namespace = "default"
+    cluster_workload_sa = "benchmarks"
+
+
+class _Core:
+    @staticmethod
+    def set_failed(message: str):
+        print(f"::error::{message}", file=sys.stderr)
+
+
+_MODULES = {
+    "airflow": {"DAG": DAG, "Dataset": Dataset},
+    "airflow.models": {"BaseOperator": BaseOperator},
+    "airflow.models.param": {"Param": Param},
+    "airflow.operators": {},
+    "airflow.operators.bash_operator": {"BashOperator": BashOperator},
+    "airflow.providers": {},
+    "airflow.providers.cncf": {},
+    "airflow.providers.cncf.kubernetes": {},
+    "airflow.providers.cncf.kubernetes.operators": {},
+    "airflow.providers.cncf.kubernetes.operators.kubernetes_pod": {
+        "KubernetesPodOperator": KubernetesPodOperator
+    },
+    "airflow.providers.google": {},
+    "airflow.providers.google.cloud": {},
+    "airflow.providers.google.cloud.operators": {},
+    "airflow.providers.google.cloud.operators.kubernetes_engine": {
+        "GKEStartPodOperator": GKEStartPodOperator
+    },
+    "airflow.utils": {},
+    "airflow.utils.dag_parsing_context": {"get_parsing_context": get_parsing_context},
+    "airflow.utils.edgemodifier": {"Label": Label},
+    "airflow.utils.task_group": {"TaskGroup": TaskGroup},
+    "airflow.utils.trigger_rule": {"TriggerRule": TriggerRule},
+    "kubernetes": {},
+    "kubernetes.client": {},
+    "kubernetes.client.models": {"V1ResourceRequirements": V1ResourceRequirements},
+    "modules": {},
+    "modules.helpers": {},
+    "modules.helpers.env_config_helper": {"env_config": _EnvConfig()},
+    "modules.utils": {},
+    "modules.utils.jinja_utils": {
+        "USER_DEFINED_FILTERS": {},
+        "USER_DEFINED_MACROS": {},
+    },
+    "actions_toolkit": {"core": _Core()},
+    "constructors": {"CUSTOM_CONSTRUCTORS": {}},
+}
+
+
+def install(factory_dir: Path):
+    """Installs stubs for anything missing, and makes ``factory.utils`` importable.
+
+    The DAG factory is deployed with its modules under ``factory.utils``, so
+    that's pointed at ``factory_dir``. Its modules are also importable by
+    their bare names, as the renderer expects.
+    """
+    if str(factory_dir) not in sys.path:
+        sys.path.insert(0, str(factory_dir))
+
+    for name in ("factory", "factory.utils"):
+        if name not in sys.modules:
+            package = types.ModuleType(name)
+            package.__path__ = [str(factory_dir)]
+            sys.modules[name] = package
+    sys.modules["factory"].utils = sys.modules["factory.utils"]
+
+    for top_level in {name.split(".")[0] for name in _MODULES}:
+        if top_level in sys.modules or importlib.util.find_spec(top_level):
+            continue
+        STUBBED.append(top_level)
+        for name, attributes in _MODULES.items():
+            if name.split(".")[0] != top_level:
+                continue
+            module = types.ModuleType(name)
+            module.__path__ = []
+            module.__dict__.update(attributes)
+            sys.modules[name] = module
+            parent, _, child = name.rpartition(".")
+            if parent:
+                setattr(sys.modules[parent], child, module)
@@ -0,0 +1,53 @@
+"""Synthetic rendered DAG configs for the benchmarks to work on."""
+
+from pathlib import Path
+from typing import List, Tuple
+
+import yaml
+
+TASKS_PER_DAG = 10
+
+
+def rendered_config(dag_id: str, tasks_per_dag: int = TASKS_PER_DAG) -> str:
+    """A rendered config for a simple chain of Bash tasks."""
+    tasks = "".join(f"""  - operator: BashOperator
+    id: task_{i}
+    dependencies:
+      - id: task_{i - 1}
+    operator_kwargs:
+      bash_command: "echo {dag_id} {i}"
+""" for i in range(1, tasks_per_dag))
+    return f"""dag_id: {dag_id}
+default_args:
+  owner: benchmarks
+  retries: 3
+  retry_delay_sec: 300
+catchup: False
+tags:
+  - dag factory
+timezone: "Europe/London"
+schedule: "0 6 * * *"
+description: "Benchmark DAG {dag_id}"
+tasks:
+  - operator: BashOperator
+    id: task_0
+    operator_kwargs:
+      bash_command: "echo start"
+{tasks}"""
+
+
+def write_rendered_configs(
+    config_dir: Path, dag_count: int, tasks_per_dag: int = TASKS_PER_DAG
+) -> List[Tuple[Path, bytes, dict]]:
+    """Writes rendered configs, spread over domain folders like the real ones.
+
+    Returns each config's path, contents and loaded config, ready to index.
+    """
+    configs = []
+    for i in range(dag_count):
+        path = config_dir / f"domain_{i % 20}" / f"sub_{i % 7}" / f"dag_{i}.yaml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        source = rendered_config(f"dag_{i}", tasks_per_dag).encode("utf-8")
+        path.write_bytes(source)
+        configs.append((path, source, yaml.safe_load(source)))
+    return configs
@@ -0,0 +1,163 @@
+"""Works out which source configs need re-rendering after files change.
+
+This goes by what each config's DAGs used when they were last rendered (as
+recorded in the render manifest, or kept in memory by ``--watch``): a changed
+config or doc re-renders the configs it belongs to, and a changed template
+re-renders every config whose DAGs loaded it. Given a list of changed files,
+anything that can't be traced to the configs it affects (e.g. code, or a
+template no DAG loaded by that name) means rendering everything.
+"""
+
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config_tree import ConfigTree
+from render_manifest import SourceRecord
+from template_env import RenderEnvironment, template_name
+
+
+def read_changed_files(changed_files: Path, root: Path) -> Set[Path]:
+    """Reads a list of changed files, one per line relative to ``root``.
+
+    Pass ``-`` to read them from stdin.
+    """
+    text = sys.stdin.read() if str(changed_files) == "-" else changed_files.read_text()
+    return {root / line.strip() for line in text.splitlines() if line.strip()}
+
+
+def changed_sources(
+    changed: Set[Path],
+    previous: Dict[Path, SourceRecord],
+    yaml_files: List[Path],
+    env: RenderEnvironment,
+    configs: ConfigTree,
+) -> Optional[Set[Path]]:
+    """Works out which config files are affected by a list of changed files.
+
+    Args:
+        changed: the files that changed.
+        previous: what was rendered from each config file last time, from the
+            manifest of an earlier render.
+        yaml_files: every config file there is now.
+        env: the environment templates are loaded from.
+        configs: what's known about the directories of configs.
+
+    Returns:
+        The config files to re-render, or None if everything needs rendering.
+    """
+    if not previous:
+        logging.warning(
+            "Rendering everything, as there's no record of a previous render"
+        )
+        return None
+    code = sorted(str(path) for path in changed if path.suffix == ".py")
+    if code:
+        # this could be the renderer itself, or our constructors:
+        logging.warning("Rendering everything, as code changed: %s", ", ".join(code))
+        return None
+    used = set().union(*(record.templates for record in previous.values()))
+    unknown = sorted(
+        str(path) for path in changed if not _traceable(path, used, env, configs)
+    )
+    if unknown:
+        logging.warning(
+            "Rendering everything, as there's no telling which configs use: %s",
+            ", ".join(unknown),
+        )
+        return None
+
+    stale, _ = affected_sources(changed, previous, env, configs)
+    # anything we've no record of hasn't been rendered yet:
+    stale.update(yaml_file for yaml_file in yaml_files if yaml_file not in previous)
+    logging.info(
+        "%d config(s) affected by %d changed file(s)", len(stale), len(changed)
+    )
+    return stale
+
+
+def _traceable(
+    path: Path, used: Set[str], env: RenderEnvironment, configs: ConfigTree
+) -> bool:
+    """Whether we know which configs a changed file affects (if any).
+
+    Anything in ``dag_configs`` besides configs and docs (e.g. a file one of
+    our constructors reads) could affect any config in there. Templates are
+    traced by the name they were loaded by, so one that isn't known by a name
+    we recorded (e.g. it's deployed under another name) could be used by any
+    config too.
+    """
+    config_root = configs.config_root
+    if path == config_root or config_root in path.parents:
+        return path.suffix in (".yaml", ".yml", ".md") or path.is_dir()
+    if path.suffix == ".j2":
+        return template_name(env.source_loader, path) in used
+    return True
+
+
+def affected_sources(
+    changed: Iterable[Path],
+    sources: Dict[Path, SourceRecord],
+    env: RenderEnvironment,
+    configs: ConfigTree,
+) -> Tuple[Set[Path], Set[Path]]:
+    """Works out which config files need re-rendering after files changed.
+
+    Changed templates are forgotten by the environment, and what's known about
+    changed directories of configs is forgotten too, so they're looked at
+    afresh. Configs that failed last time are always re-rendered if templates
+    changed, as they may have been missing one.
+
+    Returns:
+        The config files to re-render (including any that were deleted), and
+        those of them that changed themselves.
+    """
+    config_root = configs.config_root
+    edited: Set[Path] = set()
+    docs: Set[Path] = set()
+    templates: Set[str] = set()
+
+    for path in changed:
+        if path == config_root or config_root in path.parents:
+            configs.forget(path)
+            if path.suffix == ".md":
+                docs.add(path)
+                continue
+            # directories take everything beneath them with them:
+            edited.update(
+                yaml_file for yaml_file in sources if path in yaml_file.parents
+            )
+            if path.suffix in (".yaml", ".yml"):
+                edited.add(path)
+            elif path.is_dir():
+                edited.update(path.glob("**/*.y*ml"))
+        elif (name := template_name(env.source_loader, path)) is not None:
+            templates.add("" if name == "." else name)
+
+    stale = set(edited)
+    for doc in docs:
+        # docs are looked up by DAG id, alongside the config:
+        stale.update(
+            yaml_file
+            for yaml_file, (_, outputs, _) in sources.items()
+            if yaml_file.parent == doc.parent
+            and doc.stem in {yaml_file.stem, *(output.stem for output in outputs)}
+        )
+
+    if templates:
+
+        def _changed(name: str) -> bool:
+            return any(
+                name == template or name.startswith(f"{template}/") or not template
+                for template in templates
+            )
+
+        used = set().union(*(record.templates for record in sources.values()))
+        env.invalidate({name for name in used if _changed(name)} | templates)
+        stale.update(
+            yaml_file
+            for yaml_file, (failed, _, used) in sources.items()
+            if failed or any(_changed(name) for name in used)
+        )
+    return stale, edited
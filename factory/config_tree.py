@@ -0,0 +1,89 @@
+"""Keeps track of what's in each directory of source DAG configs.
+
+Rendering a DAG needs a few things from the directory its config is in: who
+owns it, how it's tagged, where it's rendered to and which docs sit alongside
+it. ``ConfigTree`` works these out once per directory (from a single walk of
+``dag_configs`` where it can), rather than looking around the filesystem for
+every DAG.
+"""
+
+import fnmatch
+import os
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class ConfigDirectory(NamedTuple):
+    """What every config in a directory under ``dag_configs`` has in common."""
+
+    owner: Optional[str]
+    """The top-level domain folder, which owns the DAGs."""
+    tags: Tuple[str, ...]
+    """A tag per folder between ``dag_configs`` and the configs."""
+    output_dir: Path
+    """Where the DAGs rendered from the configs are written."""
+    docs: FrozenSet[str]
+    """The names (without ``.md``) of the docs in the directory."""
+
+
+class ConfigTree:
+    """What's known about each directory of configs beneath ``config_root``.
+
+    Args:
+        config_root: the ``dag_configs`` directory.
+        output_root: where DAGs rendered from its configs are written.
+    """
+
+    def __init__(self, config_root: Path, output_root: Path):
+        self.config_root = config_root
+        self.output_root = output_root
+        self._directories: Dict[Path, ConfigDirectory] = {}
+
+    def scan(self) -> List[Path]:
+        """Walks ``config_root`` once, noting what's in each directory.
+
+        Returns:
+            Every config file, sorted.
+        """
+        self._directories.clear()
+        yaml_files = []
+        for directory, _, names in os.walk(self.config_root, followlinks=True):
+            directory = Path(directory)
+            self._directories[directory] = self._describe(directory, names)
+            yaml_files.extend(
+                directory / name
+                for name in names
+                if fnmatch.fnmatchcase(name, "*.y*ml")
+            )
+        return sorted(yaml_files)
+
+    def directory(self, directory: Path) -> ConfigDirectory:
+        """Describes a directory of configs, looking at it the first time only."""
+        if directory not in self._directories:
+            names = os.listdir(directory) if directory.is_dir() else []
+            self._directories[directory] = self._describe(directory, names)
+        return self._directories[directory]
+
+    def forget(self, path: Path):
+        """Forgets what's known about a changed file or directory.
+
+        A directory may have come or gone with everything beneath it, and a
+        file coming or going changes the directory it's in, so all of those
+        are looked at afresh next time.
+        """
+        for directory in [d for d in self._directories if path in (d, *d.parents)]:
+            del self._directories[directory]
+        self._directories.pop(path.parent, None)
+
+    def _describe(self, directory: Path, names: Iterable[str]) -> ConfigDirectory:
+        # grab the directory structure between 'dag_configs' and the configs so
+        # we can use it for setting owners/tags:
+        parts = directory.relative_to(self.config_root).parts
+        return ConfigDirectory(
+            # we set the top-level domain folder name as the owner of the DAG:
+            parts[0] if parts else None,
+            # tidy the format of the tags so we're consistent:
+            tuple(part.replace("_", " ").lower() for part in parts),
+            self.output_root.joinpath(*parts),
+            frozenset(name[: -len(".md")] for name in names if name.endswith(".md")),
+        )
@@ -0,0 +1,120 @@
+"""Writes rendered configs out, leaving unchanged ones untouched.
+
+The DAG processor (and anything syncing rendered configs, e.g. git-sync) goes
+by modification times, so rewriting a config that hasn't changed makes it
+look modified, and it gets processed all over again. Configs are only written
+if their contents differ from what's on disk, and then atomically (through a
+temporary file and ``os.replace()``), so nothing ever reads half a config.
+
+``ConfigWriter`` writes configs on a few background threads, so writing
+overlaps with rendering, and creates each output directory just once. The DAG
+index is written the same way by ``write_index()``.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Set, Tuple
+
+from dag_index import INDEX_FILENAME, build_index
+
+WRITER_THREADS = 4
+"""How many threads ``ConfigWriter`` writes with by default."""
+
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """Atomically writes ``data`` to ``path``, unless it already holds exactly that.
+
+    The file's directory must already exist.
+
+    Returns:
+        Whether the file was written.
+    """
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+
+    # the temporary file goes alongside, so it can be renamed into place, and
+    # is hidden from (and doesn't look like a config to) anything else:
+    temp_path = path.with_name(
+        f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(os.open(temp_path, _TEMP_FLAGS, 0o666), "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return True
+
+
+def write_index(
+    config_dir: Path, configs: Iterable[Tuple[Path, bytes, dict]]
+) -> Optional[Path]:
+    """Writes an index of rendered configs (see ``dag_index.build_index()``).
+
+    Returns:
+        The path to the index, or None if there was nothing to index (in which
+        case any existing index is removed).
+    """
+    index_path = config_dir / INDEX_FILENAME
+    index = build_index(config_dir, configs)
+    if index is None:
+        index_path.unlink(missing_ok=True)
+        return None
+    write_if_changed(index_path, index)
+    return index_path
+
+
+class ConfigWriter:
+    """Writes configs with ``write_if_changed()`` on background threads.
+
+    Use it as a context manager, which waits for every write to finish.
+
+    Args:
+        threads: how many threads to write with. With none, each config is
+            written as soon as it's given (e.g. so writes can be timed).
+    """
+
+    def __init__(self, threads: int = WRITER_THREADS):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if threads:
+            self._pool = ThreadPoolExecutor(threads, "config-writer")
+        self._directories: Set[Path] = set()
+
+    def write(self, path: Path, data: bytes) -> "Future[bool]":
+        """Queues ``data`` to be written to ``path``, if it's changed.
+
+        Returns:
+            A future for whether the file was written.
+        """
+        directory = path.parent
+        if directory not in self._directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._directories.add(directory)
+
+        if self._pool is not None:
+            return self._pool.submit(write_if_changed, path, data)
+        future: "Future[bool]" = Future()
+        try:
+            future.set_result(write_if_changed(path, data))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        """Waits for every queued write to finish."""
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self) -> "ConfigWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,48 +1,131 @@
+import functools
+import importlib
 import inspect
+import time
 from datetime import timedelta
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Type
 
-import yaml
 from airflow import DAG, Dataset
+from airflow.models import BaseOperator
 from airflow.models.param import Param
-from airflow.operators.bash_operator import BashOperator
-from airflow.providers.cncf.kubernetes.operators.kubernetes_pod import KubernetesPodOperator
-from airflow.providers.google.cloud.operators.kubernetes_engine import (
-    GKEStartPodOperator,
-)
+from airflow.utils.dag_parsing_context import get_parsing_context
 from airflow.utils.edgemodifier import Label
 from airflow.utils.task_group import TaskGroup
 from airflow.utils.trigger_rule import TriggerRule
-from kubernetes.client import models as k8_models
 
-from factory.utils import dag_builder_utils
+from factory.utils import dag_builder_utils, dag_spec, instrumentation, yaml_io
+from factory.utils.dag_index import DagIndex, find_dag
+from factory.utils.dag_shards import Shard
 from modules.helpers.env_config_helper import env_config
 from modules.utils.jinja_utils import USER_DEFINED_FILTERS, USER_DEFINED_MACROS
 
-SUPPORTED_OPERATOR_TYPES = {
-    "BashOperator": BashOperator,
-    "GKEStartPodOperator": GKEStartPodOperator,
-    "KubernetesPodOperator": KubernetesPodOperator,
-}
-"""These are the operator types we can currently build.
+SUPPORTED_OPERATOR_TYPES = dag_spec.SUPPORTED_OPERATOR_TYPES
+"""These are the operator types we can currently build (see ``dag_spec``)."""
 
-Keys are the string we expect to see under the 'operator' field in a rendered
-DAG config task section, and the values are the specific Airflow operators we
-build when they're requested.
-"""
 
-DAG_BUILD_ARGUMENTS = [p.name for p in inspect.signature(DAG).parameters.values()]
-"""These are the arguments airflow expects us to pass into a DAG definition.
+def __getattr__(name: str) -> Any:
+    # DAG_BUILD_ARGUMENTS is worked out on first use rather than on import:
+    if name == "DAG_BUILD_ARGUMENTS":
+        return dag_build_arguments()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-We use these to filter the kwargs we're given, and only pass the relevant ones
-into the function call. Doing this dynamically allows us to pass new features
-straight into the DAG build function from a template, so we don't have to keep
-reworking this file just to add new features.
-"""
 
+@functools.lru_cache(maxsize=None)
+def dag_build_arguments() -> List[str]:
+    """These are the arguments airflow expects us to pass into a DAG definition.
 
-def generate_dag(yaml_file: Path, parsing_dag_id: str) -> DAG:
+    We use these to filter the kwargs we're given, and only pass the relevant
+    ones into the function call. Doing this dynamically allows us to pass new
+    features straight into the DAG build function from a template, so we don't
+    have to keep reworking this file just to add new features.
+
+    Also available as ``DAG_BUILD_ARGUMENTS``.
+    """
+    return [p.name for p in inspect.signature(DAG).parameters.values()]
+
+
+MANUAL_INTERVAL_PARAMS = ("manual_interval_start_date", "manual_interval_end_date")
+"""Params added to every DAG, so a manual run can be given its own interval."""
+
+_MANUAL_INTERVAL_DESCRIPTION = "Please provide a datetime for the start of this dag run in the required format: `%Y-%m-%dT%H:%M:%S+00:00`"
+
+
+class BuilderContext(NamedTuple):
+    """Everything generate_dag() needs that's the same for every DAG.
+
+    Use ``builder_context()`` to get the shared instance, rather than creating
+    these directly. Don't modify anything in here, as every DAG shares it.
+    """
+
+    environment: str
+    project_id: str
+    region: str
+    gke_defaults: Dict[str, str]
+    """Values for GKE operator kwargs that are set to "default"."""
+    build_arguments: FrozenSet[str]
+    user_defined_filters: Dict[str, Any]
+    user_defined_macros: Dict[str, Any]
+
+
+@functools.lru_cache(maxsize=None)
+def builder_context() -> BuilderContext:
+    """Builds the context shared by every DAG, once per process."""
+    user_defined_filters = {}
+    user_defined_filters.update(dag_builder_utils.DF_USER_DEFINED_FILTERS)
+    user_defined_filters.update(USER_DEFINED_FILTERS)
+    user_defined_macros = {}
+    user_defined_macros.update(dag_builder_utils.DF_USER_DEFINED_MACROS)
+    user_defined_macros.update(USER_DEFINED_MACROS)
+
+    return BuilderContext(
+        environment=env_config.environment,
+        project_id=env_config.project_id,
+        region=env_config.region,
+        gke_defaults={
+            "cluster_name": env_config.cluster_name,
+            "namespace": env_config.cluster_namespace,
+            "service_account_name": env_config.cluster_workload_sa,
+        },
+        build_arguments=frozenset(dag_build_arguments()),
+        user_defined_filters=user_defined_filters,
+        user_defined_macros=user_defined_macros,
+    )
+
+
+def _provide_default_value(kwargs: Dict, key: str, value: Any) -> Dict:
+    """Replaces specific values in a dictionary if the current value
+    for the given key == "default".
+
+    If the existing value doesn't exist, or isn't set to "default", we
+    return the dictionary unchanged.
+
+    Args:
+        kwargs: dictionary
+        key: key to check for a default value
+        value: the value to replace the "default" entry with
+    """
+    if kwargs.get(key) == "default":
+        kwargs[key] = value
+    return kwargs
+
+
+@functools.lru_cache(maxsize=None)
+def operator_class(operator_type: str) -> Type[BaseOperator]:
+    """Imports the operator class for a supported operator type.
+
+    Raises:
+        ValueError: if the operator type isn't one we support.
+    """
+    if operator_type not in SUPPORTED_OPERATOR_TYPES:
+        raise ValueError(f"Unsupported operator type '{operator_type}'")
+    module_name, _, class_name = SUPPORTED_OPERATOR_TYPES[operator_type].rpartition(".")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def generate_dag(
+    yaml_file: Path, parsing_dag_id: str, dag_config: Optional[Dict] = None
+) -> DAG:
     """
     Builds a single DAG from a yaml config file.
 
@@ -50,6 +133,8 @@ def generate_dag(yaml_file: Path, parsing_dag_id: str) -> DAG:
         yaml_file: the path to the file we want to generate a DAG from
         parsing_dag_id: the name of the dag we're currently supposed to be
             parsing, if we're on a worker node and not a DAG builder.
+        dag_config: the already loaded contents of ``yaml_file`` (e.g. from
+            the DAG index), if available. This is modified as the DAG is built.
 
     Returns:
         A single DAG
@@ -59,11 +144,14 @@ def generate_dag(yaml_file: Path, parsing_dag_id: str) -> DAG:
     if parsing_dag_id and parsing_dag_id != yaml_file.stem:
         return
 
-    with yaml_file.open() as file:
-        dag_config = yaml.safe_load(file)
+    if dag_config is None:
+        with instrumentation.stage("load", yaml_file), yaml_file.open() as file:
+            dag_config = yaml_io.safe_load(file)
+
+    context = builder_context()
 
     allowed_envs = dag_config.pop("allowed_envs", [])
-    if allowed_envs and env_config.environment not in allowed_envs:
+    if allowed_envs and context.environment not in allowed_envs:
         return
 
     # Setting default args for a DAG etc.
@@ -75,18 +163,14 @@ def generate_dag(yaml_file: Path, parsing_dag_id: str) -> DAG:
     )
 
     base_params = dag_config.pop("params", {})
+    operator_defaults = dag_config.pop("operator_defaults", {})
+    fragments = dag_config.pop("fragments", {})
 
     # Creating instance of a DAG
-    dag_args = {k: v for k, v in dag_config.items() if k in DAG_BUILD_ARGUMENTS}
-    jinja_filters = {}
-    jinja_filters.update(dag_builder_utils.DF_USER_DEFINED_FILTERS)
-    jinja_filters.update(USER_DEFINED_FILTERS)
-    jinja_macros = {}
-    jinja_macros.update(dag_builder_utils.DF_USER_DEFINED_MACROS)
-    jinja_macros.update(USER_DEFINED_MACROS)
-
-    dag_args["user_defined_filters"] = jinja_filters
-    dag_args["user_defined_macros"] = jinja_macros
+    dag_args = {k: v for k, v in dag_config.items() if k in context.build_arguments}
+    # Airflow only reads these, so every DAG can share the same ones:
+    dag_args["user_defined_filters"] = context.user_defined_filters
+    dag_args["user_defined_macros"] = context.user_defined_macros
 
     dag_args["doc_md"] = dag_config.get("documentation")
 
@@ -107,130 +191,162 @@ def generate_dag(yaml_file: Path, parsing_dag_id: str) -> DAG:
             description=param["description"],
         )
 
-    dag_params["manual_interval_start_date"] = Param(
-        "",
-        type=["null", "string"],
-        description="Please provide a datetime for the start of this dag run in the required format: `%Y-%m-%dT%H:%M:%S+00:00`",
-    )
-    dag_params["manual_interval_end_date"] = Param(
-        "",
-        type=["null", "string"],
-        description="Please provide a datetime for the start of this dag run in the required format: `%Y-%m-%dT%H:%M:%S+00:00`",
-    )
-
-    with DAG(**dag_args, params=dag_params) as dag:
-        # get a unique set of all the task groups named in our config:
-        task_group_names = set(
-            [task_group["id"] for task_group in dag_config.get("task_groups", [])]
-            + [
-                task_config["group"]
-                for task_config in dag_config.get("tasks", [])
-                if task_config.get("group")
-            ]
+    # Params can't be shared between DAGs, as Airflow stores resolved values
+    # on them:
+    for name in MANUAL_INTERVAL_PARAMS:
+        dag_params[name] = Param(
+            "",
+            type=["null", "string"],
+            description=_MANUAL_INTERVAL_DESCRIPTION,
         )
 
-        # then make a task group for each:
+    # check the dependencies make sense before we start building anything:
+    with instrumentation.stage("check", yaml_file):
+        edges = dag_spec.dependency_edges(dag_config)
+        group_names = dag_spec.task_group_names(dag_config)
+        dag_spec.check_dependencies(dag_config, edges, group_names)
+
+    with DAG(**dag_args, params=dag_params) as dag:
+        # make a task group for each one named in our config:
         task_groups = {
-            task_group: TaskGroup(group_id=task_group)
-            for task_group in task_group_names
+            task_group: TaskGroup(group_id=task_group) for task_group in group_names
         }
 
-        def _provide_default_value(kwargs: Dict, key: str, value: Any) -> Dict:
-            """Replaces specific values in a dictionary if the current value
-            for the given key == "default".
-
-            If the existing value doesn't exist, or isn't set to "default", we
-            return the dictionary unchanged.
-
-            Args:
-                kwargs: dictionary
-                key: key to check for a default value
-                value: the value to replace the "default" entry with
-            """
-            if kwargs.get(key) == "default":
-                kwargs[key] = value
-            return kwargs
-
         # Define a operators dict and begin assigning tasks to the above DAG instance
         operators = {}
-        for task_config in dag_config.get("tasks", []):
-            operator_type = task_config.get("operator")
-            if operator_type not in SUPPORTED_OPERATOR_TYPES:
-                raise ValueError(f"Unsupported operator type '{operator_type}'")
-
-            operator_kwargs = task_config.get("operator_kwargs", {})
-
-            if execution_timeout := task_config.get("execution_timeout", ""):
-                for k, v in execution_timeout.items():
-                    if k == "hours":
-                        operator_kwargs["execution_timeout"] = timedelta(hours=v)
-                    elif k == "minutes":
-                        operator_kwargs["execution_timeout"] = timedelta(minutes=v)
-                    else:
-                        operator_kwargs["execution_timeout"] = timedelta(seconds=v)
-            # Set outlet datasets, if any have been provided:
-            if outlets := task_config.get("outlets"):
-                operator_kwargs["outlets"] = [Dataset(outlet) for outlet in outlets]
-
-            # Set trigger rule if we've been given one:
-            if trigger_rule := task_config.pop("trigger_rule", "").upper():
-                if hasattr(TriggerRule, trigger_rule):
-                    operator_kwargs["trigger_rule"] = getattr(TriggerRule, trigger_rule)
-
-            # Set some specifics, depending on the type of operator we're dealing with:
-            if operator_type == "BashOperator":
-                task_type = BashOperator
-
-            elif operator_type == "GKEStartPodOperator":
-                task_type = GKEStartPodOperator
-
-                operator_kwargs["project_id"] = env_config.project_id
-                operator_kwargs["location"] = env_config.region
-
-                if container_resources := task_config.pop("container_resources", ""):
-                    limits = {}
-                    for key, value in container_resources:
-                        limits[key] = value
-                    operator_kwargs[
-                        "container_resources"
-                    ] = k8_models.V1ResourceRequirements(limits=limits)
-                # replace default values where they've been asked for:
-                for key, value in {
-                    "cluster_name": env_config.cluster_name,
-                    "namespace": env_config.cluster_namespace,
-                    "service_account_name": env_config.cluster_workload_sa,
-                }.items():
-                    _provide_default_value(operator_kwargs, key, value)
-
-            # finally, create the task using the arguments from above:
-            operators[task_config["id"]] = task_type(
-                dag=dag,
-                task_id=task_config["id"],
-                task_group=task_groups.get(task_config.get("group")),
-                params=task_config.get("params", ""),
-                **operator_kwargs,
-            )
-
-        # Set dependencies/labels between tasks/task groups:
-        for config in dag_config.get("tasks", []) + dag_config.get("task_groups", []):
-            for dependency in config.get("dependencies", []):
-                # figure out whether we're pointing to tasks, or task groups:
-                upstream = operators.get(dependency["id"]) or task_groups.get(
-                    dependency["id"]
-                )
+        with instrumentation.stage("operators", yaml_file):
+            for task_config in dag_config.get("tasks", []):
+                operator_type = task_config.get("operator")
+                task_type = operator_class(operator_type)
 
-                downstream = operators.get(config["id"]) or task_groups.get(
-                    config["id"]
+                operator_kwargs = dag_spec.operator_kwargs(
+                    task_config, operator_defaults, fragments
                 )
 
-                # if we can't find the task/group anywhere, shout about it:
-                if not upstream or not downstream:
-                    raise ValueError("Dependency issue: %s", dependency)
+                if execution_timeout := task_config.get("execution_timeout", ""):
+                    for k, v in execution_timeout.items():
+                        if k == "hours":
+                            operator_kwargs["execution_timeout"] = timedelta(hours=v)
+                        elif k == "minutes":
+                            operator_kwargs["execution_timeout"] = timedelta(minutes=v)
+                        else:
+                            operator_kwargs["execution_timeout"] = timedelta(seconds=v)
+                # Set outlet datasets, if any have been provided:
+                if outlets := task_config.get("outlets"):
+                    operator_kwargs["outlets"] = [Dataset(outlet) for outlet in outlets]
+
+                # Set trigger rule if we've been given one:
+                if trigger_rule := task_config.pop("trigger_rule", "").upper():
+                    if hasattr(TriggerRule, trigger_rule):
+                        operator_kwargs["trigger_rule"] = getattr(
+                            TriggerRule, trigger_rule
+                        )
+
+                # Set some specifics, depending on the type of operator we're
+                # dealing with:
+                if operator_type == "GKEStartPodOperator":
+                    operator_kwargs["project_id"] = context.project_id
+                    operator_kwargs["location"] = context.region
+
+                    if container_resources := task_config.pop(
+                        "container_resources", ""
+                    ):
+                        from kubernetes.client import models as k8_models
+
+                        limits = {}
+                        for key, value in container_resources:
+                            limits[key] = value
+                        operator_kwargs["container_resources"] = (
+                            k8_models.V1ResourceRequirements(limits=limits)
+                        )
+                    # replace default values where they've been asked for:
+                    for key, value in context.gke_defaults.items():
+                        _provide_default_value(operator_kwargs, key, value)
+
+                # finally, create the task using the arguments from above:
+                operators[task_config["id"]] = task_type(
+                    dag=dag,
+                    task_id=task_config["id"],
+                    task_group=task_groups.get(task_config.get("group")),
+                    params=task_config.get("params", ""),
+                    **operator_kwargs,
+                )
 
-                # set dependencies, using labels where requested:
-                if dependency.get("label"):
-                    upstream >> Label(dependency["label"]) >> downstream
+        # Set dependencies/labels between tasks/task groups, setting all the
+        # downstreams of each upstream (and label) at once. Tasks take
+        # precedence over task groups with the same id:
+        nodes = {**task_groups, **operators}
+        with instrumentation.stage("dependencies", yaml_file):
+            for (upstream, label), downstreams in dag_spec.group_edges(edges).items():
+                downstream_nodes = [nodes[downstream] for downstream in downstreams]
+                if label:
+                    nodes[upstream] >> Label(label) >> downstream_nodes
                 else:
-                    upstream >> downstream
+                    nodes[upstream].set_downstream(downstream_nodes)
 
         return dag
+
+
+def build_dags(
+    namespace: Dict[str, Any], config_dir: Path, shard: Optional[Shard] = None
+) -> int:
+    """Builds DAGs from rendered configs, adding them to a DAG file's globals.
+
+    Configs are read from the renderer's DAG index where possible, and loaded
+    from their YAML if the index is missing or out of date. On a worker, where
+    we only need the DAG that's running, the index takes us straight to its
+    config without searching the rendered configs.
+
+    Args:
+        namespace: the globals of the DAG file being parsed, for Airflow to
+            find the DAGs in.
+        config_dir: where the rendered configs are.
+        shard: if given, only the DAGs in this shard are built.
+
+    Returns:
+        How many DAGs were built.
+    """
+    start = time.perf_counter()
+    current_dag_id = get_parsing_context().dag_id
+    built = 0
+
+    def _build(file: Path, dag_config: Optional[Dict]):
+        nonlocal built
+        dag = generate_dag(file, current_dag_id, dag_config)
+        if dag:
+            namespace[file] = dag
+            built += 1
+            print(f"Successfully built DAG '{dag.dag_id}' from {file}")
+
+    if current_dag_id:
+        # on a worker, we only need the DAG that's running:
+        if shard and not shard.includes(current_dag_id):
+            return 0
+        if found := find_dag(config_dir, current_dag_id):
+            _build(*found)
+            return built
+        print(f"DAG '{current_dag_id}' isn't indexed; searching every config")
+
+    dag_configs = config_dir.glob("**/*.yaml")
+    if not dag_configs:
+        raise ValueError("nothing to build")
+
+    index = DagIndex.load(config_dir)
+    if not index:
+        print("No usable DAG index found; loading every config from YAML")
+
+    for file in dag_configs:
+        if shard and not shard.includes(file.stem):
+            continue
+        dag_config = None
+        # don't bother reading configs generate_dag is going to skip:
+        if index and (not current_dag_id or current_dag_id == file.stem):
+            dag_config = index.config_for(file)
+        _build(file, dag_config)
+
+    if shard:
+        print(
+            f"Built {built} DAG(s) in shard {shard.index} of {shard.count} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    return built
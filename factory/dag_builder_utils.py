@@ -1,9 +1,16 @@
+import functools
+import logging
 import re
 from datetime import datetime, timedelta
 
 import pendulum
 
 
+@functools.lru_cache(maxsize=None)
+def _timezone(name: str):
+    return pendulum.timezone(name)
+
+
 def get_start_date(start_date, tzinfo) -> datetime:
     """Get default start date"""
     if start_date:
@@ -16,69 +23,67 @@ def get_start_date(start_date, tzinfo) -> datetime:
         month = 5
         day = 1
 
-    timezone = pendulum.timezone(tzinfo)
+    timezone = _timezone(tzinfo)
 
     return datetime(year, month, day, tzinfo=timezone)
 
 
-def format_input_date(date_string: str):
-    import logging
+OUTPUT_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+"""The format format_input_date() returns dates in."""
+
+# Matches the date strings format_input_date() accepts. Which optional parts
+# are present decides the format they're parsed with:
+_INPUT_DATE_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?(\+\d{2}:\d{2})?"
+)
+_INPUT_DATE_FORMATS = {
+    # (milliseconds, timezone): format
+    (True, True): "%Y-%m-%dT%H:%M:%S.%f%z",
+    (False, True): "%Y-%m-%dT%H:%M:%S%z",
+    (True, False): "%Y-%m-%dT%H:%M:%S.%f",
+    (False, False): "%Y-%m-%dT%H:%M:%S",
+}
+
+logger = logging.getLogger(__name__)
+
 
-    logging.info(f"The date string passed in is: {date_string}")
+def format_input_date(date_string: str):
+    logger.debug("The date string passed in is: %s", date_string)
     if not date_string:
-        logging.info("Returning false as no comparison required.")
+        logger.debug("Returning false as no comparison required.")
         return False
 
-    string_format = "%Y-%m-%dT%H:%M:%S+00:00"
-
     if isinstance(date_string, datetime):
-        return date_string.strftime(string_format)
+        # not cached, as datetimes in different timezones can compare equal:
+        return date_string.strftime(OUTPUT_DATE_FORMAT)
 
     if not isinstance(date_string, str):
         date_string = str(date_string)
 
-    # Regex Match seconds & milliseconds & timezone
-    match = re.match(
-        r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}\.\d+\+\d{2}:\d{2}", date_string
-    )
-    if match:
-        return datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%S.%f%z").strftime(
-            string_format
-        )
-
-    # Regex Match seconds & timezone but NO milliseconds
-    match = re.match(
-        r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}\+\d{2}:\d{2}", date_string
-    )
-    if match:
-        return datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%S%z").strftime(
-            string_format
-        )
-
-    # Regex Match seconds & milliseconds but NO timezone
-    match = re.match(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}\.\d+", date_string)
-    if match:
-        return datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%S.%f").strftime(
-            string_format
-        )
-
-    # Regex Match seconds but NOT milliseconds or timezone NO timezone
-    match = re.match(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}", date_string)
-    if match:
-        return datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%S").strftime(
-            string_format
-        )
-
-    return False
+    return _format_date_string(date_string)
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_date_string(date_string: str):
+    # only the start of the string has to match, with or without milliseconds
+    # and/or a timezone:
+    match = _INPUT_DATE_PATTERN.match(date_string)
+    if not match:
+        return False
+
+    milliseconds, timezone = match.groups()
+    string_format = _INPUT_DATE_FORMATS[bool(milliseconds), bool(timezone)]
+    return datetime.strptime(date_string, string_format).strftime(OUTPUT_DATE_FORMAT)
 
 
+@functools.lru_cache(maxsize=4096)
 def ds_timedelta_formatted(
     datetime_base: str,
     timedelta_format: int = 0,
     format: str = "%Y-%m-%d 00:00:00",
     local_timezone: str = "Europe/London",
 ):
-    local_tz = pendulum.timezone(local_timezone)
+    local_tz = _timezone(local_timezone)
     base = datetime.strptime(datetime_base, "%Y-%m-%d").astimezone(local_tz)
     timedelta_output = base + timedelta(days=timedelta_format)
     return timedelta_output.replace(hour=0, minute=0, second=0).strftime(format)
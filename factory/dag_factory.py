@@ -2,26 +2,30 @@
 
 from pathlib import Path
 
-from airflow.utils.dag_parsing_context import get_parsing_context
+from factory.utils import instrumentation
+from factory.utils.dag_builder import build_dags
+from factory.utils.dag_shards import shard_modules
 
-from factory.utils.dag_builder import generate_dag
+RENDERED_CONFIGS = Path(__file__).parent / "rendered_configs"
+"""Where the renderer writes fully rendered DAG configs (and their index)."""
 
 
 def run():
     """
     Iterates over rendered DAG configs, turning them into proper DAGs.
-    """
-    dag_configs = (Path(__file__).parent / "rendered_configs").glob("**/*.yaml")
-    if not dag_configs:
-        raise ValueError("nothing to build")
 
+    If the renderer has split the DAGs into shards, each shard's entry module
+    builds them instead, so Airflow can parse the shards in parallel. See
+    ``build_dags()`` for how configs are found.
+    """
     print("Attempting to build DAGs from config files")
-    current_dag_id = get_parsing_context().dag_id
-    for file in dag_configs:
-        dag = generate_dag(file, current_dag_id)
-        if dag:
-            globals()[file] = dag
-            print(f"Successfully built DAG '{dag.dag_id}' from {file}")
+    if shard_modules(Path(__file__).parent):
+        print("DAGs are built by the shard modules alongside this file")
+        return
+    build_dags(globals(), RENDERED_CONFIGS)
 
 
 run()
+
+if summary := instrumentation.report():
+    print(summary)
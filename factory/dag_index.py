@@ -0,0 +1,287 @@
+"""A single-file index of every rendered DAG config.
+
+Parsing hundreds of rendered YAML files with PyYAML on every scheduler loop
+is slow, so the renderer also writes the configs it has already loaded (and
+validated) into one ``marshal`` blob. The DAG factory can then load them all
+with a single read, falling back to the YAML for any config the index doesn't
+cover or that's changed since the index was written.
+
+Workers only need the one DAG they're running, so the index also has a lookup
+table sorted by (a hash of) DAG id, which can be binary searched with a few
+small reads however many DAGs there are.
+
+Every string in the index is interned, so configs loaded from it share one
+copy of each key and each repeated value (e.g. images, namespaces and env var
+templates) across every DAG in the process, which adds up with hundreds of
+DAGs in a DagBag.
+
+The file is laid out as:
+
+* ``MAGIC``
+* the ``marshal`` version, and the lengths of the header, lookup table and
+  directory, as 4-byte big-endian unsigned ints
+* the header: a marshalled offset table with an entry per rendered config,
+  keyed by path
+* the lookup table: a fixed-width record per DAG id, of its hash and where to
+  find its directory entry, sorted by hash
+* the directory: a marshalled entry per DAG id, giving its path and where to
+  find its config
+* each config, marshalled separately, at the offsets given above
+"""
+
+import hashlib
+import logging
+import marshal
+import struct
+import sys
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Optional, Tuple
+
+INDEX_FILENAME = "_dag_index.marshal"
+"""The index's file name within the rendered configs directory."""
+
+MAGIC = b"DAGIDX02"
+"""Identifies an index file (and its layout version)."""
+
+_PREFIX = struct.Struct(">IIII")
+_LOOKUP_RECORD = struct.Struct(">QII")
+
+ConfigEntry = Tuple[str, int, int]
+"""A config's digest, and the offset and length of its marshalled blob."""
+
+
+def config_digest(source: bytes) -> str:
+    """Hashes a rendered config file's contents, to tell if it's changed."""
+    return hashlib.blake2b(source, digest_size=16).hexdigest()
+
+
+def _dag_id_hash(dag_id: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(dag_id.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+def _interned(value: Any) -> Any:
+    """A copy of a config with every string interned.
+
+    marshal writes each interned string once per config (referring back to it
+    after that), and interns it again when it's loaded, so strings are shared
+    both within and between loaded configs.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {_interned(key): _interned(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_interned(item) for item in value]
+    return value
+
+
+def build_index(
+    config_dir: Path, configs: Iterable[Tuple[Path, bytes, dict]]
+) -> Optional[bytes]:
+    """Builds an index of rendered configs, to be written to ``INDEX_FILENAME``.
+
+    Args:
+        config_dir: the rendered configs directory the index is for.
+        configs: for each rendered config, its path, the exact contents of the
+            file, and the config as loaded from it.
+
+    Returns:
+        The index's contents, or None if there was nothing to index.
+    """
+    entries: Dict[str, ConfigEntry] = {}
+    blobs = []
+    offset = 0
+    for path, source, config in configs:
+        try:
+            blob = marshal.dumps(_interned(config))
+        except ValueError as e:
+            # e.g. dates in params; these configs just get loaded from YAML:
+            logging.warning("Not indexing rendered config '%s': %s", path, e)
+            continue
+        relative_path = path.relative_to(config_dir).as_posix()
+        entries[relative_path] = (config_digest(source), offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    if not entries:
+        return None
+
+    dag_ids: Dict[str, Optional[str]] = {}
+    for relative_path in entries:
+        dag_id = Path(relative_path).stem
+        # DAG ids should be unique, but if they're not, don't guess:
+        dag_ids[dag_id] = None if dag_id in dag_ids else relative_path
+
+    lookup = []
+    directory = []
+    directory_length = 0
+    for dag_id, relative_path in dag_ids.items():
+        if relative_path is None:
+            continue
+        record = marshal.dumps((dag_id, relative_path) + entries[relative_path])
+        lookup.append((_dag_id_hash(dag_id), directory_length, len(record)))
+        directory.append(record)
+        directory_length += len(record)
+    lookup.sort()
+
+    header = marshal.dumps(entries)
+
+    return b"".join(
+        [
+            MAGIC,
+            _PREFIX.pack(marshal.version, len(header), len(lookup), directory_length),
+            header,
+            *(_LOOKUP_RECORD.pack(*record) for record in lookup),
+            *directory,
+            *blobs,
+        ]
+    )
+
+
+class _Layout:
+    """Where each section of an index file starts."""
+
+    def __init__(self, prefix: bytes):
+        if bytes(prefix[: len(MAGIC)]) != MAGIC:
+            raise ValueError("not a DAG index")
+        (
+            marshal_version,
+            header_length,
+            self.lookup_count,
+            directory_length,
+        ) = _PREFIX.unpack_from(prefix, len(MAGIC))
+        # the renderer and Airflow may run different Pythons, which is fine as
+        # long as they agree on marshal's format:
+        if marshal_version != marshal.version:
+            raise ValueError(f"written with marshal version {marshal_version}")
+        self.header = len(MAGIC) + _PREFIX.size
+        self.lookup = self.header + header_length
+        self.directory = self.lookup + self.lookup_count * _LOOKUP_RECORD.size
+        self.blobs = self.directory + directory_length
+
+
+class DagIndex:
+    """A loaded index of rendered configs.
+
+    Use ``DagIndex.load()`` rather than creating these directly.
+    """
+
+    def __init__(
+        self, config_dir: Path, entries: Dict[str, ConfigEntry], blobs: memoryview
+    ):
+        self.config_dir = config_dir
+        self._entries = entries
+        self._blobs = blobs
+
+    @classmethod
+    def load(cls, config_dir: Path) -> Optional["DagIndex"]:
+        """Reads the index for a rendered configs directory in one go.
+
+        Returns None if there's no usable index.
+        """
+        index_path = config_dir / INDEX_FILENAME
+        try:
+            data = memoryview(index_path.read_bytes())
+        except FileNotFoundError:
+            return None
+
+        try:
+            layout = _Layout(data)
+            entries = marshal.loads(data[layout.header : layout.lookup])
+            if not isinstance(entries, dict):
+                raise ValueError("malformed header")
+        except (ValueError, EOFError, TypeError, struct.error) as e:
+            logging.warning("Ignoring unusable DAG index '%s': %s", index_path, e)
+            return None
+        return cls(config_dir, entries, data[layout.blobs :])
+
+    def config_for(self, path: Path, source: Optional[bytes] = None) -> Optional[dict]:
+        """The indexed config for a rendered config file.
+
+        This checks the file still matches what was indexed, and returns None
+        if it doesn't (or it was never indexed), in which case the YAML should
+        be loaded instead. Pass the file's contents as ``source`` if they've
+        already been read.
+        """
+        entry = self._entries.get(path.relative_to(self.config_dir).as_posix())
+        if entry is None:
+            return None
+
+        digest, offset, length = entry
+        if source is None:
+            try:
+                source = path.read_bytes()
+            except FileNotFoundError:
+                return None
+        if config_digest(source) != digest:
+            return None
+        return marshal.loads(self._blobs[offset : offset + length])
+
+
+def find_dag(config_dir: Path, dag_id: str) -> Optional[Tuple[Path, Optional[dict]]]:
+    """Looks up a single DAG in the index, without reading the rest of it.
+
+    This binary searches the index's lookup table, so takes the same time
+    however many DAGs are indexed.
+
+    Returns:
+        None if the DAG isn't indexed (or there's no usable index). Otherwise,
+        the path to the DAG's rendered config, and the config itself, or None
+        if the file has changed since it was indexed.
+    """
+    index_path = config_dir / INDEX_FILENAME
+    try:
+        with index_path.open("rb") as f:
+            layout = _Layout(f.read(len(MAGIC) + _PREFIX.size))
+            entry = _search_lookup(f, layout, dag_id)
+            if entry is None:
+                return None
+            relative_path, digest, offset, length = entry
+
+            path = config_dir / relative_path
+            try:
+                source = path.read_bytes()
+            except FileNotFoundError:
+                return None
+            if config_digest(source) != digest:
+                return path, None
+
+            f.seek(layout.blobs + offset)
+            return path, marshal.loads(f.read(length))
+    except FileNotFoundError:
+        return None
+    except (ValueError, EOFError, TypeError, struct.error) as e:
+        logging.warning("Ignoring unusable DAG index '%s': %s", index_path, e)
+        return None
+
+
+def _search_lookup(
+    f: BinaryIO, layout: _Layout, dag_id: str
+) -> Optional[Tuple[str, str, int, int]]:
+    """Binary searches an index's lookup table for a DAG's directory entry."""
+    target = _dag_id_hash(dag_id)
+
+    def _read_record(position: int) -> Tuple[int, int, int]:
+        f.seek(layout.lookup + position * _LOOKUP_RECORD.size)
+        return _LOOKUP_RECORD.unpack(f.read(_LOOKUP_RECORD.size))
+
+    low, high = 0, layout.lookup_count
+    while low < high:
+        middle = (low + high) // 2
+        if _read_record(middle)[0] < target:
+            low = middle + 1
+        else:
+            high = middle
+
+    # different DAG ids can share a hash, so check every record that matches:
+    for position in range(low, layout.lookup_count):
+        dag_id_hash, offset, length = _read_record(position)
+        if dag_id_hash != target:
+            break
+        f.seek(layout.directory + offset)
+        entry = marshal.loads(f.read(length))
+        if entry[0] == dag_id:
+            return entry[1:]
+    return None
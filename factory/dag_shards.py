@@ -0,0 +1,74 @@
+"""Splits the DAGs between several DAG factory entry modules.
+
+Airflow parses each DAG file in its own process, but the DAG factory builds
+every DAG from the one file, so they all get parsed one after the other.
+``render_configs.py --shards N`` writes ``N`` entry modules alongside the DAG
+factory instead, each building just the DAGs in its shard, so the scheduler
+can parse them in parallel (up to its ``parsing_processes``).
+
+DAGs are assigned to shards by a CRC-32 of their id, which is the same on
+every machine and in every Python, so a DAG stays in the same shard (and
+keeps its ``fileloc``) for as long as the number of shards does.
+
+In safe mode (``dag_discovery_safe_mode``, the default), Airflow only parses
+files that mention both "airflow" and "dag", so the shard modules' docstrings
+say they build Airflow DAGs.
+"""
+
+import zlib
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+SHARD_MODULE_PREFIX = "dag_factory_shard_"
+"""What the name of every shard module starts with."""
+
+_SHARD_MODULE = '''"""Builds the Airflow DAGs in shard {index} of {count} from the rendered configs.
+
+This is written by ``render_configs.py --shards {count}``, so don't edit it.
+"""
+
+from pathlib import Path
+
+from factory.utils import instrumentation
+from factory.utils.dag_builder import build_dags
+from factory.utils.dag_shards import Shard
+
+build_dags(
+    globals(),
+    Path(__file__).parent / "rendered_configs",
+    Shard({index}, {count}),
+)
+
+if summary := instrumentation.report():
+    print(summary)
+'''
+
+
+class Shard(NamedTuple):
+    """One of several entry modules that build the DAGs between them."""
+
+    index: int
+    count: int
+
+    def includes(self, dag_id: str) -> bool:
+        """Whether a DAG is built by this shard."""
+        return shard_of(dag_id, self.count) == self.index
+
+
+def shard_of(dag_id: str, shards: int) -> int:
+    """Which of ``shards`` shards builds a DAG."""
+    return zlib.crc32(dag_id.encode("utf-8")) % shards
+
+
+def shard_modules(factory_dir: Path) -> List[Path]:
+    """The shard entry modules alongside the DAG factory, if there are any."""
+    return sorted(factory_dir.glob(f"{SHARD_MODULE_PREFIX}*.py"))
+
+
+def shard_module(factory_dir: Path, shard: Shard) -> Tuple[Path, str]:
+    """Where a shard's entry module goes, and its source."""
+    width = max(2, len(str(shard.count - 1)))
+    return (
+        factory_dir / f"{SHARD_MODULE_PREFIX}{shard.index:0{width}d}.py",
+        _SHARD_MODULE.format(index=shard.index, count=shard.count),
+    )
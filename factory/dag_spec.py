@@ -0,0 +1,475 @@
+"""Checks and preparation for rendered DAG configs that don't need Airflow.
+
+The DAG builder uses these to work out a DAG's shape (and whether it makes
+sense) from its config before creating any Airflow objects, so a bad config
+fails fast without leaving a half-built DAG behind. ``validate()`` runs every
+check the builder would (and more) up front, so configs can be checked before
+they're deployed, e.g. by ``validate_configs.py``.
+"""
+
+import re
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from itertools import chain
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+SUPPORTED_OPERATOR_TYPES = {
+    "BashOperator": "airflow.operators.bash_operator.BashOperator",
+    "GKEStartPodOperator": (
+        "airflow.providers.google.cloud.operators.kubernetes_engine"
+        ".GKEStartPodOperator"
+    ),
+    "KubernetesPodOperator": (
+        "airflow.providers.cncf.kubernetes.operators.kubernetes_pod"
+        ".KubernetesPodOperator"
+    ),
+}
+"""These are the operator types we can currently build.
+
+Keys are the string we expect to see under the 'operator' field in a rendered
+DAG config task section, and the values are the dotted paths of the specific
+Airflow operators we build when they're requested. The DAG builder only
+imports operators the first time they're needed (see
+``dag_builder.operator_class()``), as the provider packages take seconds to
+import and most DAGs only use some of them.
+"""
+
+
+class Edge(NamedTuple):
+    """A dependency between two tasks or task groups, by id."""
+
+    upstream: str
+    downstream: str
+    label: Optional[str] = None
+
+
+def task_group_names(dag_config: Dict) -> Set[str]:
+    """Every task group in a config, whether declared or just named by a task."""
+    return {task_group["id"] for task_group in dag_config.get("task_groups", [])} | {
+        task_config["group"]
+        for task_config in dag_config.get("tasks", [])
+        if task_config.get("group")
+    }
+
+
+def dependency_edges(dag_config: Dict) -> List[Edge]:
+    """Every dependency in a config, of both tasks and task groups."""
+    return [
+        Edge(dependency["id"], config["id"], dependency.get("label") or None)
+        for config in chain(
+            dag_config.get("tasks", []), dag_config.get("task_groups", [])
+        )
+        for dependency in config.get("dependencies", [])
+    ]
+
+
+def group_edges(edges: Iterable[Edge]) -> Dict[Tuple[str, Optional[str]], List[str]]:
+    """Groups edges by upstream and label, so each group can be set in one go.
+
+    Returns:
+        The downstream ids for each upstream id and label, in the order their
+        edges were given.
+    """
+    grouped: Dict[Tuple[str, Optional[str]], List[str]] = defaultdict(list)
+    for edge in edges:
+        grouped[edge.upstream, edge.label].append(edge.downstream)
+    return dict(grouped)
+
+
+def check_dependencies(dag_config: Dict, edges: List[Edge], group_names: Set[str]):
+    """Checks a config's dependencies all exist, and don't form a cycle.
+
+    Setting a task group upstream (or downstream) of something makes all of
+    its tasks upstream (or downstream) of it too, so that's taken into account
+    when looking for cycles.
+
+    Args:
+        dag_config: the config.
+        edges: its ``dependency_edges()``.
+        group_names: its ``task_group_names()``.
+
+    Raises:
+        ValueError: if a dependency refers to a task or group that doesn't
+            exist, or the dependencies form a cycle.
+    """
+    task_ids = {task_config["id"] for task_config in dag_config.get("tasks", [])}
+    known = task_ids | group_names
+
+    dangling = sorted(
+        {edge.upstream for edge in edges if edge.upstream not in known}
+        | {edge.downstream for edge in edges if edge.downstream not in known}
+    )
+    if dangling:
+        raise ValueError(
+            f"Dependency issue: no task or task group called {', '.join(dangling)}"
+        )
+
+    # tasks take precedence over groups with the same id, as in the builder.
+    # Groups are split into an entry and exit node, wired through their tasks,
+    # which gives the same reachability as Airflow wiring their roots/leaves:
+    def _entry(node: str) -> Tuple[str, str]:
+        return (node, "") if node in task_ids else (node, "in")
+
+    def _exit(node: str) -> Tuple[str, str]:
+        return (node, "") if node in task_ids else (node, "out")
+
+    graph: Dict[Tuple[str, str], List[Tuple[str, str]]] = defaultdict(list)
+    for task_config in dag_config.get("tasks", []):
+        group = task_config.get("group")
+        if group and group not in task_ids:
+            task = (task_config["id"], "")
+            graph[_entry(group)].append(task)
+            graph[task].append(_exit(group))
+    for edge in edges:
+        graph[_exit(edge.upstream)].append(_entry(edge.downstream))
+
+    if cycle := _find_cycle(graph):
+        names = [cycle[0][0]]
+        for node, _ in cycle[1:]:
+            if node != names[-1]:
+                names.append(node)
+        raise ValueError(f"Dependency issue: cycle between {' >> '.join(names)}")
+
+
+def _find_cycle(graph: Dict[Hashable, List[Hashable]]) -> Optional[List[Hashable]]:
+    """Finds a cycle in a directed graph, returning its path if there is one."""
+    visiting, visited = set(), set()
+    for root in list(graph):
+        if root in visited:
+            continue
+        # iterative depth-first search, as DAGs can be deeper than the
+        # recursion limit:
+        path = [root]
+        children = [iter(graph[root])]
+        visiting.add(root)
+        while path:
+            node = next(children[-1], None)
+            if node is None:
+                finished = path.pop()
+                children.pop()
+                visiting.discard(finished)
+                visited.add(finished)
+            elif node in visiting:
+                return path[path.index(node) :] + [node]
+            elif node not in visited:
+                path.append(node)
+                children.append(iter(graph.get(node, ())))
+                visiting.add(node)
+    return None
+
+
+FRAGMENTS_KEY = "_fragments"
+"""Any mapping in a task's operator kwargs can list fragments under this key,
+to include their contents as if they were written in place."""
+
+
+def operator_kwargs(
+    task_config: Dict, operator_defaults: Dict[str, Dict], fragments: Dict[str, Any]
+) -> Dict:
+    """A task's operator kwargs, with shared defaults and fragments filled in.
+
+    Rendered configs can give kwargs shared by every task of an operator type
+    once, under ``operator_defaults``, and mappings shared by several tasks
+    once, under ``fragments``, to keep them small. Tasks' own kwargs take
+    precedence over both.
+
+    This returns new dicts and lists throughout, but shares everything else
+    (i.e. strings) with the config, so tasks using the same fragment don't
+    each have their own copy.
+
+    Raises:
+        ValueError: if the task uses a fragment that doesn't exist.
+    """
+    kwargs = dict(operator_defaults.get(task_config.get("operator"), {}))
+    kwargs.update(
+        resolve_fragments(task_config.get("operator_kwargs") or {}, fragments)
+    )
+    return kwargs
+
+
+def resolve_fragments(
+    value: Any, fragments: Dict[str, Any], _including: Tuple[str, ...] = ()
+) -> Any:
+    """Replaces fragment references in a value with the fragments' contents.
+
+    Raises:
+        ValueError: if a fragment doesn't exist, or includes itself.
+    """
+    if isinstance(value, dict):
+        resolved = {}
+        names = value.get(FRAGMENTS_KEY, ())
+        for name in [names] if isinstance(names, str) else names:
+            if name not in fragments:
+                raise ValueError(f"Unknown fragment '{name}'")
+            if name in _including:
+                raise ValueError(f"Fragment '{name}' includes itself")
+            resolved.update(
+                resolve_fragments(fragments[name], fragments, _including + (name,))
+            )
+        for key, item in value.items():
+            if key != FRAGMENTS_KEY:
+                resolved[key] = resolve_fragments(item, fragments, _including)
+        return resolved
+    if isinstance(value, list):
+        return [resolve_fragments(item, fragments, _including) for item in value]
+    return value
+
+
+Schema = Dict[str, Any]
+"""A description of valid values, for ``compile_schema()``."""
+
+Check = Callable[[Any, str, List[str]], None]
+"""Checks a value against a compiled schema, adding any errors to a list."""
+
+
+def compile_schema(schema: Schema) -> Check:
+    """Compiles a schema into a function that checks values against it.
+
+    Schemas are dicts, which can give:
+
+    * ``type``: the type (or tuple of types) a value must be
+    * ``enum``: the values allowed
+    * ``pattern`` and ``max_length``: a regex strings must match in full, and
+      how long they can be
+    * ``min_items`` and ``items``: how few items lists can have, and a schema
+      for each item
+    * ``required`` and ``properties``: the keys dicts must have, and schemas
+      for the values of particular keys
+    * ``keys`` and ``values``: the only keys dicts can have, and a schema for
+      the values of any keys not given in ``properties``
+
+    Everything's worked out once here, so checking each value is just a few
+    comparisons. The returned function is given a value, where it is (e.g.
+    ``tasks[2].id``) and a list to add any errors to, so everything wrong with
+    a value can be found in one go.
+    """
+    types = schema.get("type")
+    if types is None:
+        type_names = None
+    elif isinstance(types, tuple):
+        type_names = " or ".join(_TYPE_NAMES.get(t, t.__name__) for t in types)
+    else:
+        type_names = _TYPE_NAMES.get(types, types.__name__)
+    enum = schema.get("enum")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    max_length = schema.get("max_length")
+    min_items = schema.get("min_items", 0)
+    items = compile_schema(schema["items"]) if "items" in schema else None
+    required = schema.get("required", ())
+    properties = {
+        key: compile_schema(value)
+        for key, value in schema.get("properties", {}).items()
+    }
+    keys = schema.get("keys")
+    values = compile_schema(schema["values"]) if "values" in schema else None
+
+    def _check(value: Any, where: str, errors: List[str]):
+        if types is not None and not isinstance(value, types):
+            actual = _TYPE_NAMES.get(type(value), type(value).__name__)
+            errors.append(f"{where or 'config'} should be {type_names}, not {actual}")
+            return
+        if enum is not None and value not in enum:
+            errors.append(
+                f"{where} should be one of {', '.join(sorted(enum))}, not {value!r}"
+            )
+        if isinstance(value, str):
+            if pattern is not None and not pattern.fullmatch(value):
+                errors.append(f"{where} {value!r} doesn't match {pattern.pattern}")
+            if max_length is not None and len(value) > max_length:
+                errors.append(f"{where} is longer than {max_length} characters")
+        elif isinstance(value, list):
+            if len(value) < min_items:
+                errors.append(f"{where} should have at least {min_items} item(s)")
+            if items is not None:
+                for i, item in enumerate(value):
+                    items(item, f"{where}[{i}]", errors)
+        elif isinstance(value, dict):
+            for key in required:
+                if key not in value:
+                    errors.append(f"{where or 'config'} is missing {key!r}")
+            for key, item in value.items():
+                if keys is not None and key not in keys and key not in properties:
+                    errors.append(
+                        f"{where or 'config'} has unsupported key {key!r} "
+                        f"(expected {', '.join(sorted(keys))})"
+                    )
+                elif key in properties:
+                    properties[key](item, f"{where}.{key}" if where else key, errors)
+                elif values is not None:
+                    values(item, f"{where}.{key}" if where else key, errors)
+
+    return _check
+
+
+_TYPE_NAMES = {
+    dict: "a mapping",
+    list: "a list",
+    str: "a string",
+    int: "an integer",
+    float: "a number",
+    bool: "true or false",
+    type(None): "null",
+}
+
+ID_PATTERN = r"[\w.-]+"
+"""What Airflow allows in DAG, task and task group ids."""
+
+_ID: Schema = {"type": str, "pattern": ID_PATTERN, "max_length": 250}
+
+_DEPENDENCIES: Schema = {
+    "type": list,
+    "items": {
+        "type": dict,
+        "required": ["id"],
+        "properties": {"id": _ID, "label": {"type": (str, type(None))}},
+    },
+}
+
+EXECUTION_TIMEOUT_UNITS = ("hours", "minutes", "seconds")
+"""The units a task's ``execution_timeout`` can be given in."""
+
+DAG_SCHEMA: Schema = {
+    "type": dict,
+    "required": ["dag_id", "timezone", "schedule", "tasks"],
+    "properties": {
+        "dag_id": _ID,
+        "timezone": {"type": str},
+        # the DAG builder splits these up itself:
+        "start_date": {"type": (str, type(None)), "pattern": r"(\d+-\d+-\d+)?"},
+        "schedule": {
+            "type": (str, dict, type(None)),
+            "properties": {"datasets": {"type": list, "items": {"type": str}}},
+        },
+        "default_view": {
+            "type": str,
+            "enum": {"grid", "graph", "duration", "gantt", "landing_times", "tree"},
+        },
+        "orientation": {"type": str, "enum": {"LR", "TB", "RL", "BT"}},
+        "allowed_envs": {"type": list, "items": {"type": str}},
+        "params": {
+            "type": list,
+            "items": {
+                "type": dict,
+                "required": ["id", "type", "description"],
+                "properties": {"id": {"type": str}, "required": {"type": bool}},
+            },
+        },
+        "operator_defaults": {
+            "type": dict,
+            "keys": SUPPORTED_OPERATOR_TYPES,
+            "values": {"type": dict},
+        },
+        "fragments": {"type": dict},
+        "task_groups": {
+            "type": list,
+            "items": {
+                "type": dict,
+                "required": ["id"],
+                "properties": {"id": _ID, "dependencies": _DEPENDENCIES},
+            },
+        },
+        "tasks": {
+            "type": list,
+            "min_items": 1,
+            "items": {
+                "type": dict,
+                "required": ["id", "operator"],
+                "properties": {
+                    "id": _ID,
+                    "operator": {"type": str, "enum": SUPPORTED_OPERATOR_TYPES},
+                    "group": _ID,
+                    "dependencies": _DEPENDENCIES,
+                    "operator_kwargs": {"type": (dict, type(None))},
+                    "execution_timeout": {
+                        "type": dict,
+                        "keys": EXECUTION_TIMEOUT_UNITS,
+                        "values": {"type": (int, float)},
+                    },
+                    "outlets": {"type": list, "items": {"type": str}},
+                    "trigger_rule": {"type": str},
+                },
+            },
+        },
+    },
+}
+"""What the DAG builder needs of a rendered config."""
+
+_check_dag = compile_schema(DAG_SCHEMA)
+
+
+def validate(dag_config: Any) -> List[str]:
+    """Checks a rendered config has everything needed to build its DAG.
+
+    This checks the config against ``DAG_SCHEMA``, then that task ids are
+    unique (and aren't task groups' ids too), every fragment tasks use exists,
+    and the dependencies make sense, as the DAG builder would. Every check
+    runs whatever the others find, so all the problems are reported at once,
+    unless the config doesn't have a list of tasks with ids to check.
+
+    Returns:
+        Every problem found, or an empty list if there aren't any.
+    """
+    errors: List[str] = []
+    _check_dag(dag_config, "", errors)
+    tasks = dag_config.get("tasks") if isinstance(dag_config, dict) else None
+    if not isinstance(tasks, list) or not all(
+        isinstance(task_config, dict) and isinstance(task_config.get("id"), str)
+        for task_config in tasks
+    ):
+        # the rest relies on there being tasks with ids:
+        return errors
+    malformed = bool(errors)
+
+    group_names: Set[str] = set()
+    with _unless_malformed(malformed):
+        group_names = task_group_names(dag_config)
+
+    # the builder keys tasks by their own ids, whatever group they're in, and
+    # a task takes the place of a group with the same id in dependencies:
+    for task_id, count in Counter(task_config["id"] for task_config in tasks).items():
+        if count > 1:
+            errors.append(f"Duplicate task id '{task_id}' ({count} tasks)")
+        if task_id in group_names:
+            errors.append(f"Task id '{task_id}' is also a task group's id")
+
+    operator_defaults = dag_config.get("operator_defaults", {})
+    fragments = dag_config.get("fragments", {})
+    for task_config in tasks:
+        with _unless_malformed(malformed):
+            try:
+                operator_kwargs(task_config, operator_defaults, fragments)
+            except ValueError as e:
+                errors.append(f"Task '{task_config['id']}': {e}")
+
+    with _unless_malformed(malformed):
+        try:
+            check_dependencies(dag_config, dependency_edges(dag_config), group_names)
+        except ValueError as e:
+            errors.append(str(e))
+    return errors
+
+
+@contextmanager
+def _unless_malformed(malformed: bool) -> Iterator[None]:
+    """Skips a check that fails on part of a config the schema check rejected.
+
+    Args:
+        malformed: whether the schema check found any problems.
+    """
+    try:
+        yield
+    except (AttributeError, KeyError, TypeError):
+        if not malformed:
+            raise
@@ -0,0 +1,50 @@
+"""Notes which files are read while loading source configs.
+
+Our custom YAML constructors can read files of their own (e.g. a query or
+schema alongside a config), which feed into the rendered config as much as the
+config itself does. ``recording()`` collects the paths of files opened for
+reading within it, from Python's ``open`` audit events (see
+``sys.addaudithook()``), so incremental renders can tell when they change.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+from typing import Any, Iterator, Optional, Set, Tuple
+
+_reads: Optional[Set[str]] = None
+"""Where files opened for reading are collected, while recording."""
+
+_thread: Optional[int] = None
+"""The thread that's recording, as others (e.g. writing rendered configs) may
+be reading files of their own at the same time."""
+
+_hooked = False
+
+
+def _audit(event: str, args: Tuple[Any, ...]):
+    if event != "open" or _reads is None or threading.get_ident() != _thread:
+        return
+    path, _, flags = args
+    if isinstance(path, (str, bytes, os.PathLike)) and (
+        flags & os.O_ACCMODE == os.O_RDONLY
+    ):
+        _reads.add(os.path.abspath(os.fsdecode(path)))
+
+
+@contextlib.contextmanager
+def recording() -> Iterator[Set[str]]:
+    """Collects the absolute path of every file opened for reading in here."""
+    global _reads, _thread, _hooked
+    if not _hooked:
+        # audit hooks can't be removed, so there's only ever one:
+        sys.addaudithook(_audit)
+        _hooked = True
+    reads: Set[str] = set()
+    previous = _reads, _thread
+    _reads, _thread = reads, threading.get_ident()
+    try:
+        yield reads
+    finally:
+        _reads, _thread = previous
@@ -0,0 +1,188 @@
+"""Waits for files to change beneath a set of directories.
+
+On Linux this uses inotify, so changes are picked up as soon as they're
+written without scanning anything. Elsewhere (or if inotify isn't available,
+e.g. we've run out of watches), it falls back to polling modification times.
+
+Editors tend to save a file in several steps (e.g. writing a temporary file,
+then renaming it), so changes are gathered up until things go quiet, and
+handed back together.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+SETTLE_SECONDS = 0.05
+"""How long things have to be quiet before changes are handed back."""
+
+# from <sys/inotify.h>:
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """Finds changes by comparing the modification times of every file.
+
+    Args:
+        roots: the directories to watch, including everything beneath them.
+        interval: how long to wait between scans, in seconds.
+    """
+
+    def __init__(self, roots: Iterable[Path], interval: float = 0.5):
+        self.roots = list(roots)
+        self.interval = interval
+        self._files = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        files = {}
+        for root in self.roots:
+            for directory, _, names in os.walk(root):
+                for name in names:
+                    path = Path(directory) / name
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def wait(self) -> Set[Path]:
+        """Blocks until something changes, returning the paths that changed."""
+        changed: Set[Path] = set()
+        while True:
+            time.sleep(self.interval)
+            files = self._scan()
+            changed.update(
+                path
+                for path in files.keys() | self._files.keys()
+                if files.get(path) != self._files.get(path)
+            )
+            self._files = files
+            # hand changes back once a scan finds nothing new:
+            if changed and files == self._scan():
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Finds changes with inotify, watching every directory beneath ``roots``.
+
+    Raises:
+        OSError: if inotify isn't available.
+    """
+
+    def __init__(self, roots: Iterable[Path]):
+        self.roots = list(roots)
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        except (AttributeError, OSError) as e:
+            raise OSError(f"inotify isn't available: {e}") from e
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: Dict[int, Path] = {}
+        try:
+            for root in self.roots:
+                self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, root: Path):
+        for directory, _, _ in os.walk(root):
+            descriptor = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), _WATCH_MASK
+            )
+            if descriptor < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    # it's already gone again:
+                    continue
+                raise OSError(error, f"can't watch '{directory}'", directory)
+            self._directories[descriptor] = Path(directory)
+
+    def _read(self) -> List[Tuple[int, int, str]]:
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((descriptor, mask, os.fsdecode(name)))
+
+    def wait(self) -> Set[Path]:
+        """Blocks until something changes, returning the paths that changed.
+
+        A changed directory (e.g. one that's been moved in) means anything
+        beneath it may have changed too. If too much happened at once for
+        inotify to keep track of, every root is returned.
+        """
+        changed: Set[Path] = set()
+        timeout = None
+        while True:
+            if not select.select([self._fd], [], [], timeout)[0]:
+                return changed
+            for descriptor, mask, name in self._read():
+                if mask & _IN_Q_OVERFLOW:
+                    changed.update(self.roots)
+                    continue
+                directory = self._directories.get(descriptor)
+                if directory is None:
+                    continue
+                if mask & _IN_IGNORED:
+                    # the directory's gone:
+                    del self._directories[descriptor]
+                    continue
+                path = directory / name if name else directory
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._watch_tree(path)
+                changed.add(path)
+            # wait for things to go quiet once something's changed:
+            timeout = SETTLE_SECONDS if changed else None
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def watch(roots: Iterable[Path], poll_interval: float = 0.5):
+    """Watches the given directories with inotify, or by polling if need be."""
+    roots = list(roots)
+    try:
+        return InotifyWatcher(roots)
+    except OSError as e:
+        logging.warning("Polling for changes, as %s", e)
+        return PollingWatcher(roots, poll_interval)
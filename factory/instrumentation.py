@@ -0,0 +1,260 @@
+"""Opt-in timing and profiling of each stage of rendering and building DAGs.
+
+When a render or a DAG factory parse is slow, this tells you where the time
+goes: the renderer and DAG builder wrap each stage of their work for each DAG
+(e.g. loading YAML, rendering templates, building operators) in ``stage()``,
+which records how long it took and how many memory blocks it left allocated,
+and the renderer times each template it renders with ``template()``.
+``report()`` then summarises the totals per stage, and the slowest DAGs,
+config files and templates.
+
+It's off unless ``DAG_FACTORY_PROFILE`` is set in the environment (or the
+renderer is given ``--profile``), and costs nothing more than a function call
+per stage while it's off. Set ``DAG_FACTORY_PROFILE_DIR`` (or pass
+``--profile-dir``) to also profile each stage with cProfile, and have its
+stats dumped there for ``python -m pstats``; the profiler's own overhead then
+inflates the timings.
+"""
+
+import cProfile
+import contextlib
+import functools
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import (
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+ENV_VAR = "DAG_FACTORY_PROFILE"
+"""Set this (to anything but an empty string) to record timings."""
+
+PROFILE_DIR_ENV_VAR = "DAG_FACTORY_PROFILE_DIR"
+"""Set this to a directory to record timings, and dump a cProfile per stage."""
+
+TOP_ENV_VAR = "DAG_FACTORY_PROFILE_TOP"
+"""How many of the slowest DAGs, config files and templates to report (default
+10)."""
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Recorder:
+    """Collects timings (and optionally profiles) for each stage of each DAG.
+
+    Args:
+        profile_dir: if given, each stage is also profiled with cProfile, and
+            its stats are dumped here by ``report()``.
+    """
+
+    def __init__(self, profile_dir: Optional[Path] = None):
+        self.profile_dir = profile_dir
+        # (stage, DAG) -> [seconds, net allocated blocks, calls]:
+        self.timings: Dict[Tuple[str, str], List[Union[float, int]]] = defaultdict(
+            lambda: [0.0, 0, 0]
+        )
+        # DAG -> the config file it came from:
+        self.sources: Dict[str, str] = {}
+        # template -> [seconds, renders]:
+        self.templates: Dict[str, List[Union[float, int]]] = defaultdict(
+            lambda: [0.0, 0]
+        )
+        self.profilers: Dict[str, cProfile.Profile] = {}
+        self.source: Optional[str] = None
+        self._profiling = False
+
+    @contextlib.contextmanager
+    def stage(self, name: str, dag: Optional[str]) -> Iterator[None]:
+        dag = dag or self.source or "unknown"
+        self.sources.setdefault(dag, self.source or dag)
+
+        # only one profiler can run at a time, so stages within stages are
+        # profiled as part of the outer one:
+        profiler = None
+        if self.profile_dir and not self._profiling:
+            if name not in self.profilers:
+                self.profilers[name] = cProfile.Profile()
+            profiler = self.profilers[name]
+            self._profiling = True
+            profiler.enable()
+
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            blocks = sys.getallocatedblocks() - blocks
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+            timing = self.timings[name, dag]
+            timing[0] += seconds
+            timing[1] += blocks
+            timing[2] += 1
+
+    @contextlib.contextmanager
+    def template(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = self.templates[name]
+            timing[0] += time.perf_counter() - start
+            timing[1] += 1
+
+    @contextlib.contextmanager
+    def working_on(self, source: str) -> Iterator[None]:
+        previous, self.source = self.source, source
+        try:
+            yield
+        finally:
+            self.source = previous
+
+    def report(self, top: int) -> str:
+        """Summarises the timings, and dumps any profiles."""
+        by_stage: Dict[str, List[Union[float, int]]] = defaultdict(lambda: [0.0, 0, 0])
+        by_dag: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for (name, dag), (seconds, blocks, calls) in self.timings.items():
+            by_stage[name][0] += seconds
+            by_stage[name][1] += blocks
+            by_stage[name][2] += calls
+            by_dag[dag][name] = seconds
+        by_source: Dict[str, float] = defaultdict(float)
+        for dag, stages in by_dag.items():
+            by_source[self.sources[dag]] += sum(stages.values())
+
+        lines = [
+            "Time per stage (stages within other stages are counted in both):",
+            f"  {'stage':<16}{'ms':>10}{'blocks':>12}{'calls':>8}",
+        ]
+        for name, (seconds, blocks, calls) in sorted(
+            by_stage.items(), key=lambda item: -item[1][0]
+        ):
+            lines.append(f"  {name:<16}{seconds * 1000:>10.1f}{blocks:>12,}{calls:>8}")
+
+        lines.append(f"Slowest {top} DAGs:")
+        for dag, stages in sorted(
+            by_dag.items(), key=lambda item: -sum(item[1].values())
+        )[:top]:
+            breakdown = ", ".join(
+                f"{name} {seconds * 1000:.1f}ms"
+                for name, seconds in sorted(stages.items(), key=lambda s: -s[1])
+            )
+            total = sum(stages.values()) * 1000
+            lines.append(f"  {total:>10.1f}ms  {dag} ({breakdown})")
+
+        if len(by_source) < len(by_dag):
+            lines.append(f"Slowest {top} config files (including every DAG in them):")
+            for source, seconds in sorted(by_source.items(), key=lambda s: -s[1])[:top]:
+                lines.append(f"  {seconds * 1000:>10.1f}ms  {source}")
+
+        if self.templates:
+            lines.append(
+                f"Slowest {top} templates (including the templates they include):"
+            )
+            for name, (seconds, renders) in sorted(
+                self.templates.items(), key=lambda item: -item[1][0]
+            )[:top]:
+                lines.append(
+                    f"  {seconds * 1000:>10.1f}ms  {name} ({renders} render(s))"
+                )
+
+        if self.profilers:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            for name, profiler in self.profilers.items():
+                path = self.profile_dir / f"{name}.{os.getpid()}.pstats"
+                profiler.dump_stats(path)
+            lines.append(f"Profiles for each stage are in {self.profile_dir}")
+        return "\n".join(lines)
+
+
+_recorder: Optional[Recorder] = None
+
+
+def enable(profile_dir: Optional[Path] = None):
+    """Starts recording timings in this process, if it isn't already."""
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder(profile_dir)
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def stage(name: str, dag: Optional[Union[str, Path]] = None) -> ContextManager:
+    """Times the code in this context as a stage of building ``dag``.
+
+    Args:
+        name: the stage, e.g. ``render``.
+        dag: what's being built, e.g. its config file. Defaults to the config
+            file given to ``working_on()``.
+    """
+    if _recorder is None:
+        return _DISABLED
+    return _recorder.stage(name, dag and str(dag))
+
+
+def timed(name: str, func: Callable) -> Callable:
+    """Wraps ``func`` so every call to it is timed as the stage ``name``.
+
+    This is for code that's called from deep within another stage, e.g. YAML
+    constructors, whose time would otherwise be lost in that stage's.
+    """
+
+    @functools.wraps(func)
+    def _timed(*args, **kwargs):
+        with stage(name):
+            return func(*args, **kwargs)
+
+    return _timed
+
+
+def template(name: str) -> ContextManager:
+    """Times the code in this context as rendering the template ``name``."""
+    if _recorder is None:
+        return _DISABLED
+    return _recorder.template(name)
+
+
+def working_on(source: Union[str, Path]) -> ContextManager:
+    """Notes the config file DAGs in this context come from.
+
+    Multi-DAG files build several DAGs, so this lets their timings be added up
+    for the file too.
+    """
+    if _recorder is None:
+        return _DISABLED
+    return _recorder.working_on(str(source))
+
+
+def report(top: Optional[int] = None) -> Optional[str]:
+    """Summarises everything recorded so far, and starts recording afresh.
+
+    Returns:
+        The summary, or None if nothing's being recorded.
+    """
+    global _recorder
+    if _recorder is None:
+        return None
+    if top is None:
+        top = int(os.environ.get(TOP_ENV_VAR) or 10)
+    summary = _recorder.report(top)
+    _recorder = Recorder(_recorder.profile_dir)
+    return summary
+
+
+if os.environ.get(PROFILE_DIR_ENV_VAR):
+    enable(Path(os.environ[PROFILE_DIR_ENV_VAR]))
+elif os.environ.get(ENV_VAR):
+    enable()
@@ -0,0 +1,202 @@
+"""Expands multi-DAG config files into a config per DAG.
+
+A multi-DAG file is a templated config, then a ``#!multi`` separator, then a
+``_for_each`` list of values. Each entry becomes a DAG of its own, with its
+values filling in ``${each.<key>}`` placeholders in the template.
+"""
+
+import io
+from pathlib import Path
+from typing import Dict
+
+import yaml
+import yaml_io
+from placeholders import fill_placeholders, placeholder_values
+
+
+def replace_values(template: str, values: dict, prefix: str) -> str:
+    """Replaces placeholder values from a template string.
+
+    If null values are given, we insert an empty string in place of the placeholder.
+
+    Args:
+        template: the string to replace values within
+        values: key/value dictionary of replacement items
+        prefix: the identifier used for placeholder replacement, e.g. if a
+                template contains ``${each.id}``, the prefix is ``each``.
+
+    Returns:
+        The template string with all placeholder values replaced.
+    """
+    if len(values) == 0:
+        return template
+
+    return fill_placeholders(template, placeholder_values(values), prefix)
+
+
+class MultiDagTemplate:
+    """The templated half of a multi-DAG file, parsed once into a node tree.
+
+    Since our constructors might do stuff like try and find files on the
+    filesystem, we can't just load the full multi-DAG definition up front
+    (as we might have stuff like ``${each.value}`` in there). Instead, we
+    compose (but don't construct) the templated half once, and note which
+    scalars hold placeholders. Each instance then only re-composes those
+    scalars from their original source text with the placeholders swapped
+    in, so quoting and implicit typing behave exactly as if the whole file
+    had been substituted and re-parsed, before constructing the instance from
+    the tree. Templates that aren't valid YAML until they're substituted are
+    still substituted as text, but parsed in memory.
+
+    Args:
+        yaml_file: path to the multi-DAG file.
+        text: the raw contents of ``yaml_file``.
+    """
+
+    def __init__(self, yaml_file: Path, text: str):
+        # the parser skips a byte order mark, so its marks would be out by one:
+        parts = text.lstrip("\ufeff").split("#!multi")
+        self.yaml_file = yaml_file
+        self._source = parts[0]
+        # iterables come after the #!multi separator, so grab them on their own:
+        self.iterables = yaml_io.full_load(self._stream(parts[1]))["_for_each"]
+
+        # ids of every node that has a placeholder in it, or beneath it:
+        self._templated = set()
+        loader = yaml_io.FullLoader(self._stream(self._source))
+        try:
+            self._root = loader.get_single_node()
+            self._find_placeholders(self._root, set())
+        except yaml.YAMLError:
+            # placeholders aren't always valid YAML until they're filled in
+            # (e.g. ``[${each.id}]``), so fall back to substituting the text:
+            self._root = None
+        finally:
+            loader.dispose()
+        # instances are all constructed by the same loader:
+        self._loader = yaml_io.FullLoader(self._stream(""))
+
+    def construct(self, config: dict) -> dict:
+        """Constructs a single instance, filling placeholders from ``config``."""
+        if self._root is None:
+            return yaml_io.full_load(
+                self._stream(replace_values(self._source, config, "each"))
+            )
+
+        root = self._substitute(self._root, placeholder_values(config), {})
+        try:
+            return self._loader.construct_document(root)
+        except Exception:
+            # don't reuse a loader that's been left part way through:
+            self._loader = yaml_io.FullLoader(self._stream(""))
+            raise
+
+    def _stream(self, text: str) -> io.StringIO:
+        stream = io.StringIO(text)
+        # loaders take their name from the stream, and constructors may use it
+        # to find files relative to the config, so point it at the real file:
+        stream.name = str(self.yaml_file)
+        return stream
+
+    def _find_placeholders(self, node: yaml.Node, seen: set) -> bool:
+        if id(node) in seen:
+            # aliases point back to nodes we've already visited:
+            return id(node) in self._templated
+        seen.add(id(node))
+
+        if isinstance(node, yaml.ScalarNode):
+            templated = "${each." in node.value
+        elif isinstance(node, yaml.SequenceNode):
+            templated = any(
+                [self._find_placeholders(item, seen) for item in node.value]
+            )
+        else:
+            templated = any(
+                [
+                    self._find_placeholders(child, seen)
+                    for pair in node.value
+                    for child in pair
+                ]
+            )
+
+        if templated:
+            self._templated.add(id(node))
+        return templated
+
+    def _substitute(
+        self, node: yaml.Node, replacements: Dict[str, str], memo: dict
+    ) -> yaml.Node:
+        """Returns a copy of ``node`` with placeholders filled in.
+
+        Nodes without any placeholders beneath them are shared, not copied.
+        """
+        if id(node) not in self._templated:
+            return node
+        if id(node) in memo:
+            return memo[id(node)]
+
+        if isinstance(node, yaml.ScalarNode):
+            new_node = self._substitute_scalar(node, replacements)
+        elif isinstance(node, yaml.SequenceNode):
+            new_node = yaml.SequenceNode(
+                node.tag,
+                [self._substitute(item, replacements, memo) for item in node.value],
+                node.start_mark,
+                node.end_mark,
+                node.flow_style,
+            )
+        else:
+            new_node = yaml.MappingNode(
+                node.tag,
+                [
+                    (
+                        self._substitute(key, replacements, memo),
+                        self._substitute(value, replacements, memo),
+                    )
+                    for key, value in node.value
+                ],
+                node.start_mark,
+                node.end_mark,
+                node.flow_style,
+            )
+
+        memo[id(node)] = new_node
+        return new_node
+
+    def _substitute_scalar(
+        self, node: yaml.ScalarNode, replacements: Dict[str, str]
+    ) -> yaml.Node:
+        """Re-composes a scalar from its source text with placeholders filled in.
+
+        Values are read as YAML, as they would be if the whole file had been
+        substituted: unquoted JSON lists and dicts become lists and dicts, for
+        instance. Values that would've broken the file's structure (i.e. that
+        read as block mappings or lists, or add line breaks outside quotes)
+        are rejected, rather than becoming a structure of their own.
+        """
+        source = self._source[node.start_mark.index : node.end_mark.index]
+        filled = fill_placeholders(source, replacements, "each")
+        line = node.start_mark.line + 1
+        try:
+            new_node = yaml_io.compose(self._stream(filled))
+        except yaml.YAMLError as e:
+            raise ValueError(
+                f"Filling in {source!r} on line {line} of '{self.yaml_file}' "
+                f"gives invalid YAML: {getattr(e, 'problem', None) or e}"
+            ) from e
+
+        if new_node is None:
+            # the placeholder was all there was, and it was filled with nothing:
+            return yaml.ScalarNode(
+                "tag:yaml.org,2002:null", "", node.start_mark, node.end_mark
+            )
+        quoted = isinstance(new_node, yaml.ScalarNode) and new_node.style in ("'", '"')
+        if (isinstance(new_node, yaml.CollectionNode) and not new_node.flow_style) or (
+            filled.count("\n") > source.count("\n") and not quoted
+        ):
+            raise ValueError(
+                f"Filling in {source!r} on line {line} of '{self.yaml_file}' "
+                f"with {filled!r} doesn't give a single value; quote the "
+                "placeholder if its values have ': ', '- ' or line breaks in them"
+            )
+        return new_node
@@ -0,0 +1,173 @@
+"""Compiled substitution of ``${prefix.key}`` placeholders.
+
+Templates are tokenised once into literal text and placeholder segments, and
+the compiled form is cached, so filling a template is a single pass over its
+segments rather than one full-string replace per value.
+"""
+
+import copy
+import functools
+import io
+import json
+import re
+from typing import Any, Dict, NamedTuple, Tuple, Union
+
+import yaml
+import yaml_io
+
+
+class Placeholder(NamedTuple):
+    """A ``${prefix.key}`` placeholder within a compiled template."""
+
+    key: str
+    text: str
+    """The placeholder as written, which is kept when there's no value for it."""
+
+
+CompiledTemplate = Tuple[Union[str, Placeholder], ...]
+"""A template split into its literal text and the placeholders between it."""
+
+_EMITTER = yaml.emitter.Emitter(io.StringIO())
+"""Only used to ask how PyYAML would emit a given string, never to write."""
+
+
+@functools.lru_cache(maxsize=None)
+def _placeholder_pattern(prefix: str) -> re.Pattern:
+    return re.compile(r"\$\{" + re.escape(prefix) + r"\.([^}]*)\}")
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_placeholders(template: str, prefix: str) -> CompiledTemplate:
+    """Splits a template into literal text and ``${prefix.key}`` placeholders."""
+    segments = []
+    position = 0
+    for match in _placeholder_pattern(prefix).finditer(template):
+        if match.start() > position:
+            segments.append(template[position : match.start()])
+        segments.append(Placeholder(match.group(1), match.group(0)))
+        position = match.end()
+    if position < len(template):
+        segments.append(template[position:])
+    return tuple(segments)
+
+
+def placeholder_values(values: dict) -> Dict[str, str]:
+    """Converts replacement values to the text we insert for them.
+
+    Falsy values become an empty string, dicts and lists are inserted as JSON,
+    and ints are converted to strings. Anything else is inserted as-is.
+    """
+    replacements = {}
+    for key, value in values.items():
+        if not value:
+            replacement = ""
+        elif isinstance(value, (dict, list)):
+            replacement = json.dumps(value, sort_keys=False)
+        elif isinstance(value, int):
+            replacement = str(value)
+        else:
+            replacement = value
+        # if two keys look the same once formatted, the first one wins:
+        replacements.setdefault(f"{key}", replacement)
+    return replacements
+
+
+def fill_placeholders(template: str, replacements: Dict[str, str], prefix: str) -> str:
+    """Fills a template's placeholders in a single pass.
+
+    Placeholders without a replacement are left as they are. Unlike repeated
+    string replacement, placeholders that appear in inserted values are never
+    filled in themselves.
+
+    Args:
+        template: the string to replace values within
+        replacements: placeholder keys mapped to their text, as returned by
+            ``placeholder_values()``
+        prefix: the identifier used for placeholder replacement, e.g. if a
+                template contains ``${each.id}``, the prefix is ``each``.
+    """
+    if "${" not in template:
+        return template
+
+    return "".join(
+        [
+            (
+                segment
+                if segment.__class__ is str
+                else replacements.get(segment.key, segment.text)
+            )
+            for segment in compile_placeholders(template, prefix)
+        ]
+    )
+
+
+def fill_structure(obj: Any, replacements: Dict[str, str], prefix: str) -> Any:
+    """Fills placeholders throughout a parsed YAML structure.
+
+    This returns a new structure, leaving ``obj`` untouched, and reads values
+    as if ``obj`` were dumped to YAML, its placeholders filled as text and the
+    result loaded again. That means strings PyYAML would dump unquoted are
+    re-read as YAML once filled (so ``${prefix.count}`` can become an int),
+    while strings it would quote stay as strings. Only plain values are read
+    this way, though; see ``_load_plain()``.
+    """
+    if isinstance(obj, str):
+        filled = fill_placeholders(obj, replacements, prefix)
+        if filled is obj or filled == obj:
+            return obj
+        if not _dumps_plain(obj):
+            return filled
+        loaded = _load_plain(filled)
+        # loads are cached, so don't hand out shared containers:
+        return copy.deepcopy(loaded) if isinstance(loaded, (dict, list)) else loaded
+    if isinstance(obj, dict):
+        return {
+            fill_structure(key, replacements, prefix): fill_structure(
+                value, replacements, prefix
+            )
+            for key, value in obj.items()
+        }
+    if isinstance(obj, list):
+        return [fill_structure(item, replacements, prefix) for item in obj]
+    return obj
+
+
+def has_placeholders(obj: Any, prefix: str) -> bool:
+    """Whether any string in a parsed YAML structure has a ``${prefix.`` in it."""
+    if isinstance(obj, str):
+        return f"${{{prefix}." in obj
+    if isinstance(obj, dict):
+        return any(
+            has_placeholders(key, prefix) or has_placeholders(value, prefix)
+            for key, value in obj.items()
+        )
+    if isinstance(obj, list):
+        return any(has_placeholders(item, prefix) for item in obj)
+    return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _dumps_plain(text: str) -> bool:
+    """Whether ``yaml.dump`` would write this string without quotes."""
+    analysis = _EMITTER.analyze_scalar(text)
+    return analysis.allow_block_plain and not analysis.multiline
+
+
+@functools.lru_cache(maxsize=4096)
+def _load_plain(text: str) -> Any:
+    """Reads an unquoted YAML scalar, as it would be read in a document.
+
+    Only plain values are read: nulls, bools, numbers, strings, and flow lists
+    and dicts (i.e. values inserted as JSON). Anything else stays as the text
+    it was filled with, rather than quietly becoming something else, e.g. a
+    date, or a mapping from a value like ``a: b``.
+    """
+    try:
+        loaded = yaml_io.safe_load(text)
+    except yaml.YAMLError:
+        return text
+    if loaded is None or isinstance(loaded, (str, int, float, bool)):
+        return loaded
+    if isinstance(loaded, (dict, list)) and text.lstrip()[:1] in ("{", "["):
+        return loaded
+    return text
@@ -1,15 +1,32 @@
 #! /usr/bin/env python
 
-import json
+import argparse
+import functools
 import logging
-import os
-import tempfile
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import instrumentation
 import yaml
+import yaml_io
 from actions_toolkit import core
+from changed_files import changed_sources, read_changed_files
+from config_tree import ConfigTree
+from config_writer import write_if_changed, write_index
 from constructors import CUSTOM_CONSTRUCTORS
-from jinja2 import Environment, FileSystemLoader, Template
+from dag_index import DagIndex
+from dag_shards import Shard, shard_module, shard_modules
+from render_manifest import RenderManifest, fingerprint_constructors
+from render_watch import watch
+from renderer import (
+    RenderContext,
+    RenderJob,
+    SourceState,
+    plan_jobs,
+    render_jobs,
+    validate_rendered_config,
+)
+from template_env import build_environment, precompile_templates, template_source
 
 ROOT = Path(__file__).parent.parent
 """This is the root directory of this repository.
@@ -18,205 +35,286 @@ We store this so we can manage files without using hard-coded paths, and not
 worry about where this module is called from.
 """
 
+RENDERED_CONFIGS = ROOT / "factory" / "rendered_configs"
+"""Where fully rendered DAG configs are written, ready for the DAG factory."""
 
-def main():
+MANIFEST_PATH = RENDERED_CONFIGS / ".render_manifest.json"
+"""Records what each rendered config was built from, for incremental renders."""
+
+BYTECODE_CACHE_DIR = ROOT / ".jinja_cache"
+"""Where compiled templates are cached between runs, unless told otherwise."""
+
+
+def main(argv: Optional[List[str]] = None):
     """
     Function takes in all the initial config files and writes out fully rendered DAG YAML configs
     using the jinja2 templates.
 
     Args:
-        dir: directory where all the dag configs exist
+        argv: command line arguments, defaulting to ``sys.argv``. Pass
+            ``--incremental`` to only re-render configs whose inputs changed
+            since the last run, and prune outputs whose source was deleted.
+            Pass ``--changed-files FILE`` to only re-render the DAGs affected
+            by the files listed in ``FILE`` (e.g. by ``git diff --name-only``),
+            going by the templates each DAG used last time it was rendered.
+            Pass ``--jobs N`` to render across ``N`` worker processes, and
+            ``--watch`` to keep re-rendering DAGs as their inputs change.
+            Pass ``--shards N`` to have ``N`` DAG factory entry modules
+            build the DAGs between them. See ``_parse_args()`` for options
+            controlling template compilation.
     """
-
-    for k, v in CUSTOM_CONSTRUCTORS.items():
-        yaml.FullLoader.add_constructor(k, v)
-
-    # Load templates file from templates folder
-    env = Environment(
-        loader=FileSystemLoader(["./templates", "../*"]),
-        trim_blocks=True,
-        lstrip_blocks=True,
-        extensions=["jinja2.ext.do"],
+    args = _parse_args(argv)
+    bytecode_cache_dir = None if args.no_bytecode_cache else args.bytecode_cache
+
+    if args.precompile:
+        precompile_templates(build_environment(), args.precompile)
+        return
+
+    if args.profile or args.profile_dir:
+        instrumentation.enable(args.profile_dir)
+    if instrumentation.enabled() and args.jobs > 1:
+        # timings are recorded per process, so keep them all in this one:
+        logging.warning("Ignoring --jobs, as rendering is being profiled")
+        args.jobs = 1
+
+    if args.watch:
+        # everything's rendered up front, so we know what each DAG uses:
+        if args.incremental:
+            logging.warning("Ignoring --incremental, as --watch renders everything")
+            args.incremental = False
+        if args.changed_files:
+            logging.warning("Ignoring --changed-files, as --watch renders everything")
+            args.changed_files = None
+        if args.compiled_templates:
+            logging.warning("Ignoring --compiled-templates, as they can't be reloaded")
+            args.compiled_templates = None
+
+    configs = ConfigTree(ROOT / "dag_configs", RENDERED_CONFIGS)
+    context = RenderContext(
+        configs, bytecode_cache_dir, args.compiled_templates, keep_configs=args.watch
+    )
+    env = context.environment
+
+    manifest = RenderManifest.load(
+        MANIFEST_PATH,
+        source_root=configs.config_root,
+        output_root=RENDERED_CONFIGS,
+        fingerprint=fingerprint_constructors(CUSTOM_CONSTRUCTORS),
+        template_source=functools.partial(template_source, env.source_loader),
     )
-    template = env.get_template("base.j2")
 
-    errors_encountered = False
+    yaml_files = configs.scan()
+    affected = None
+    if args.changed_files:
+        affected = changed_sources(
+            read_changed_files(args.changed_files, ROOT),
+            manifest.previous_sources(),
+            yaml_files,
+            env,
+            configs,
+        )
 
-    for yaml_file in (ROOT / "dag_configs").glob("**/*.y*ml"):
-        values = None
-
-        if "#!multi" in yaml_file.read_text():
-            errors_encountered = render_multi_dag(
-                yaml_file, template, errors_encountered
-            )
-            continue  # all iterables sorted; move onto the next yaml file
-
-        try:
-            with yaml_file.open() as r:
-                values = yaml.full_load(r)
-        except Exception as e:
-            logging.exception("Error opening yaml '%s': %s", yaml_file, e)
-            errors_encountered = True
+    errors_encountered = False
+    skipped = 0
+    # source file -> (hash, rendered files, whether it failed, templates and
+    # other files used):
+    sources: Dict[Path, SourceState] = {}
+    jobs: List[RenderJob] = []
+    # rendered file -> (its contents, the config loaded from it):
+    indexed: Dict[Path, Tuple[bytes, dict]] = {}
+
+    for yaml_file in yaml_files:
+        if affected is not None and yaml_file not in affected:
+            manifest.keep(yaml_file)
+            skipped += 1
             continue
 
-        if not values:
-            logging.exception("Config values is empty...")
+        source = yaml_file.read_bytes()
+        digest = manifest.digest(
+            yaml_file, source, configs.directory(yaml_file.parent).docs
+        )
+        if args.incremental and manifest.is_current(yaml_file, digest):
+            manifest.keep(yaml_file)
+            skipped += 1
             continue
 
-            # don't render configs if they've been disabled:
-        if values.get("_do_not_render"):
-            logging.info("Skipping config as '_do_not_render' is set: %s", yaml_file)
-            continue
+        sources[yaml_file] = (digest, [], [False], set(), set())
+        planned = plan_jobs(context, yaml_file, source.decode("utf-8"))
+        if planned is None:
+            sources[yaml_file][2][0] = True
+        else:
+            jobs.extend(planned)
+
+    # anything skipped keeps its rendered configs:
+    render_jobs(context, jobs, sources, indexed, args.jobs, manifest.outputs())
 
-        errors_encountered = render_single_dag(
-            values, yaml_file, template, errors_encountered
+    for yaml_file, (digest, outputs, failed, templates, files) in sources.items():
+        errors_encountered = errors_encountered or failed[0]
+        manifest.record(
+            yaml_file, None if failed[0] else digest, outputs, templates, files
         )
 
+    if args.incremental or affected is not None:
+        logging.info("Skipped %d unchanged config(s)", skipped)
+    # anything rendered last time from a config that's gone goes too:
+    manifest.prune()
+    manifest.save()
+    _write_dag_index(manifest.outputs(), indexed)
+    _write_shard_modules(args.shards)
+
+    if summary := instrumentation.report(args.profile_top):
+        print(summary)
+
+    if errors_encountered:
+        core.set_failed("Error rendering dag config")
+
+    if args.watch:
+        watch(
+            context,
+            manifest,
+            sources,
+            indexed,
+            args.jobs,
+            args.poll_interval,
+            args.profile_top,
+        )
 
-def replace_values(template: str, values: dict, prefix: str) -> str:
-    """Replaces placeholder values from a template string.
 
-    If null values are given, we insert an empty string in place of the placeholder.
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Renders DAG configs from templates.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only re-render configs whose inputs changed since the last run",
+    )
+    parser.add_argument(
+        "--changed-files",
+        type=Path,
+        metavar="FILE",
+        help="only re-render DAGs affected by the files listed in FILE (one per "
+        "line, relative to the repository root, e.g. from 'git diff --name-only'); "
+        "pass - to read them from stdin",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes to render with (default: 1)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        metavar="N",
+        help="split DAGs between N DAG factory entry modules, so Airflow can "
+        "parse them in parallel (default: 1, i.e. just the DAG factory)",
+    )
+    parser.add_argument(
+        "--bytecode-cache",
+        type=Path,
+        default=BYTECODE_CACHE_DIR,
+        metavar="DIR",
+        help="where to cache compiled templates between runs",
+    )
+    parser.add_argument(
+        "--no-bytecode-cache",
+        action="store_true",
+        help="don't cache compiled templates between runs",
+    )
+    parser.add_argument(
+        "--compiled-templates",
+        type=Path,
+        metavar="DIR",
+        help="render with templates precompiled by --precompile, if up to date",
+    )
+    parser.add_argument(
+        "--precompile",
+        type=Path,
+        metavar="DIR",
+        help="compile every template into DIR, then exit without rendering",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running, re-rendering DAGs as their configs or templates change",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="how often --watch checks for changes, if it can't use inotify",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each stage of rendering each DAG, and report the slowest",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        metavar="DIR",
+        help="as --profile, and also dump a cProfile of each stage into DIR",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        metavar="N",
+        help="how many of the slowest DAGs and templates to report (default: 10)",
+    )
+    args = parser.parse_args(argv)
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    return args
 
-    Args:
-        template: the string to replace values within
-        values: key/value dictionary of replacement items
-        prefix: the identifier used for placeholder replacement, e.g. if a
-                template contains ``${each.id}``, the prefix is ``each``.
 
-    Returns:
-        The template string with all placeholder values replaced.
+def _write_dag_index(outputs: Iterable[Path], indexed: Dict[Path, Tuple[bytes, dict]]):
+    """Indexes every valid rendered config for the DAG factory.
+
+    Configs rendered this run are indexed straight from memory. Anything else
+    (i.e. skipped by an incremental run) is reused from the previous index if
+    it's unchanged, and loaded from its YAML otherwise.
     """
-    if len(values) == 0:
-        return template
-
-    for key, value in values.items():
-        if not value:
-            replacement = ""
-        elif isinstance(value, (dict, list)):
-            replacement = json.dumps(value, sort_keys=False)
-        elif isinstance(value, int):
-            replacement = str(value)
+    previous = DagIndex.load(RENDERED_CONFIGS)
+    configs = []
+    for output_file in sorted(outputs):
+        if output_file in indexed:
+            source, config = indexed[output_file]
+        elif output_file.exists():
+            source = output_file.read_bytes()
+            config = previous.config_for(output_file, source) if previous else None
+            if config is None:
+                try:
+                    config = yaml_io.safe_load(source)
+                except yaml.YAMLError:
+                    continue
+                if validate_rendered_config(config):
+                    continue
         else:
-            replacement = value
-        template = template.replace(f"${{{prefix}.{key}}}", replacement)
-
-    return template
-
+            continue
+        configs.append((output_file, source, config))
+    write_index(RENDERED_CONFIGS, configs)
 
-def render_multi_dag(
-    yaml_file: Path, template: Template, errors_encountered: bool
-) -> bool:
-    """Renders multiple DAGs from a single file.
 
-    Since our constructors might do stuff like try and find files on the
-    filesystem, we can't just load the full multi-DAG definition up front
-    (as we might have stuff like ``${each.value}`` in there). This function
-    handles that by splitting the raw file test on an identifier, then loading
-    just the iterative half so we can do string replacement on the templated
-    half later.
+def _write_shard_modules(shards: int):
+    """Writes an entry module per shard alongside the DAG factory.
 
-    After that, this is effectively a wrapper for ``render_single_dag()``.
+    Modules are only rewritten if they've changed, so Airflow doesn't reparse
+    them. Any left over from a different number of shards are removed, as are
+    all of them if there's only one shard (i.e. the DAG factory builds every
+    DAG itself).
     """
-    parts = yaml_file.read_text().split("#!multi")
-    # iterables come after the #!multi separator, so grab them on their own:
-    iterables = yaml.full_load(parts[1])
-
-    for config in iterables["_for_each"]:
-        # reset template:
-        conf = parts[0]
-        # then overwrite values in the template:
-        conf = replace_values(conf, config, "each")
-        # now load and render the templated instance:
-        with tempfile.NamedTemporaryFile(
-            dir=yaml_file.parent, delete=False
-        ) as temp_file:
-            temp_file.write(bytes(conf, encoding="utf-8"))
-
-        with open(temp_file.name, "r") as file:
-            single_config = yaml.full_load(file)
-
-        os.remove(temp_file.name)
-
-        errors_encountered = render_single_dag(
-            single_config,
-            yaml_file.parent / single_config["dag_id"],
-            template,
-            errors_encountered,
-        )
-    return errors_encountered
-
-
-def render_single_dag(
-    values: dict, yaml_file: Path, template: Template, errors_encountered: bool
-) -> bool:
-    """Renders a single DAG from a yaml file."""
-    doc_name = yaml_file.stem + ".md"
-    docs_path = yaml_file.parent / doc_name
-    if os.path.exists(docs_path):
-        with open(docs_path, "r") as f:
-            docs = f.read()
-
-            values["documentation"] = docs
-
-    # grab the directory structure between 'dag_configs' and this file so we
-    # can use it for setting owners/tags:
-    domain_folder_path_parts = yaml_file.parent.relative_to(ROOT / "dag_configs").parts
-    # we set the top-level domain folder name as the owner of the DAG:
-    values["owner"] = domain_folder_path_parts[0]
-
-    # tidy the format of any tags provided in the config so we're consistent:
-    domain_tags = [dir.replace("_", " ").lower() for dir in domain_folder_path_parts]
-    config_tags = [tag.replace("_", " ").lower() for tag in values.get("tags", [])]
-    # then take a sorted final set to avoid any duplication:
-    values["tags"] = sorted(set(domain_tags + config_tags))
-
-    if "${value_set." in yaml.dump(values, sort_keys=False):
-        new_task_list = []
-        for task_spec in values["tasks"]:
-            if not task_spec.get("workflow_description"):
-                # pass normal tasks straight through:
-                new_task_list.append(task_spec)
-            else:
-                # parse workflows out into multiple new tasks:
-                for value_dict in task_spec["value_set"]:
-                    for task_template in task_spec["task_set"]:
-                        # dump task spec to string to simplify value replacement:
-                        new_task = yaml.dump(task_template, sort_keys=False)
-                        new_task = replace_values(new_task, value_dict, "value_set")
-                        new_task = yaml.full_load(new_task)
-                        new_task_list.append(new_task)
-        # now replace the task list with our newly populated one:
-        values["tasks"] = new_task_list
-
-    try:
-        rendered = template.render(values)
-        loaded = yaml.safe_load(rendered)
-        if loaded.get("tasks"):
-            if isinstance(loaded.get("tasks"), dict):
-                logging.error("Tasks is of type dict not list.")
-                errors_encountered = True
-        if len(loaded.get("tasks", [])) == 0:
-            logging.error("No tasks for rendered config")
-            errors_encountered = True
-        # Write out fully rendered YAML to new location with full file naming convention
-        new_path = (
-            ROOT / "factory" / "rendered_configs" / "/".join(domain_folder_path_parts)
-        )
-        if not new_path.exists() and not new_path.is_dir():
-            new_path.mkdir(parents=True, exist_ok=True)
-        with (new_path / f"{values['dag_id']}.yaml").open(mode="w") as f:
-            f.write(rendered)
-
-    except Exception as e:
-        logging.error("Error rendering dag config for '%s': %s", yaml_file, e)
-        errors_encountered = True
-
-    finally:
-        if errors_encountered:
-            core.set_failed("Error rendering dag config")
-
-    return errors_encountered
+    factory_dir = RENDERED_CONFIGS.parent
+
+    modules = []
+    if shards > 1:
+        for index in range(shards):
+            module, source = shard_module(factory_dir, Shard(index, shards))
+            write_if_changed(module, source.encode("utf-8"))
+            modules.append(module)
+    for module in set(shard_modules(factory_dir)) - set(modules):
+        module.unlink()
+        logging.info("Removed shard module: %s", module)
 
 
 if __name__ == "__main__":
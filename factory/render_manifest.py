@@ -0,0 +1,306 @@
+"""Tracks what each rendered DAG config was built from.
+
+The manifest lets ``render_configs.py`` skip DAGs whose inputs haven't changed
+since the last run, and prune rendered configs whose source has been deleted.
+Each source config is keyed by a hash of everything that feeds into its
+rendered output(s): the raw YAML, any sibling documentation, the custom YAML
+constructors and any files they read, and the templates its DAGs loaded.
+
+Templates are hashed per source, going by which templates its DAGs actually
+loaded when they were rendered (``base.j2`` picks them by task type), so
+changing a template only re-renders the DAGs that use it. That record also
+lets ``render_configs.py --changed-files`` re-render just the DAGs that use a
+template, rather than everything.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+from typing import (
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from config_writer import write_if_changed
+
+MANIFEST_VERSION = 3
+"""Bump this whenever the manifest layout or hashing scheme changes, so stale
+manifests get thrown away rather than misread."""
+
+
+def fingerprint_constructors(constructors: Dict[str, Callable]) -> str:
+    """Hashes the registered YAML tags and the source of their constructors."""
+    digest = hashlib.sha256()
+    for tag in sorted(constructors):
+        digest.update(tag.encode("utf-8"))
+        digest.update(b"\0")
+        try:
+            digest.update(inspect.getsource(constructors[tag]).encode("utf-8"))
+        except (OSError, TypeError):
+            # built-ins or dynamically created callables have no source to hash:
+            digest.update(repr(constructors[tag]).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SourceRecord(NamedTuple):
+    """What was rendered from a source config last time."""
+
+    failed: bool
+    """Whether rendering it failed."""
+    outputs: List[Path]
+    """The rendered configs it produced."""
+    templates: Set[str]
+    """The name of every template its DAGs loaded."""
+
+
+class RenderManifest:
+    """On-disk record of source configs and the rendered files they produced.
+
+    Args:
+        path: where the manifest is stored.
+        source_root: directory that source config paths are relative to.
+        output_root: directory that rendered config paths are relative to.
+        fingerprint: combined hash of the inputs shared by every DAG (i.e.
+            the constructors); a change here invalidates everything.
+        template_source: looks up a template's source by name, returning None
+            if there's no such template.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        source_root: Path,
+        output_root: Path,
+        fingerprint: str,
+        template_source: Callable[[str], Optional[str]],
+    ):
+        self.path = path
+        self.source_root = source_root
+        self.output_root = output_root
+        self.fingerprint = fingerprint
+        self.template_source = template_source
+        self._previous: Dict[str, Dict] = {}
+        self._current: Dict[str, Dict] = {}
+        # what each template and file read held when first hashed:
+        self._hashes: Dict[Tuple[str, str], bytes] = {}
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        source_root: Path,
+        output_root: Path,
+        fingerprint: str,
+        template_source: Callable[[str], Optional[str]],
+    ) -> "RenderManifest":
+        """Reads an existing manifest, starting afresh if it's missing or unusable."""
+        manifest = cls(path, source_root, output_root, fingerprint, template_source)
+        if not path.exists():
+            return manifest
+
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable render manifest '%s': %s", path, e)
+            return manifest
+
+        if data.get("version") == MANIFEST_VERSION:
+            manifest._previous = data.get("sources", {})
+        return manifest
+
+    def source_key(self, yaml_file: Path) -> str:
+        return yaml_file.relative_to(self.source_root).as_posix()
+
+    def digest(
+        self,
+        yaml_file: Path,
+        source: Optional[bytes] = None,
+        docs: Optional[Collection[str]] = None,
+    ) -> str:
+        """Hashes a source config together with its docs and the constructors.
+
+        Pass the config's raw ``source`` if it's already been read, and the
+        names (without ``.md``) of the ``docs`` alongside it if they're
+        already known, to save looking for them again.
+
+        The templates and files it used are only known once it's rendered, so
+        they're added to this by ``is_current()`` and ``record()``.
+        """
+        digest = hashlib.sha256(self.fingerprint.encode("utf-8"))
+        digest.update(yaml_file.read_bytes() if source is None else source)
+
+        # docs are looked up by DAG id, which for multi-DAG files is only known
+        # once rendered, so include docs for every output we produced last time:
+        doc_stems = {yaml_file.stem}
+        for output in self._previous.get(self.source_key(yaml_file), {}).get(
+            "outputs", []
+        ):
+            doc_stems.add(Path(output).stem)
+        for stem in sorted(doc_stems):
+            docs_path = yaml_file.parent / f"{stem}.md"
+            if docs is not None:
+                exists = stem in docs
+            else:
+                exists = docs_path.exists()
+            if exists:
+                digest.update(stem.encode("utf-8"))
+                digest.update(docs_path.read_bytes())
+        return digest.hexdigest()
+
+    def _with_dependencies(
+        self, digest: str, templates: Iterable[str], files: Iterable[str]
+    ) -> str:
+        """Adds what the templates and files a source used hold to its digest.
+
+        Files are given relative to ``source_root``.
+        """
+        combined = hashlib.sha256(digest.encode("utf-8"))
+        for kind, names in (("template", templates), ("file", files)):
+            for name in sorted(names):
+                combined.update(f"{kind}:{name}".encode("utf-8"))
+                combined.update(b"\0")
+                combined.update(self._hash(kind, name))
+        return combined.hexdigest()
+
+    def _hash(self, kind: str, name: str) -> bytes:
+        if (kind, name) not in self._hashes:
+            if kind == "template":
+                source = self.template_source(name)
+                content = None if source is None else source.encode("utf-8")
+            else:
+                try:
+                    content = (self.source_root / name).read_bytes()
+                except OSError:
+                    content = None
+            self._hashes[kind, name] = (
+                b"missing" if content is None else hashlib.sha256(content).digest()
+            )
+        return self._hashes[kind, name]
+
+    def refresh(self):
+        """Forgets what templates and files held, after some have changed."""
+        self._hashes.clear()
+
+    def is_current(self, yaml_file: Path, digest: str) -> bool:
+        """Whether a source config's outputs are already up to date on disk."""
+        entry = self._previous.get(self.source_key(yaml_file))
+        if not entry or not entry["hash"]:
+            return False
+        if entry["hash"] != self._with_dependencies(
+            digest, entry["templates"], entry["files"]
+        ):
+            return False
+        return all((self.output_root / output).exists() for output in entry["outputs"])
+
+    def keep(self, yaml_file: Path):
+        """Carries an unchanged source's entry over into the new manifest."""
+        key = self.source_key(yaml_file)
+        self._current[key] = self._previous[key]
+
+    def record(
+        self,
+        yaml_file: Path,
+        digest: Optional[str],
+        outputs: Iterable[Path],
+        templates: Iterable[str] = (),
+        files: Iterable[str] = (),
+    ):
+        """Records the outputs rendered from a source config, and the templates
+        and files they used.
+
+        Pass ``digest=None`` if rendering failed, so the source is retried on
+        the next run while its outputs are still tracked for pruning.
+        """
+        key = self.source_key(yaml_file)
+        rendered = set(
+            output.relative_to(self.output_root).as_posix() for output in outputs
+        )
+        templates = set(templates)
+        files = set(
+            Path(os.path.relpath(file, self.source_root)).as_posix() for file in files
+        )
+        if digest is None:
+            # hang on to anything we rendered previously, so it can be pruned
+            # (and whatever it used, as we may not have got that far this time):
+            previous = self._previous.get(key, {})
+            rendered.update(previous.get("outputs", []))
+            templates.update(previous.get("templates", []))
+            files.update(previous.get("files", []))
+        else:
+            digest = self._with_dependencies(digest, templates, files)
+        self._current[key] = {
+            "hash": digest or "",
+            "outputs": sorted(rendered),
+            "templates": sorted(templates),
+            "files": sorted(files),
+        }
+
+    def forget(self, yaml_file: Path):
+        """Drops a source config that's been deleted from the new manifest."""
+        self._current.pop(self.source_key(yaml_file), None)
+
+    def previous_sources(self) -> Dict[Path, SourceRecord]:
+        """What was rendered from each source config last time."""
+        return {
+            self.source_root
+            / key: SourceRecord(
+                not entry["hash"],
+                [self.output_root / output for output in entry["outputs"]],
+                set(entry["templates"]),
+            )
+            for key, entry in self._previous.items()
+        }
+
+    def outputs(self) -> Dict[Path, Path]:
+        """Every rendered config produced by a current source, and its source."""
+        return {
+            self.output_root / output: self.source_root / key
+            for key, entry in self._current.items()
+            for output in entry["outputs"]
+        }
+
+    def stale_outputs(self) -> List[Path]:
+        """Rendered configs that are no longer produced by any current source.
+
+        This covers both deleted sources and sources whose DAG ids changed.
+        """
+        produced = {
+            output for entry in self._current.values() for output in entry["outputs"]
+        }
+        previous = {
+            output for entry in self._previous.values() for output in entry["outputs"]
+        }
+        return [self.output_root / output for output in sorted(previous - produced)]
+
+    def prune(self) -> List[Path]:
+        """Deletes stale rendered configs, returning the paths removed."""
+        removed = []
+        for output in self.stale_outputs():
+            if output.exists():
+                output.unlink()
+                removed.append(output)
+                logging.info("Pruned rendered config with no source: %s", output)
+        return removed
+
+    def save(self):
+        """Writes the manifest out, atomically, if it's changed."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(
+            self.path,
+            json.dumps(
+                {"version": MANIFEST_VERSION, "sources": self._current},
+                indent=2,
+                sort_keys=True,
+            ).encode("utf-8"),
+        )
@@ -0,0 +1,142 @@
+"""Keeps rendered DAG configs up to date as their inputs change (``--watch``).
+
+Everything from the first render stays in memory: the environment and the
+templates it's compiled, the parsed configs, what was rendered from each
+config and the templates its DAGs used. When files change, only the configs
+they affect are re-rendered (e.g. every config whose DAGs used a template that
+changed), and the DAG index is rewritten from memory.
+"""
+
+import gc
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import file_watch
+import instrumentation
+from actions_toolkit import core
+from changed_files import affected_sources
+from config_writer import write_index
+from render_manifest import RenderManifest, SourceRecord
+from renderer import RenderContext, RenderJob, SourceState, plan_jobs, render_jobs
+
+
+def watch(
+    context: RenderContext,
+    manifest: RenderManifest,
+    sources: Dict[Path, SourceState],
+    indexed: Dict[Path, Tuple[bytes, dict]],
+    processes: int = 1,
+    poll_interval: float = 0.5,
+    profile_top: Optional[int] = None,
+):
+    """Re-renders DAGs as their configs or templates change, until interrupted.
+
+    Big batches are spread across ``processes`` worker processes, as they are
+    for a full render.
+    """
+    env = context.environment
+    output_root = context.configs.output_root
+    roots = [context.configs.config_root] + [
+        Path(path) for path in env.source_loader.searchpath if Path(path).is_dir()
+    ]
+    watcher = file_watch.watch(roots, poll_interval)
+    # everything from the first render is here to stay, so stop the garbage
+    # collector from going over it again and again:
+    gc.collect()
+    gc.freeze()
+    print(f"Watching {', '.join(str(root) for root in roots)} for changes...")
+    try:
+        while True:
+            changed = watcher.wait()
+            start = time.perf_counter()
+
+            stale, edited = affected_sources(
+                changed,
+                {
+                    yaml_file: SourceRecord(failed[0], outputs, templates)
+                    for yaml_file, (_, outputs, failed, templates, _) in sources.items()
+                },
+                env,
+                context.configs,
+            )
+            if not stale:
+                continue
+            context.reload(edited)
+            manifest.refresh()
+
+            failed = rerender(context, stale, manifest, sources, indexed, processes)
+            manifest.save()
+            write_index(
+                output_root,
+                [(output, *indexed[output]) for output in sorted(indexed)],
+            )
+            print(
+                f"Re-rendered {len(stale)} config(s) in "
+                f"{(time.perf_counter() - start) * 1000:.0f}ms"
+                + (f", {failed} with errors" if failed else "")
+            )
+            if summary := instrumentation.report(profile_top):
+                print(summary)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def rerender(
+    context: RenderContext,
+    stale: Set[Path],
+    manifest: RenderManifest,
+    sources: Dict[Path, SourceState],
+    indexed: Dict[Path, Tuple[bytes, dict]],
+    processes: int = 1,
+) -> int:
+    """Re-renders (or removes the outputs of) the given config files.
+
+    Returns:
+        How many of them failed to render.
+    """
+    jobs: List[RenderJob] = []
+    previous_outputs: Dict[Path, List[Path]] = {}
+    for yaml_file in sorted(stale):
+        if yaml_file in sources:
+            previous_outputs[yaml_file] = sources.pop(yaml_file)[1]
+            for output in previous_outputs[yaml_file]:
+                indexed.pop(output, None)
+        if not yaml_file.exists():
+            manifest.forget(yaml_file)
+            continue
+
+        source = yaml_file.read_bytes()
+        digest = manifest.digest(
+            yaml_file, source, context.configs.directory(yaml_file.parent).docs
+        )
+        sources[yaml_file] = (digest, [], [False], set(), set())
+        planned = plan_jobs(context, yaml_file, source.decode("utf-8"))
+        if planned is None:
+            sources[yaml_file][2][0] = True
+        else:
+            jobs.extend(planned)
+
+    render_jobs(context, jobs, sources, indexed, processes)
+
+    failures = 0
+    for yaml_file in stale:
+        outputs = sources[yaml_file][1] if yaml_file in sources else []
+        # remove anything this config doesn't render any more (e.g. as its
+        # DAG id changed):
+        for output in set(previous_outputs.get(yaml_file, [])) - set(outputs):
+            if output.exists():
+                output.unlink()
+                logging.info("Removed rendered config with no source: %s", output)
+        if yaml_file in sources:
+            digest, _, failed, templates, files = sources[yaml_file]
+            manifest.record(
+                yaml_file, None if failed[0] else digest, outputs, templates, files
+            )
+            failures += failed[0]
+    if failures:
+        core.set_failed("Error rendering dag config")
+    return failures
@@ -0,0 +1,492 @@
+"""Renders source DAG configs into the configs the DAG factory builds DAGs from.
+
+A ``RenderContext`` holds everything a process keeps between the DAGs it
+renders: the Jinja environment and base template, what's known about each
+directory of configs, parsed multi-DAG files and expanded workflows. Rendering
+is split into jobs (a config file, or one instance of a multi-DAG file), which
+``render_jobs()`` renders in this process or across worker processes that set
+up a context of their own, then writes out in order.
+"""
+
+import copy
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import file_reads
+import instrumentation
+import yaml_io
+from actions_toolkit import core
+from config_tree import ConfigTree
+from config_writer import WRITER_THREADS, ConfigWriter, write_if_changed
+from constructors import CUSTOM_CONSTRUCTORS
+from dag_spec import operator_kwargs
+from multi_dag import MultiDagTemplate
+from template_env import build_environment
+from workflows import WorkflowCache, has_workflows
+
+
+class RenderedDag(NamedTuple):
+    """The outcome of rendering a single DAG config, before it's written out."""
+
+    source: Path
+    """The config the DAG was rendered from (for multi-DAG files, this is
+    ``<config dir>/<dag_id>``)."""
+    output_file: Optional[Path]
+    """Where the rendered config should be written, if we got that far."""
+    rendered: Optional[str]
+    """The fully rendered config, if rendering succeeded."""
+    error: Optional[str]
+    """Why rendering failed, if it did. A config can fail validation but still
+    be rendered."""
+    config: Optional[dict] = None
+    """The rendered config as loaded back in to validate it."""
+    templates: FrozenSet[str] = frozenset()
+    """The name of every template loaded while rendering it."""
+    files: FrozenSet[str] = frozenset()
+    """Any other files read while loading its config (i.e. by constructors)."""
+
+
+SourceState = Tuple[str, List[Path], List[bool], Set[str], Set[str]]
+"""What rendering a source config produced: its hash, the files rendered from
+it, whether rendering failed (in a list, so it can be updated in place), and
+the templates and other files its DAGs used."""
+
+RenderJob = Tuple[Path, Optional[int]]
+"""A unit of rendering work: a config file, and for multi-DAG files, the index
+of the ``_for_each`` entry to render."""
+
+
+class RenderContext:
+    """Everything a process keeps between the DAGs it renders.
+
+    Creating one registers our custom YAML constructors and loads the base
+    template. See ``build_environment()`` for the template arguments.
+
+    Args:
+        configs: what's known about the directories of configs.
+        keep_configs: whether to keep parsed single-DAG configs in memory
+            (i.e. for ``--watch``), rather than reading them for every render.
+    """
+
+    def __init__(
+        self,
+        configs: ConfigTree,
+        bytecode_cache_dir: Optional[Path] = None,
+        compiled_templates_dir: Optional[Path] = None,
+        keep_configs: bool = False,
+    ):
+        constructors = CUSTOM_CONSTRUCTORS
+        if instrumentation.enabled():
+            constructors = {
+                tag: instrumentation.timed("constructors", constructor)
+                for tag, constructor in constructors.items()
+            }
+        yaml_io.register_constructors(constructors)
+
+        self.configs = configs
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.compiled_templates_dir = compiled_templates_dir
+        # Load templates file from templates folder
+        self.environment = build_environment(bytecode_cache_dir, compiled_templates_dir)
+        self.template = self.environment.get_template("base.j2")
+        self.multi_dags: Dict[Path, MultiDagTemplate] = {}
+        self.parsed_configs: Optional[Dict[Path, Tuple[Any, FrozenSet[str]]]] = (
+            {} if keep_configs else None
+        )
+        self.workflows = WorkflowCache()
+
+    def reload(self, edited: Iterable[Path] = ()):
+        """Picks up changed templates, and forgets any ``edited`` config files.
+
+        Call the environment's ``invalidate()`` first for any templates that
+        changed.
+        """
+        self.template = self.environment.get_template("base.j2")
+        for yaml_file in edited:
+            self.multi_dags.pop(yaml_file, None)
+            if self.parsed_configs is not None:
+                self.parsed_configs.pop(yaml_file, None)
+
+    def multi_dag(self, yaml_file: Path) -> MultiDagTemplate:
+        """Parses a multi-DAG file, once per process."""
+        if yaml_file not in self.multi_dags:
+            self.multi_dags[yaml_file] = MultiDagTemplate(
+                yaml_file, yaml_file.read_bytes().decode("utf-8")
+            )
+        return self.multi_dags[yaml_file]
+
+    def load_config(self, yaml_file: Path) -> Tuple[Any, FrozenSet[str]]:
+        """Loads a single-DAG config, from memory if it's being kept there.
+
+        Returns:
+            The config, and any other files read while loading it.
+        """
+        if self.parsed_configs is None:
+            return _load_config(yaml_file)
+        if yaml_file not in self.parsed_configs:
+            self.parsed_configs[yaml_file] = _load_config(yaml_file)
+        values, files = self.parsed_configs[yaml_file]
+        # rendering fills in the values it's given, so hand out a copy:
+        return copy.deepcopy(values), files
+
+
+def _load_config(yaml_file: Path) -> Tuple[Any, FrozenSet[str]]:
+    with file_reads.recording() as files:
+        with yaml_file.open() as r:
+            values = yaml_io.full_load(r)
+    return values, frozenset(files - {os.path.abspath(yaml_file)})
+
+
+_worker_context: Optional[RenderContext] = None
+"""The context a worker process renders jobs with, set up by ``_init_worker()``."""
+
+
+def _init_worker(
+    configs: ConfigTree,
+    bytecode_cache_dir: Optional[Path],
+    compiled_templates_dir: Optional[Path],
+):
+    global _worker_context
+    _worker_context = RenderContext(configs, bytecode_cache_dir, compiled_templates_dir)
+
+
+def _render_in_worker(job: RenderJob) -> List[RenderedDag]:
+    return render_job(_worker_context, job)
+
+
+def plan_jobs(
+    context: RenderContext, yaml_file: Path, text: str
+) -> Optional[List[RenderJob]]:
+    """The jobs needed to render a config file, or None if it can't be read.
+
+    Multi-DAG files are fanned out per instance, so big ones get spread across
+    workers (each of which parses the file once).
+    """
+    if yaml_file in context.multi_dags:
+        multi_dag = context.multi_dags[yaml_file]
+    elif "#!multi" not in text:
+        return [(yaml_file, None)]
+    else:
+        try:
+            multi_dag = MultiDagTemplate(yaml_file, text)
+        except Exception as e:
+            logging.exception("Error opening yaml '%s': %s", yaml_file, e)
+            return None
+        context.multi_dags[yaml_file] = multi_dag
+    return [(yaml_file, index) for index in range(len(multi_dag.iterables))]
+
+
+def render_job(context: RenderContext, job: RenderJob) -> List[RenderedDag]:
+    """Renders a single job without writing anything to disk."""
+    yaml_file, index = job
+
+    with instrumentation.working_on(yaml_file):
+        if index is not None:
+            try:
+                with instrumentation.stage("load"):
+                    multi_dag = context.multi_dag(yaml_file)
+                    with file_reads.recording() as files:
+                        values = multi_dag.construct(multi_dag.iterables[index])
+            except Exception as e:
+                logging.exception("Error opening yaml '%s': %s", yaml_file, e)
+                return [RenderedDag(yaml_file, None, None, str(e))]
+            rendered_dag = render_dag(
+                values, yaml_file.parent / values["dag_id"], context
+            )
+            return [rendered_dag._replace(files=frozenset(files))]
+
+        try:
+            with instrumentation.stage("load"):
+                values, files = context.load_config(yaml_file)
+        except Exception as e:
+            logging.exception("Error opening yaml '%s': %s", yaml_file, e)
+            return [RenderedDag(yaml_file, None, None, str(e))]
+
+        if not values:
+            logging.exception("Config values is empty...")
+            return []
+
+        # don't render configs if they've been disabled:
+        if values.get("_do_not_render"):
+            logging.info("Skipping config as '_do_not_render' is set: %s", yaml_file)
+            return []
+
+        return [render_dag(values, yaml_file, context)._replace(files=files)]
+
+
+def render_jobs(
+    context: RenderContext,
+    jobs: List[RenderJob],
+    sources: Dict[Path, SourceState],
+    indexed: Dict[Path, Tuple[bytes, dict]],
+    processes: int = 1,
+    claimed: Optional[Dict[Path, Path]] = None,
+):
+    """Renders jobs across ``processes`` worker processes, or in this one.
+
+    See ``_collect_results()`` for what's recorded, and for ``claimed``.
+    """
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(
+                context.configs,
+                context.bytecode_cache_dir,
+                context.compiled_templates_dir,
+            ),
+        ) as pool:
+            results = pool.map(
+                _render_in_worker,
+                jobs,
+                chunksize=max(1, len(jobs) // (processes * 4)),
+            )
+            _collect_results(jobs, results, sources, indexed, claimed)
+    else:
+        results = (render_job(context, job) for job in jobs)
+        _collect_results(jobs, results, sources, indexed, claimed)
+
+
+def _collect_results(
+    jobs: List[RenderJob],
+    results: Iterable[List[RenderedDag]],
+    sources: Dict[Path, SourceState],
+    indexed: Dict[Path, Tuple[bytes, dict]],
+    claimed: Optional[Dict[Path, Path]] = None,
+):
+    """Writes out rendered configs in job order, tracking failures per source.
+
+    Configs are written on background threads as they're rendered, leaving
+    any that haven't changed untouched.
+
+    Each rendered config can only come from one source, or two would be
+    writing it at once: whichever has it first keeps it, and any other source
+    that renders it fails. ``claimed`` maps the rendered configs of sources
+    that aren't being rendered (e.g. skipped as unchanged) to those sources.
+
+    Valid configs are added to ``indexed``, ready for the DAG index.
+    """
+    owners = dict(claimed or {})
+    for yaml_file, (_, outputs, _, _, _) in sources.items():
+        owners.update((output, yaml_file) for output in outputs)
+    seen: Set[Path] = set()
+    pending = []
+    # writes are timed per DAG when profiling, so do them there and then:
+    with ConfigWriter(0 if instrumentation.enabled() else WRITER_THREADS) as writer:
+        for (yaml_file, _), rendered_dags in zip(jobs, results):
+            _, _, failed, templates, files = sources[yaml_file]
+            for rendered_dag in rendered_dags:
+                templates.update(rendered_dag.templates)
+                files.update(rendered_dag.files)
+                if rendered_dag.error:
+                    failed[0] = True
+                if rendered_dag.rendered is None:
+                    continue
+                try:
+                    owner = owners.setdefault(rendered_dag.output_file, yaml_file)
+                    if owner != yaml_file or rendered_dag.output_file in seen:
+                        raise ValueError(
+                            f"'{rendered_dag.output_file}' is already rendered "
+                            f"from '{owner}'; DAG ids must be unique"
+                        )
+                    seen.add(rendered_dag.output_file)
+                    with instrumentation.stage("write", rendered_dag.source):
+                        source = rendered_dag.rendered.encode("utf-8")
+                        written = writer.write(rendered_dag.output_file, source)
+                except Exception as e:
+                    logging.error(
+                        "Error rendering dag config for '%s': %s",
+                        rendered_dag.source,
+                        e,
+                    )
+                    failed[0] = True
+                    continue
+                pending.append((yaml_file, rendered_dag, source, written))
+
+    unchanged = 0
+    for yaml_file, rendered_dag, source, written in pending:
+        _, outputs, failed, _, _ = sources[yaml_file]
+        try:
+            unchanged += not written.result()
+        except Exception as e:
+            logging.error(
+                "Error rendering dag config for '%s': %s", rendered_dag.source, e
+            )
+            failed[0] = True
+            continue
+        outputs.append(rendered_dag.output_file)
+        if not rendered_dag.error:
+            indexed[rendered_dag.output_file] = (source, rendered_dag.config)
+    if pending:
+        logging.info("Left %d unchanged rendered config(s) as they were", unchanged)
+
+
+def render_multi_dag(
+    yaml_file: Path,
+    context: RenderContext,
+    errors_encountered: bool,
+    outputs: Optional[List[Path]] = None,
+    text: Optional[str] = None,
+) -> bool:
+    """Renders multiple DAGs from a single file.
+
+    This is effectively a wrapper for ``render_single_dag()`` over each
+    instance built by a ``MultiDagTemplate``, and any rendered files are
+    appended to ``outputs`` if it's given. Pass the file's raw ``text`` if
+    it's already been read, to save reading it again.
+    """
+    with instrumentation.working_on(yaml_file):
+        with instrumentation.stage("load"):
+            if text is None:
+                text = yaml_file.read_bytes().decode("utf-8")
+            multi_dag = MultiDagTemplate(yaml_file, text)
+
+        for config in multi_dag.iterables:
+            with instrumentation.stage("load"):
+                single_config = multi_dag.construct(config)
+
+            errors_encountered = render_single_dag(
+                single_config,
+                yaml_file.parent / single_config["dag_id"],
+                context,
+                errors_encountered,
+                outputs,
+            )
+    return errors_encountered
+
+
+def render_single_dag(
+    values: dict,
+    yaml_file: Path,
+    context: RenderContext,
+    errors_encountered: bool,
+    outputs: Optional[List[Path]] = None,
+) -> bool:
+    """Renders a single DAG from a yaml file.
+
+    The path of the rendered file is appended to ``outputs``, if it's given.
+    """
+    rendered_dag = render_dag(values, yaml_file, context)
+    if rendered_dag.error:
+        errors_encountered = True
+
+    try:
+        if rendered_dag.rendered is not None:
+            write_rendered_dag(rendered_dag)
+            if outputs is not None:
+                outputs.append(rendered_dag.output_file)
+
+    except Exception as e:
+        logging.error("Error rendering dag config for '%s': %s", yaml_file, e)
+        errors_encountered = True
+
+    finally:
+        if errors_encountered:
+            core.set_failed("Error rendering dag config")
+
+    return errors_encountered
+
+
+def render_dag(values: dict, yaml_file: Path, context: RenderContext) -> RenderedDag:
+    """Renders a single DAG config to text, without writing it anywhere."""
+    template = context.template
+    try:
+        with instrumentation.stage("prepare", yaml_file):
+            directory = context.configs.directory(yaml_file.parent)
+            if yaml_file.stem in directory.docs:
+                with open(yaml_file.parent / f"{yaml_file.stem}.md", "r") as f:
+                    values["documentation"] = f.read()
+
+            values["owner"] = directory.owner
+
+            # tidy the format of any tags provided in the config so we're
+            # consistent:
+            config_tags = [
+                tag.replace("_", " ").lower() for tag in values.get("tags", [])
+            ]
+            # then take a sorted final set to avoid any duplication:
+            values["tags"] = sorted(set(directory.tags).union(config_tags))
+
+            if has_workflows(values):
+                # now replace the task list with one with workflows expanded:
+                values["tasks"] = context.workflows.expand_tasks(values["tasks"])
+
+        with template.environment.recording() as templates:
+            with instrumentation.stage("render", yaml_file):
+                rendered = template.render(values)
+        with instrumentation.stage("validate", yaml_file):
+            loaded = yaml_io.safe_load(rendered)
+            error = validate_rendered_config(loaded)
+        if error:
+            logging.error(error)
+        # Write out fully rendered YAML to new location with full file naming convention
+        output_file = directory.output_dir / f"{values['dag_id']}.yaml"
+        return RenderedDag(
+            yaml_file,
+            output_file,
+            rendered,
+            error,
+            loaded,
+            frozenset(templates | {template.name}),
+        )
+
+    except Exception as e:
+        logging.error("Error rendering dag config for '%s': %s", yaml_file, e)
+        return RenderedDag(yaml_file, None, None, str(e))
+
+
+def validate_rendered_config(loaded: Any) -> Optional[str]:
+    """Checks a rendered config, returning why it's invalid if it is."""
+    if not isinstance(loaded, dict):
+        return "Rendered config is not a mapping"
+    error = None
+    if loaded.get("tasks"):
+        if isinstance(loaded.get("tasks"), dict):
+            error = "Tasks is of type dict not list."
+    if len(loaded.get("tasks", [])) == 0:
+        error = "No tasks for rendered config"
+    for key in ("operator_defaults", "fragments"):
+        if not isinstance(loaded.get(key, {}), dict):
+            error = f"{key} is not a mapping"
+    if not error:
+        # check any shared defaults/fragments the tasks use can be filled in:
+        for i, task in enumerate(loaded["tasks"]):
+            if not isinstance(task, dict):
+                error = f"Task {i} is not a mapping"
+                break
+            try:
+                operator_kwargs(
+                    task,
+                    loaded.get("operator_defaults", {}),
+                    loaded.get("fragments", {}),
+                )
+            except ValueError as e:
+                error = f"Task '{task.get('id')}': {e}"
+                break
+    return error
+
+
+def write_rendered_dag(rendered_dag: RenderedDag) -> bytes:
+    """Writes a rendered DAG config out to its place in the rendered configs.
+
+    Returns:
+        The exact contents of the written file.
+    """
+    with instrumentation.stage("write", rendered_dag.source):
+        rendered_dag.output_file.parent.mkdir(parents=True, exist_ok=True)
+        source = rendered_dag.rendered.encode("utf-8")
+        write_if_changed(rendered_dag.output_file, source)
+    return source
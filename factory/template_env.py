@@ -0,0 +1,215 @@
+"""Builds the Jinja environment used to render DAG configs.
+
+Compiling templates is a large part of a cold render, so compiled templates
+are kept in an on-disk bytecode cache between runs, and can also be compiled
+ahead of time into a directory of Python modules. Within a run, templates are
+resolved from the loader once and then memoised by name, as ``base.j2``
+includes a template per task.
+
+While ``instrumentation`` is recording, each template's renders are timed too
+(including the templates it includes), so the slowest templates are reported.
+"""
+
+import contextlib
+import hashlib
+import logging
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    MutableMapping,
+    Optional,
+    Set,
+)
+
+import instrumentation
+from jinja2 import (
+    BaseLoader,
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+    Template,
+    TemplateNotFound,
+)
+
+TEMPLATE_SEARCH_PATH = ["./templates", "../*"]
+"""Where templates are loaded from, relative to the working directory."""
+
+FINGERPRINT_FILE = "templates.sha256"
+"""Written alongside precompiled templates, so we know which sources they were
+compiled from."""
+
+
+class RenderEnvironment(Environment):
+    """A Jinja environment that memoises template lookups by name.
+
+    Dynamic includes like ``'tasks/' + task_args.type + '.j2'`` go through
+    ``get_template()`` for every task we render. Templates don't change during
+    a run, so once a name has been resolved we hand back the same template
+    without going back to the loader (or checking the file is up to date).
+    Call ``invalidate()`` if templates do change on disk.
+
+    Use ``recording()`` to find out which templates a render actually used, as
+    ``base.j2`` decides which to include from the config it's given.
+
+    Args:
+        source_loader: the loader that reads template sources, which may differ
+            from the environment's loader if precompiled templates are in use.
+    """
+
+    def __init__(self, source_loader: BaseLoader, **kwargs):
+        super().__init__(**kwargs)
+        self.source_loader = source_loader
+        self._resolved: Dict[str, Template] = {}
+        self._loaded: Optional[Set[str]] = None
+
+    def _load_template(
+        self, name: str, globals: Optional[MutableMapping[str, Any]]
+    ) -> Template:
+        if self._loaded is not None:
+            self._loaded.add(name)
+        template = self._resolved.get(name)
+        if template is None:
+            template = self._resolved[name] = super()._load_template(name, globals)
+            if instrumentation.enabled():
+                template.root_render_func = _timed(name, template.root_render_func)
+        elif globals:
+            template.globals.update(globals)
+        return template
+
+    def invalidate(self, names: Optional[Iterable[str]] = None):
+        """Forgets the named templates, or every template loaded so far.
+
+        Templates are included by name each time they're rendered, so only
+        the templates that changed need forgetting, not those including them.
+        """
+        if names is None:
+            self._resolved.clear()
+            if self.cache is not None:
+                self.cache.clear()
+            return
+
+        names = set(names)
+        for name in names:
+            self._resolved.pop(name, None)
+        if self.cache is not None:
+            for key in [key for key in self.cache.keys() if key[1] in names]:
+                del self.cache[key]
+
+    @contextlib.contextmanager
+    def recording(self) -> Iterator[Set[str]]:
+        """Collects the names of every template loaded within this context."""
+        previous, self._loaded = self._loaded, set()
+        try:
+            yield self._loaded
+        finally:
+            loaded, self._loaded = self._loaded, previous
+            if previous is not None:
+                previous.update(loaded)
+
+
+def _timed(name: str, render_func: Callable) -> Callable:
+    """Wraps a template's render function to time its renders."""
+
+    def root_render_func(context) -> Iterator[str]:
+        with instrumentation.template(name):
+            yield from render_func(context)
+
+    return root_render_func
+
+
+def build_environment(
+    bytecode_cache_dir: Optional[Path] = None,
+    compiled_templates_dir: Optional[Path] = None,
+) -> RenderEnvironment:
+    """Builds the environment our templates are rendered with.
+
+    Args:
+        bytecode_cache_dir: if given, compiled templates are cached here and
+            reused by later runs for as long as the template source matches.
+        compiled_templates_dir: if given, templates precompiled into this
+            directory by ``precompile_templates()`` are used in place of their
+            sources, provided they were compiled from the current sources.
+    """
+    source_loader = FileSystemLoader(TEMPLATE_SEARCH_PATH)
+    loader = source_loader
+
+    if compiled_templates_dir is not None:
+        fingerprint_file = compiled_templates_dir / FINGERPRINT_FILE
+        if (
+            fingerprint_file.exists()
+            and fingerprint_file.read_text() == fingerprint_sources(source_loader)
+        ):
+            loader = ChoiceLoader(
+                [ModuleLoader(str(compiled_templates_dir)), source_loader]
+            )
+        else:
+            logging.warning(
+                "Ignoring precompiled templates in '%s' as they're out of date",
+                compiled_templates_dir,
+            )
+
+    bytecode_cache = None
+    if bytecode_cache_dir is not None:
+        bytecode_cache_dir.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(bytecode_cache_dir))
+
+    return RenderEnvironment(
+        source_loader,
+        loader=loader,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        extensions=["jinja2.ext.do"],
+        bytecode_cache=bytecode_cache,
+        # templates don't change mid-render, so don't stat them on every use:
+        auto_reload=False,
+        cache_size=-1,
+    )
+
+
+def template_name(loader: FileSystemLoader, path: Path) -> Optional[str]:
+    """The name a loader knows a template file by, if it can load it at all."""
+    for searchpath in loader.searchpath:
+        try:
+            relative = path.resolve().relative_to(Path(searchpath).resolve())
+        except ValueError:
+            continue
+        return relative.as_posix()
+    return None
+
+
+def template_source(loader: BaseLoader, name: str) -> Optional[str]:
+    """The source of a template, or None if the loader can't find it."""
+    try:
+        source, _, _ = loader.get_source(None, name)
+    except TemplateNotFound:
+        return None
+    return source
+
+
+def fingerprint_sources(loader: BaseLoader) -> str:
+    """Hashes the source of every template a loader can find."""
+    digest = hashlib.sha256()
+    for name in sorted(loader.list_templates()):
+        source, _, _ = loader.get_source(None, name)
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(source.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def precompile_templates(env: RenderEnvironment, target: Path):
+    """Compiles every template into a directory of Python modules.
+
+    The result can be loaded with ``build_environment(compiled_templates_dir=...)``,
+    which skips reading and compiling template sources altogether.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    env.compile_templates(str(target), zip=None, ignore_errors=False)
+    (target / FINGERPRINT_FILE).write_text(fingerprint_sources(env.source_loader))
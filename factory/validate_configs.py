@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+"""Checks every rendered DAG config would build, without needing Airflow.
+
+The DAG factory only finds out a config is broken (e.g. an unsupported
+operator, a dependency on a task that doesn't exist) when the scheduler
+parses it, after it's been deployed. This checks every rendered config with
+``dag_spec.validate()`` (which runs the same checks as the DAG builder, and
+more) across several processes, and reports every problem it finds in one go,
+along with DAG ids used more than once.
+
+Configs are read from the DAG index where it's up to date, and from their
+YAML otherwise.
+
+Usage:
+    python factory/validate_configs.py [--jobs N] [CONFIG_DIR]
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+import yaml_io
+from dag_index import DagIndex
+from dag_spec import validate
+
+RENDERED_CONFIGS = Path(__file__).parent / "rendered_configs"
+"""Where the renderer writes fully rendered DAG configs (and their index)."""
+
+_index: Optional[DagIndex] = None
+"""The DAG index, loaded once per process by ``_init_validator()``."""
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Validates every rendered config, printing any problems.
+
+    Returns:
+        The exit status: 0 if every config is valid, and 1 otherwise.
+    """
+    args = _parse_args(argv)
+    config_files = sorted(args.config_dir.glob("**/*.yaml"))
+    if not config_files:
+        print(f"No rendered configs found in {args.config_dir}", file=sys.stderr)
+        return 1
+
+    if args.jobs > 1:
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_validator,
+            initargs=(args.config_dir,),
+        ) as pool:
+            results = list(
+                pool.map(
+                    _validate_file,
+                    config_files,
+                    chunksize=max(1, len(config_files) // (args.jobs * 4)),
+                )
+            )
+    else:
+        _init_validator(args.config_dir)
+        results = list(map(_validate_file, config_files))
+
+    errors: Dict[Path, List[str]] = {}
+    files_by_dag_id: Dict[str, List[Path]] = defaultdict(list)
+    for config_file, (dag_id, file_errors) in zip(config_files, results):
+        if dag_id is not None:
+            files_by_dag_id[dag_id].append(config_file)
+            # workers look DAGs up by file name:
+            if dag_id != config_file.stem:
+                file_errors.append(f"dag_id '{dag_id}' doesn't match the file name")
+        if file_errors:
+            errors[config_file] = file_errors
+    for dag_id, files in files_by_dag_id.items():
+        if len(files) > 1:
+            for config_file in files:
+                errors.setdefault(config_file, []).append(
+                    f"dag_id '{dag_id}' is used by {len(files)} configs"
+                )
+
+    for config_file, file_errors in sorted(errors.items()):
+        for error in file_errors:
+            print(f"{config_file.relative_to(args.config_dir)}: {error}")
+    print(f"{len(errors)} of {len(config_files)} rendered config(s) have problems")
+    return 1 if errors else 0
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "config_dir",
+        type=Path,
+        nargs="?",
+        default=RENDERED_CONFIGS,
+        help="the rendered configs to check (default: the renderer's output)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes to validate with (default: one per CPU)",
+    )
+    return parser.parse_args(argv)
+
+
+def _init_validator(config_dir: Path):
+    """Loads the DAG index, once in the main process or in each worker."""
+    global _index
+    _index = DagIndex.load(config_dir)
+
+
+def _validate_file(config_file: Path) -> Tuple[Optional[str], List[str]]:
+    """Validates a single rendered config.
+
+    Returns:
+        The config's DAG id (if it has one), and any problems with it.
+    """
+    try:
+        source = config_file.read_bytes()
+        dag_config = _index.config_for(config_file, source) if _index else None
+        if dag_config is None:
+            dag_config = yaml_io.safe_load(source)
+    except (OSError, yaml.YAMLError) as e:
+        return None, [f"can't be loaded: {e}"]
+
+    dag_id = dag_config.get("dag_id") if isinstance(dag_config, dict) else None
+    return (dag_id if isinstance(dag_id, str) else None), validate(dag_config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
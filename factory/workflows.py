@@ -0,0 +1,109 @@
+"""Expands workflow tasks into the tasks they describe.
+
+A workflow is a task with a ``workflow_description``, a ``task_set`` of task
+templates and a ``value_set`` of values to fill them in with. It's expanded
+into a task per ``value_set`` and ``task_set`` pair, with each set of values
+filling in the ``${value_set.<key>}`` placeholders in the task templates.
+"""
+
+import copy
+import datetime
+from collections import OrderedDict
+from typing import Any, Hashable, List
+
+from placeholders import fill_structure, has_placeholders, placeholder_values
+
+CACHED_WORKFLOWS = 256
+"""How many workflows' expansions ``WorkflowCache`` keeps at most."""
+
+_SCALARS = (str, int, bool, bytes, type(None))
+"""Other values a cached workflow can be made of, which are keyed as they are."""
+
+
+def has_workflows(values: dict) -> bool:
+    """Whether a config has workflow tasks that need expanding.
+
+    Workflows are only expanded in configs with ``value_set`` placeholders.
+    """
+    tasks = values.get("tasks")
+    if not isinstance(tasks, list):
+        return False
+    return any(
+        isinstance(task_spec, dict) and task_spec.get("workflow_description")
+        for task_spec in tasks
+    ) and has_placeholders(values, "value_set")
+
+
+def expand_workflow(task_spec: dict) -> List[dict]:
+    """Expands a workflow into a task per ``value_set`` and ``task_set`` pair."""
+    expanded = []
+    for value_dict in task_spec["value_set"]:
+        replacements = placeholder_values(value_dict)
+        for task_template in task_spec["task_set"]:
+            expanded.append(fill_structure(task_template, replacements, "value_set"))
+    return expanded
+
+
+def _cache_key(value: Any) -> Hashable:
+    """A key that's equal only for workflows that expand the same way.
+
+    Each value is tagged with its type, so e.g. ``1``, ``True`` and ``"1"``
+    (which are all alike once filled in as text) are kept apart. Anything
+    other than plain YAML values (e.g. from our custom constructors) raises a
+    TypeError, as there's no knowing how it'd be filled in.
+    """
+    if isinstance(value, dict):
+        return dict, frozenset(
+            (_cache_key(key), _cache_key(item)) for key, item in value.items()
+        )
+    if isinstance(value, list):
+        return list, tuple(_cache_key(item) for item in value)
+    if isinstance(value, (float, datetime.date)):
+        # e.g. 0.0 == -0.0, and datetimes in different timezones can be equal:
+        return type(value), repr(value)
+    if isinstance(value, _SCALARS):
+        return type(value), value
+    raise TypeError(f"can't cache workflows with {type(value).__name__} values")
+
+
+class WorkflowCache:
+    """Expands workflows, remembering the tasks each one expanded into.
+
+    Shared workflow blocks tend to be included by many DAGs, so expansions are
+    cached by the workflow's content. Templates update the task dicts they're
+    given, so every caller gets its own copy of the expanded tasks.
+
+    Only the ``CACHED_WORKFLOWS`` most recently used workflows are kept, so the
+    cache doesn't keep growing as configs are edited under ``--watch``.
+    """
+
+    def __init__(self):
+        self._expanded: "OrderedDict[Hashable, List[dict]]" = OrderedDict()
+
+    def expand_tasks(self, tasks: List[Any]) -> List[Any]:
+        """Expands every workflow in a list of tasks, passing others through."""
+        new_task_list = []
+        for task_spec in tasks:
+            if not (
+                isinstance(task_spec, dict) and task_spec.get("workflow_description")
+            ):
+                # pass normal tasks straight through:
+                new_task_list.append(task_spec)
+            else:
+                # parse workflows out into multiple new tasks:
+                new_task_list.extend(self.expand(task_spec))
+        return new_task_list
+
+    def expand(self, task_spec: dict) -> List[dict]:
+        """Expands a workflow, or copies its tasks from last time."""
+        try:
+            key = _cache_key(task_spec)
+        except TypeError:
+            return expand_workflow(task_spec)
+        if key in self._expanded:
+            self._expanded.move_to_end(key)
+        else:
+            self._expanded[key] = expand_workflow(task_spec)
+            if len(self._expanded) > CACHED_WORKFLOWS:
+                self._expanded.popitem(last=False)
+        return copy.deepcopy(self._expanded[key])
@@ -0,0 +1,91 @@
+"""Reads YAML with PyYAML's libyaml bindings where they're available.
+
+PyYAML's pure-Python parser is an order of magnitude slower than libyaml, and
+reading YAML (our configs, and the configs we render from them) is a large
+part of both rendering and building DAGs. Everything reads YAML through the
+loaders here, which use libyaml if PyYAML was built with it, and fall back to
+the pure-Python loaders (which read YAML the same way) otherwise.
+
+Strings in rendered configs are interned as they're loaded, as they are
+when loaded from the DAG index (see ``dag_index.py``), so configs loaded from
+YAML share one copy of each repeated string too.
+
+Our custom YAML constructors are registered on these loaders, rather than on
+PyYAML's own, once per process by ``register_constructors()``.
+"""
+
+import sys
+from typing import IO, Any, Callable, Dict, Union
+
+import yaml
+
+LIBYAML = getattr(yaml, "__with_libyaml__", False)
+"""Whether YAML is being read by libyaml."""
+
+Stream = Union[str, bytes, IO]
+
+
+def _stream_name(stream: Stream) -> str:
+    # as PyYAML's pure-Python reader names its streams:
+    if isinstance(stream, str):
+        return "<unicode string>"
+    if isinstance(stream, bytes):
+        return "<byte string>"
+    return getattr(stream, "name", "<file>")
+
+
+class SafeLoader(yaml.CSafeLoader if LIBYAML else yaml.SafeLoader):
+    """Loads plain YAML, i.e. rendered configs."""
+
+    def __init__(self, stream: Stream):
+        super().__init__(stream)
+        # libyaml's parser doesn't name its streams, but constructors might
+        # use the name to find files relative to the config:
+        self.name = _stream_name(stream)
+
+    def construct_yaml_str(self, node: yaml.Node) -> str:
+        return sys.intern(super().construct_yaml_str(node))
+
+
+SafeLoader.add_constructor("tag:yaml.org,2002:str", SafeLoader.construct_yaml_str)
+
+
+class FullLoader(yaml.CFullLoader if LIBYAML else yaml.FullLoader):
+    """Loads YAML with our custom constructors, i.e. source configs."""
+
+    def __init__(self, stream: Stream):
+        super().__init__(stream)
+        self.name = _stream_name(stream)
+
+
+def register_constructors(constructors: Dict[str, Callable]):
+    """Registers custom constructors for tags when loading source configs."""
+    for tag, constructor in constructors.items():
+        FullLoader.add_constructor(tag, constructor)
+
+
+def safe_load(stream: Stream) -> Any:
+    """Like ``yaml.safe_load()``."""
+    loader = SafeLoader(stream)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+def full_load(stream: Stream) -> Any:
+    """Like ``yaml.full_load()``, with our custom constructors."""
+    loader = FullLoader(stream)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+def compose(stream: Stream) -> yaml.Node:
+    """Like ``yaml.compose()``, for source configs."""
+    loader = FullLoader(stream)
+    try:
+        return loader.get_single_node()
+    finally:
+        loader.dispose()
@@ -0,0 +1,19 @@
+"""Makes the renderer and DAG factory modules importable, as they're deployed.
+
+The renderer imports its modules by their bare names, and the DAG factory
+imports them from ``factory.utils``. Anything either needs that isn't
+installed (e.g. Airflow, or our custom YAML constructors) is stubbed, as it is
+for the benchmarks (see ``benchmarks/stubs.py``).
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+FACTORY = ROOT / "factory"
+
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import stubs  # noqa: E402
+
+stubs.install(FACTORY)
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+from changed_files import changed_sources
+from config_tree import ConfigTree
+from jinja2 import FileSystemLoader
+from render_manifest import SourceRecord
+from template_env import RenderEnvironment
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    for path in (
+        "dag_configs/finance/report.yaml",
+        "dag_configs/finance/report.md",
+        "dag_configs/marketing/campaign.yaml",
+        "work/templates/base.j2",
+        "work/templates/tasks/gcs_to_bq.j2",
+        "work/templates/tasks/Bash.j2",
+        "templates/gcs_to_bq.j2",
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).touch()
+    return tmp_path
+
+
+def _changed_sources(repo: Path, *changed: str):
+    loader = FileSystemLoader([str(repo / "work" / "templates")])
+    configs = ConfigTree(repo / "dag_configs", repo / "rendered_configs")
+    previous = {
+        repo
+        / "dag_configs/finance/report.yaml": SourceRecord(
+            False,
+            [repo / "rendered_configs/finance/report.yaml"],
+            {"base.j2", "tasks/gcs_to_bq.j2"},
+        ),
+        repo
+        / "dag_configs/marketing/campaign.yaml": SourceRecord(
+            False,
+            [repo / "rendered_configs/marketing/campaign.yaml"],
+            {"base.j2", "tasks/Bash.j2"},
+        ),
+    }
+    return changed_sources(
+        {repo / path for path in changed},
+        previous,
+        configs.scan(),
+        RenderEnvironment(loader, loader=loader),
+        configs,
+    )
+
+
+def test_changed_template(repo):
+    assert _changed_sources(repo, "work/templates/tasks/gcs_to_bq.j2") == {
+        repo / "dag_configs/finance/report.yaml"
+    }
+
+
+def test_changed_config_and_docs(repo):
+    assert _changed_sources(
+        repo, "dag_configs/finance/report.md", "dag_configs/marketing/campaign.yaml"
+    ) == {
+        repo / "dag_configs/finance/report.yaml",
+        repo / "dag_configs/marketing/campaign.yaml",
+    }
+
+
+def test_unrelated_files(repo):
+    assert _changed_sources(repo, "README.md") == set()
+
+
+def test_unmapped_template(repo):
+    # the template is deployed under another name than it's changed under:
+    assert _changed_sources(repo, "templates/gcs_to_bq.j2") is None
+
+
+def test_unused_template(repo):
+    assert _changed_sources(repo, "work/templates/tasks/unused.j2") is None
+
+
+def test_unclassified_config_file(repo):
+    assert _changed_sources(repo, "dag_configs/finance/query.sql") is None
+
+
+def test_code(repo):
+    assert _changed_sources(repo, "factory/render_configs.py") is None
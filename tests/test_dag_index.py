@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import pytest
+from config_writer import write_index
+from dag_index import INDEX_FILENAME, DagIndex, find_dag
+from synthetic import write_rendered_configs
+
+from factory.utils.dag_builder import build_dags
+
+
+@pytest.fixture
+def config_dir(tmp_path: Path) -> Path:
+    write_index(tmp_path, write_rendered_configs(tmp_path, 30, tasks_per_dag=3))
+    return tmp_path
+
+
+def _path(config_dir: Path, i: int) -> Path:
+    return next(config_dir.glob(f"**/dag_{i}.yaml"))
+
+
+def _edit(config_dir: Path, i: int) -> Path:
+    path = _path(config_dir, i)
+    path.write_text(path.read_text().replace("Benchmark DAG", "Edited DAG"))
+    return path
+
+
+def test_config_for(config_dir):
+    index = DagIndex.load(config_dir)
+
+    config = index.config_for(_path(config_dir, 3))
+    assert config["dag_id"] == "dag_3"
+    assert [task["id"] for task in config["tasks"]] == ["task_0", "task_1", "task_2"]
+    assert index.config_for(config_dir / "elsewhere.yaml") is None
+
+
+def test_find_dag(config_dir):
+    for i in range(30):
+        path, config = find_dag(config_dir, f"dag_{i}")
+        assert path == _path(config_dir, i)
+        assert config["dag_id"] == f"dag_{i}"
+    assert find_dag(config_dir, "missing") is None
+
+
+def test_changed_configs_are_not_used(config_dir):
+    path = _edit(config_dir, 3)
+
+    assert DagIndex.load(config_dir).config_for(path) is None
+    assert find_dag(config_dir, "dag_3") == (path, None)
+
+
+def test_deleted_configs_are_not_used(config_dir):
+    path = _path(config_dir, 3)
+    path.unlink()
+
+    assert DagIndex.load(config_dir).config_for(path) is None
+    assert find_dag(config_dir, "dag_3") is None
+
+
+@pytest.mark.parametrize("index", [b"", b"DAGIDX01", b"DAGIDX02" + b"\0" * 8])
+def test_unusable_index(config_dir, index):
+    (config_dir / INDEX_FILENAME).write_bytes(index)
+
+    assert DagIndex.load(config_dir) is None
+    assert find_dag(config_dir, "dag_3") is None
+
+
+def test_empty_index_is_removed(config_dir):
+    assert write_index(config_dir, []) is None
+
+    assert not (config_dir / INDEX_FILENAME).exists()
+
+
+def test_unchanged_index_is_left_alone(config_dir):
+    modified = (config_dir / INDEX_FILENAME).stat().st_mtime_ns
+
+    write_index(config_dir, write_rendered_configs(config_dir, 30, tasks_per_dag=3))
+
+    assert (config_dir / INDEX_FILENAME).stat().st_mtime_ns == modified
+
+
+def test_build_dags_loads_changed_configs_from_yaml(config_dir):
+    _edit(config_dir, 3)
+    namespace = {}
+
+    assert build_dags(namespace, config_dir) == 30
+    descriptions = {dag.dag_id: dag.description for dag in namespace.values()}
+    assert descriptions["dag_3"] == "Edited DAG dag_3"
+    assert descriptions["dag_4"] == "Benchmark DAG dag_4"
+
+
+def test_build_dags_on_a_worker(config_dir, monkeypatch):
+    monkeypatch.setenv("_AIRFLOW_PARSING_CONTEXT_DAG_ID", "dag_3")
+    _edit(config_dir, 3)
+    namespace = {}
+
+    assert build_dags(namespace, config_dir) == 1
+    assert [dag.description for dag in namespace.values()] == ["Edited DAG dag_3"]
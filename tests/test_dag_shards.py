@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import pytest
+from dag_shards import Shard, shard_module, shard_modules, shard_of
+from synthetic import write_rendered_configs
+
+from factory.utils.dag_builder import build_dags
+
+
+def test_shard_of_is_stable():
+    # CRC-32 based, so these never change from one machine (or Python) to the
+    # next; if they do, every sharded DAG would move file:
+    assert [shard_of(f"dag_{i}", 4) for i in range(8)] == [0, 2, 0, 2, 1, 3, 1, 3]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 8])
+def test_every_dag_is_in_one_shard(count):
+    dag_ids = [f"dag_{i}" for i in range(200)]
+    shards = [Shard(index, count) for index in range(count)]
+
+    for dag_id in dag_ids:
+        assert sum(shard.includes(dag_id) for shard in shards) == 1
+    # and they're spread out:
+    for shard in shards:
+        assert sum(map(shard.includes, dag_ids)) > 100 / count
+
+
+def test_shard_module(tmp_path):
+    path, source = shard_module(tmp_path, Shard(3, 12))
+
+    assert path == tmp_path / "dag_factory_shard_03.py"
+    assert "Shard(3, 12)" in source
+    # or Airflow's safe mode wouldn't parse it:
+    assert "airflow" in source.lower() and "dag" in source.lower()
+    compile(source, str(path), "exec")
+
+
+def test_shard_modules(tmp_path):
+    for index in (1, 0):
+        path, source = shard_module(tmp_path, Shard(index, 2))
+        path.write_text(source)
+    (tmp_path / "dag_factory.py").touch()
+
+    assert shard_modules(tmp_path) == [
+        tmp_path / "dag_factory_shard_00.py",
+        tmp_path / "dag_factory_shard_01.py",
+    ]
+
+
+def test_build_dags_in_shards(tmp_path: Path):
+    write_rendered_configs(tmp_path, 20, tasks_per_dag=2)
+    built = []
+
+    for index in range(3):
+        namespace = {}
+        build_dags(namespace, tmp_path, Shard(index, 3))
+        built.append({dag.dag_id for dag in namespace.values()})
+
+    assert sorted(dag_id for dag_ids in built for dag_id in dag_ids) == sorted(
+        f"dag_{i}" for i in range(20)
+    )
+    for index, dag_ids in enumerate(built):
+        assert all(shard_of(dag_id, 3) == index for dag_id in dag_ids)
@@ -0,0 +1,43 @@
+"""Modules shared by the renderer and the DAG factory mustn't import Airflow.
+
+The renderer runs in CI, where Airflow isn't installed, and the DAG factory
+runs in Airflow, where these modules live under ``factory.utils``. So the
+modules both of them use can't import Airflow, or each other (the renderer
+imports them by their bare names, and the DAG factory from ``factory.utils``).
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+FACTORY = Path(__file__).parent.parent / "factory"
+
+SHARED_MODULES = ["dag_index", "dag_shards", "dag_spec", "instrumentation", "yaml_io"]
+"""Modules the DAG factory imports that the renderer uses too."""
+
+_IMPORT = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+before = set(sys.modules)
+import {module}
+print(json.dumps(sorted(set(sys.modules) - before)))
+"""
+
+
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_shared_module_imports(module):
+    # a fresh interpreter, so nothing's been imported (or stubbed) already:
+    result = subprocess.run(
+        [sys.executable, "-c", _IMPORT.format(module=module), str(FACTORY)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {name.split(".")[0] for name in json.loads(result.stdout)}
+    siblings = {path.stem for path in FACTORY.glob("*.py")} - {module}
+
+    assert "airflow" not in imported
+    assert not imported & siblings
@@ -0,0 +1,109 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from multi_dag import MultiDagTemplate, replace_values
+
+TEMPLATE = """\
+dag_id: report_${each.id}
+schedule: ${each.schedule}
+retries: ${each.retries}
+description: "Report for ${each.name}"
+tasks:
+  - id: extract
+    tables: ${each.tables}
+  - id: load
+    shared: &shared
+      pool: default
+  - id: publish
+    settings: *shared
+"""
+
+FOR_EACH = """\
+#!multi
+_for_each:
+  - id: a
+    schedule: 0 6 * * *
+    retries: 3
+    name: "A: the first"
+    tables: [x, y]
+  - id: b
+    schedule: null
+    retries: 0
+    name: B
+    tables: []
+"""
+
+
+def _instances(text: str, yaml_file: Path = Path("reports.yaml")):
+    multi_dag = MultiDagTemplate(yaml_file, text)
+    return [multi_dag.construct(config) for config in multi_dag.iterables]
+
+
+def _substituted(text: str):
+    # what we'd get by filling in the whole file as text, then loading it:
+    template, for_each = text.split("#!multi")
+    return [
+        yaml.full_load(replace_values(template, config, "each"))
+        for config in yaml.full_load(for_each)["_for_each"]
+    ]
+
+
+def test_construct():
+    instances = _instances(TEMPLATE + FOR_EACH)
+
+    assert instances == _substituted(TEMPLATE + FOR_EACH)
+    assert instances[0]["dag_id"] == "report_a"
+    assert instances[0]["retries"] == 3
+    assert instances[0]["description"] == "Report for A: the first"
+    assert instances[0]["tasks"][0]["tables"] == ["x", "y"]
+    assert instances[1]["schedule"] is None
+    assert instances[1]["retries"] is None
+
+
+def test_instances_are_independent():
+    first, second = _instances(TEMPLATE + FOR_EACH)
+    first["tasks"][1]["shared"]["pool"] = "changed"
+
+    assert second["tasks"][1]["shared"]["pool"] == "default"
+
+
+def test_not_yaml_until_substituted():
+    text = (
+        "dag_id: ${each.id}\ntags: [${each.tag}]\n#!multi\n_for_each: [{id: a, tag: t}]"
+    )
+
+    assert _instances(text) == [{"dag_id": "a", "tags": ["t"]}]
+
+
+def test_byte_order_mark():
+    instances = _instances("\ufeff" + TEMPLATE + FOR_EACH)
+
+    assert instances == _substituted(TEMPLATE + FOR_EACH)
+
+
+@pytest.mark.parametrize("value", ["a: b", "- a", "a\nb"])
+def test_values_that_change_the_structure(value):
+    text = (
+        "dag_id: x\nschedule: ${each.value}\n#!multi\n_for_each:\n"
+        f"  - value: {json.dumps(value)}\n"
+    )
+
+    with pytest.raises(ValueError, match=r"line 2 of 'reports\.yaml'"):
+        _instances(text)
+
+
+def test_quoted_values():
+    text = 'dag_id: x\nschedule: "${each.value}"\n#!multi\n_for_each: [{value: "a: b"}]'
+
+    assert _instances(text)[0]["schedule"] == "a: b"
+
+
+def test_errors_name_the_file():
+    text = 'dag_id: x\nschedule: "${each.value}"\n#!multi\n_for_each: [value: a" b]'
+
+    with pytest.raises(ValueError, match=r"line 2 of 'reports\.yaml'"):
+        _instances(text)
+    with pytest.raises(yaml.YAMLError, match=r"reports\.yaml"):
+        _instances("dag_id: x\n#!multi\n_for_each: [\n")
@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+import yaml
+from placeholders import (
+    fill_placeholders,
+    fill_structure,
+    has_placeholders,
+    placeholder_values,
+)
+
+
+def _fill(template, **values):
+    return fill_structure(template, placeholder_values(values), "value_set")
+
+
+def test_fill_placeholders():
+    replacements = placeholder_values({"id": "a", "n": 3, "empty": None})
+
+    assert (
+        fill_placeholders("${each.id}-${each.n}${each.empty}", replacements, "each")
+        == "a-3"
+    )
+    assert fill_placeholders("${each.missing}", replacements, "each") == (
+        "${each.missing}"
+    )
+
+
+def test_inserted_placeholders_are_left_alone():
+    replacements = placeholder_values({"a": "${each.b}", "b": "x"})
+
+    assert fill_placeholders("${each.a}", replacements, "each") == "${each.b}"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (3, 3),
+        ("1.5", 1.5),
+        ("true", True),
+        ("orders", "orders"),
+        (0, None),
+        ([1, 2], [1, 2]),
+        ({"a": 1}, {"a": 1}),
+    ],
+)
+def test_plain_values_are_typed(value, expected):
+    assert _fill({"retries": "${value_set.x}"}, x=value) == {"retries": expected}
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["a: b", "- a", "a: b: c", "2024-01-01", "!!python/name:os.system"],
+)
+def test_other_values_stay_as_written(value):
+    assert _fill({"command": "${value_set.x}"}, x=value) == {"command": value}
+
+
+def test_quoted_templates_stay_strings():
+    # PyYAML would quote this, so it's never re-read once filled:
+    assert _fill({"id": "'${value_set.x}'"}, x=3) == {"id": "'3'"}
+    assert _fill({"id": "${value_set.x}: run"}, x=3) == {"id": "3: run"}
+
+
+def test_matches_dumping_and_loading():
+    template = {
+        "id": "load_${value_set.name}",
+        "retries": "${value_set.n}",
+        "tables": "${value_set.tables}",
+        "dependencies": [{"id": "first"}],
+    }
+    values = {"name": "orders", "n": 3, "tables": ["a", "b"]}
+    replacements = placeholder_values(values)
+
+    assert fill_structure(template, replacements, "value_set") == yaml.safe_load(
+        fill_placeholders(yaml.dump(template), replacements, "value_set")
+    )
+
+
+def test_filled_containers_are_not_shared():
+    first = _fill({"tables": "${value_set.x}"}, x=["a"])
+    second = _fill({"tables": "${value_set.x}"}, x=["a"])
+    first["tables"].append("b")
+
+    assert second == {"tables": ["a"]}
+
+
+def test_has_placeholders():
+    assert has_placeholders({"tasks": [{"id": "${value_set.x}"}]}, "value_set")
+    assert not has_placeholders({"tasks": [{"id": "${each.x}"}]}, "value_set")
+    assert not has_placeholders({"start": datetime.date(2024, 1, 1)}, "value_set")
@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import pytest
+import render_configs
+import renderer
+import yaml
+from dag_index import DagIndex
+
+BASE_TEMPLATE = """\
+dag_id: {{ dag_id }}
+description: {{ description }}
+tasks:
+{% for task in tasks %}
+  - id: {{ task.id }}
+{% endfor %}
+{% include "tasks/" ~ tasks[0].type ~ ".j2" %}
+"""
+
+
+def _read(loader, node):
+    # like our constructors that read queries from alongside a config:
+    path = Path(loader.name).parent / loader.construct_scalar(node)
+    return path.read_text().strip()
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch) -> Path:
+    for path, text in {
+        "work/templates/base.j2": BASE_TEMPLATE,
+        "work/templates/tasks/Bash.j2": "# bash",
+        "work/templates/tasks/gcs_to_bq.j2": "# gcs_to_bq",
+        "dag_configs/finance/report.yaml": (
+            "dag_id: report\ndescription: !read report.sql\n"
+            "tasks: [{id: a, type: gcs_to_bq}]"
+        ),
+        "dag_configs/finance/report.sql": "select 1",
+        "dag_configs/marketing/campaign.yaml": (
+            "dag_id: campaign\ndescription: campaign\ntasks: [{id: a, type: Bash}]"
+        ),
+    }.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(text)
+
+    monkeypatch.setattr(renderer, "CUSTOM_CONSTRUCTORS", {"!read": _read})
+    monkeypatch.setattr(render_configs, "ROOT", tmp_path)
+    rendered_configs = tmp_path / "factory" / "rendered_configs"
+    monkeypatch.setattr(render_configs, "RENDERED_CONFIGS", rendered_configs)
+    monkeypatch.setattr(
+        render_configs, "MANIFEST_PATH", rendered_configs / ".render_manifest.json"
+    )
+    # templates are looked up relative to where the renderer runs:
+    monkeypatch.chdir(tmp_path / "work")
+    return tmp_path
+
+
+def _render(*args: str):
+    render_configs.main(["--no-bytecode-cache", *args])
+
+
+def _output(workspace: Path, name: str) -> Path:
+    return workspace / "factory" / "rendered_configs" / name
+
+
+def _modified(workspace: Path):
+    return {
+        path: path.stat().st_mtime_ns
+        for path in (workspace / "factory" / "rendered_configs").rglob("*")
+    }
+
+
+def test_render(workspace):
+    _render()
+
+    assert yaml.safe_load(_output(workspace, "finance/report.yaml").read_text()) == {
+        "dag_id": "report",
+        "description": "select 1",
+        "tasks": [{"id": "a"}],
+    }
+    index = DagIndex.load(workspace / "factory" / "rendered_configs")
+    assert index.config_for(_output(workspace, "marketing/campaign.yaml")) == {
+        "dag_id": "campaign",
+        "description": "campaign",
+        "tasks": [{"id": "a"}],
+    }
+
+
+def test_incremental_skips_unchanged_configs(workspace, caplog):
+    _render()
+    modified = _modified(workspace)
+    caplog.set_level("INFO")
+
+    _render("--incremental")
+
+    assert "Skipped 2 unchanged config(s)" in caplog.text
+    assert _modified(workspace) == modified
+
+
+@pytest.mark.parametrize(
+    "changed, old, new, output",
+    [
+        (
+            "dag_configs/marketing/campaign.yaml",
+            "description: campaign",
+            "description: changed",
+            "marketing/campaign.yaml",
+        ),
+        (
+            "work/templates/tasks/gcs_to_bq.j2",
+            "# ",
+            "# changed ",
+            "finance/report.yaml",
+        ),
+        # read by the report's !read constructor:
+        ("dag_configs/finance/report.sql", "1", "'changed'", "finance/report.yaml"),
+    ],
+)
+def test_incremental_renders_what_changed(workspace, caplog, changed, old, new, output):
+    _render()
+    path = workspace / changed
+    path.write_text(path.read_text().replace(old, new))
+    caplog.set_level("INFO")
+
+    _render("--incremental")
+
+    assert "Skipped 1 unchanged config(s)" in caplog.text
+    assert "changed" in _output(workspace, output).read_text()
+
+
+def test_incremental_prunes_removed_configs(workspace):
+    _render()
+    (workspace / "dag_configs" / "marketing" / "campaign.yaml").unlink()
+    (workspace / "dag_configs" / "finance" / "report.yaml").write_text(
+        "dag_id: report2\ndescription: x\ntasks: [{id: a, type: Bash}]"
+    )
+
+    _render("--incremental")
+
+    assert not _output(workspace, "marketing/campaign.yaml").exists()
+    assert not _output(workspace, "finance/report.yaml").exists()
+    assert _output(workspace, "finance/report2.yaml").exists()
+
+
+def test_changed_files_prunes_removed_configs(workspace):
+    _render()
+    (workspace / "dag_configs" / "marketing" / "campaign.yaml").unlink()
+    changed = workspace / "changed.txt"
+    changed.write_text("dag_configs/marketing/campaign.yaml\n")
+
+    _render("--changed-files", str(changed))
+
+    assert not _output(workspace, "marketing/campaign.yaml").exists()
+    assert _output(workspace, "finance/report.yaml").exists()
@@ -0,0 +1,149 @@
+from pathlib import Path
+
+import file_reads
+import pytest
+from render_manifest import RenderManifest
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    for path, text in {
+        "dag_configs/report.yaml": "dag_id: report",
+        "dag_configs/report.sql": "select 1",
+        "dag_configs/campaign.yaml": "dag_id: campaign",
+        "templates/base.j2": "{{ dag_id }}",
+        "templates/tasks/Bash.j2": "bash",
+        "templates/tasks/gcs_to_bq.j2": "gcs",
+        "rendered_configs/report.yaml": "",
+        "rendered_configs/campaign.yaml": "",
+    }.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(text)
+    return tmp_path
+
+
+def _manifest(repo: Path) -> RenderManifest:
+    def _template_source(name):
+        path = repo / "templates" / name
+        return path.read_text() if path.exists() else None
+
+    return RenderManifest.load(
+        repo / "rendered_configs" / ".render_manifest.json",
+        repo / "dag_configs",
+        repo / "rendered_configs",
+        "constructors",
+        _template_source,
+    )
+
+
+def _render(repo: Path, manifest: RenderManifest, *names: str):
+    """Records a render of the given configs, as render_configs.py would."""
+    for name in names:
+        yaml_file = repo / "dag_configs" / f"{name}.yaml"
+        if name == "report":
+            templates = {"base.j2", "tasks/gcs_to_bq.j2"}
+            files = [str(repo / "dag_configs" / "report.sql")]
+        else:
+            templates, files = {"base.j2", "tasks/Bash.j2"}, []
+        manifest.record(
+            yaml_file,
+            manifest.digest(yaml_file),
+            [repo / "rendered_configs" / f"{name}.yaml"],
+            templates,
+            files,
+        )
+    manifest.save()
+
+
+def _current(repo: Path, name: str) -> bool:
+    manifest = _manifest(repo)
+    yaml_file = repo / "dag_configs" / f"{name}.yaml"
+    return manifest.is_current(yaml_file, manifest.digest(yaml_file))
+
+
+def test_unchanged(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+
+    assert _current(repo, "report")
+    assert _current(repo, "campaign")
+
+
+def test_changed_config(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+    (repo / "dag_configs" / "report.yaml").write_text("dag_id: report2")
+
+    assert not _current(repo, "report")
+    assert _current(repo, "campaign")
+
+
+def test_changed_template(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+    (repo / "templates" / "tasks" / "Bash.j2").write_text("bash2")
+
+    assert _current(repo, "report")
+    assert not _current(repo, "campaign")
+
+
+def test_deleted_template(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+    (repo / "templates" / "tasks" / "gcs_to_bq.j2").unlink()
+
+    assert not _current(repo, "report")
+
+
+def test_changed_file_read_by_constructor(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+    (repo / "dag_configs" / "report.sql").write_text("select 2")
+
+    assert not _current(repo, "report")
+    assert _current(repo, "campaign")
+
+
+def test_missing_output(repo):
+    _render(repo, _manifest(repo), "report")
+    (repo / "rendered_configs" / "report.yaml").unlink()
+
+    assert not _current(repo, "report")
+
+
+def test_failed_render(repo):
+    _render(repo, _manifest(repo), "report")
+    manifest = _manifest(repo)
+    manifest.record(repo / "dag_configs" / "report.yaml", None, [])
+    manifest.save()
+
+    assert not _current(repo, "report")
+    # what it rendered last time is still tracked, so it can be pruned:
+    assert _manifest(repo).previous_sources()[
+        repo / "dag_configs" / "report.yaml"
+    ].outputs == [repo / "rendered_configs" / "report.yaml"]
+
+
+def test_prune(repo):
+    _render(repo, _manifest(repo), "report", "campaign")
+    manifest = _manifest(repo)
+    _render(repo, manifest, "campaign")
+
+    assert manifest.prune() == [repo / "rendered_configs" / "report.yaml"]
+    assert (repo / "rendered_configs" / "campaign.yaml").exists()
+
+
+def test_file_reads(tmp_path):
+    path = tmp_path / "query.sql"
+    path.write_text("select 1")
+
+    with file_reads.recording() as files:
+        path.read_text()
+        (tmp_path / "written.txt").write_text("")
+
+    assert files == {str(path)}
+
+
+def test_unchanged_manifest_is_left_alone(repo):
+    _render(repo, _manifest(repo), "report")
+    path = repo / "rendered_configs" / ".render_manifest.json"
+    modified = path.stat().st_mtime_ns
+
+    _render(repo, _manifest(repo), "report")
+
+    assert path.stat().st_mtime_ns == modified
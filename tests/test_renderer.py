@@ -0,0 +1,86 @@
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+from config_tree import ConfigTree
+from renderer import RenderContext, SourceState, plan_jobs, render_jobs
+
+BASE_TEMPLATE = """\
+dag_id: {{ dag_id }}
+schedule: {{ schedule }}
+tasks:
+{% for task in tasks %}
+  - id: {{ task.id }}
+{% endfor %}
+"""
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch) -> Path:
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "base.j2").write_text(BASE_TEMPLATE)
+    (tmp_path / "dag_configs" / "finance").mkdir(parents=True)
+    # templates are looked up relative to where the renderer runs:
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _write(workspace: Path, name: str, text: str) -> Path:
+    path = workspace / "dag_configs" / "finance" / name
+    path.write_text(text)
+    return path
+
+
+def _render(
+    workspace: Path, claimed: Optional[Dict[Path, Path]] = None
+) -> Dict[Path, SourceState]:
+    """Renders every config, as render_configs.py would."""
+    configs = ConfigTree(workspace / "dag_configs", workspace / "rendered_configs")
+    context = RenderContext(configs)
+    sources: Dict[Path, SourceState] = {}
+    jobs = []
+    for yaml_file in configs.scan():
+        sources[yaml_file] = ("", [], [False], set(), set())
+        jobs.extend(plan_jobs(context, yaml_file, yaml_file.read_text()))
+    render_jobs(context, jobs, sources, {}, claimed=claimed)
+    return sources
+
+
+def test_render(workspace):
+    yaml_file = _write(workspace, "report.yaml", "dag_id: report\ntasks: [id: a]")
+
+    sources = _render(workspace)
+
+    output = workspace / "rendered_configs" / "finance" / "report.yaml"
+    assert sources[yaml_file][1] == [output]
+    assert not sources[yaml_file][2][0]
+    assert sources[yaml_file][3] == {"base.j2"}
+    assert "- id: a" in output.read_text()
+
+
+def test_duplicate_outputs(workspace):
+    first = _write(
+        workspace, "a.yaml", "dag_id: report\nschedule: first\ntasks: [id: a]"
+    )
+    second = _write(
+        workspace, "b.yaml", "dag_id: report\nschedule: second\ntasks: [id: a]"
+    )
+
+    sources = _render(workspace)
+
+    output = workspace / "rendered_configs" / "finance" / "report.yaml"
+    assert sources[first][1] == [output]
+    assert not sources[first][2][0]
+    assert sources[second][1] == []
+    assert sources[second][2][0]
+    assert "schedule: first" in output.read_text()
+
+
+def test_outputs_claimed_by_other_sources(workspace):
+    yaml_file = _write(workspace, "report.yaml", "dag_id: report\ntasks: [id: a]")
+    output = workspace / "rendered_configs" / "finance" / "report.yaml"
+
+    sources = _render(workspace, {output: workspace / "dag_configs" / "other.yaml"})
+
+    assert sources[yaml_file][2][0]
+    assert not output.exists()
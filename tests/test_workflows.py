@@ -0,0 +1,101 @@
+import datetime
+
+import pytest
+import workflows
+from workflows import WorkflowCache, expand_workflow
+
+
+def _workflow(x, **task):
+    return {
+        "workflow_description": "load tables",
+        "value_set": [{"x": x}],
+        "task_set": [{"id": "load_${value_set.x}", **task}],
+    }
+
+
+def test_expand_workflow():
+    workflow = {
+        "workflow_description": "load tables",
+        "value_set": [{"table": "a"}, {"table": "b"}],
+        "task_set": [{"id": "load_${value_set.table}"}, {"id": "check"}],
+    }
+
+    assert expand_workflow(workflow) == [
+        {"id": "load_a"},
+        {"id": "check"},
+        {"id": "load_b"},
+        {"id": "check"},
+    ]
+
+
+def test_expand_tasks():
+    tasks = [{"id": "first"}, _workflow("a"), {"id": "last"}]
+
+    assert WorkflowCache().expand_tasks(tasks) == [
+        {"id": "first"},
+        {"id": "load_a"},
+        {"id": "last"},
+    ]
+
+
+def test_cached_expansions_are_copies():
+    cache = WorkflowCache()
+    cache.expand(_workflow("a"))[0]["id"] = "changed"
+
+    assert cache.expand(_workflow("a")) == [{"id": "load_a"}]
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ({1: "a"}, {"1": "a"}),
+        (1, "1"),
+        (1, True),
+        (0.0, -0.0),
+        ([1], ["1"]),
+        (datetime.date(2024, 1, 1), "2024-01-01"),
+        (
+            datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+            datetime.datetime(
+                2024, 1, 1, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=1))
+            ),
+        ),
+    ],
+)
+def test_workflows_that_only_look_alike(first, second):
+    cache = WorkflowCache()
+
+    assert cache.expand(_workflow("a", params=first)) == [
+        {"id": "load_a", "params": first}
+    ]
+    expanded = cache.expand(_workflow("a", params=second))
+    assert repr(expanded) == repr([{"id": "load_a", "params": second}])
+
+
+def test_uncacheable_values():
+    class Custom:
+        pass
+
+    custom = Custom()
+    cache = WorkflowCache()
+
+    assert cache.expand(_workflow("a", params=custom)) == [
+        {"id": "load_a", "params": custom}
+    ]
+    assert not cache._expanded
+
+
+def test_cache_is_bounded(monkeypatch):
+    expanded = []
+    monkeypatch.setattr(workflows, "CACHED_WORKFLOWS", 2)
+    monkeypatch.setattr(
+        workflows,
+        "expand_workflow",
+        lambda task_spec: expanded.append(task_spec["value_set"][0]["x"]) or [],
+    )
+    cache = WorkflowCache()
+    for x in "abacab":
+        cache.expand(_workflow(x))
+
+    # "b" was the least recently used when "c" came along, then "c" was:
+    assert expanded == ["a", "b", "c", "b"]